@@ -0,0 +1,139 @@
+"""
+Polygon Mapper - Front-End Assets
+Vendored Leaflet libraries, served from content-hashed URLs with
+precompressed variants
+"""
+
+import hashlib
+import mimetypes
+import os
+import sys
+import threading
+
+from compression import ENCODINGS, compress_chunks
+
+CDN = 'https://unpkg.com'
+
+# Pinned libraries used by the page: name -> (npm package, files under dist/)
+LIBRARIES = {
+    'leaflet': ('leaflet@1.9.4', (
+        'leaflet.css', 'leaflet.js', 'images/layers.png', 'images/layers-2x.png',
+        'images/marker-icon.png', 'images/marker-icon-2x.png', 'images/marker-shadow.png')),
+    'leaflet-draw': ('leaflet-draw@1.0.4', (
+        'leaflet.draw.css', 'leaflet.draw.js', 'images/layers.png', 'images/layers-2x.png',
+        'images/marker-icon.png', 'images/marker-icon-2x.png', 'images/marker-shadow.png',
+        'images/spritesheet.png', 'images/spritesheet-2x.png', 'images/spritesheet.svg')),
+    'leaflet-freedraw': ('leaflet-freedraw@2.15.0', (
+        'leaflet-freedraw.css', 'leaflet-freedraw.web.js')),
+    'leaflet.vectorgrid': ('leaflet.vectorgrid@1.3.0', (
+        'Leaflet.VectorGrid.bundled.js',)),
+}
+
+# File suffixes of precompressed variants written by vendor_assets.py
+VARIANT_SUFFIXES = {'br': '.br', 'zstd': '.zst', 'gzip': '.gz'}
+COMPRESSIBLE = ('.css', '.js', '.svg')
+
+# Hashed URLs never change content, so clients may keep them for a year
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def vendor_dir():
+    """Return the folder holding the vendored libraries, inside the bundle when frozen"""
+    base = getattr(sys, '_MEIPASS', None) or os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base, 'static', 'vendor')
+
+
+class Library:
+    """
+    The files of one vendored library, read into memory.
+
+    All files share one URL prefix holding a hash of their combined
+    content, so relative references between them (stylesheet images,
+    Leaflet's icon path detection) keep working and any change to the
+    library changes every URL.
+    """
+
+    def __init__(self, name, root, files):
+        self.name = name
+        self.root = root
+        self.files = {}
+        self.precompressed = {}
+        digest = hashlib.sha256()
+        for path in sorted(files):
+            with open(os.path.join(root, path), 'rb') as f:
+                data = f.read()
+            self.files[path] = data
+            self.precompressed[path] = [
+                e for e, suffix in VARIANT_SUFFIXES.items()
+                if os.path.isfile(os.path.join(root, path + suffix))]
+            digest.update(path.encode('utf-8') + b'\0' + data + b'\0')
+        self.digest = digest.hexdigest()[:16]
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def url(self, path):
+        return f'/assets/{self.name}/{self.digest}/{path}'
+
+    def body(self, path, accept_encodings):
+        """Return (data, content coding or None) for the best variant a client accepts
+
+        Variants precompressed on disk are preferred; other text files are
+        compressed in memory once per coding.
+        """
+        on_disk = self.precompressed[path]
+        offered = on_disk
+        if path.endswith(COMPRESSIBLE):
+            offered = on_disk + [e for e in ENCODINGS if e not in on_disk]
+        encoding = accept_encodings.best_match(offered) if offered else None
+        if not encoding:
+            return self.files[path], None
+
+        key = (path, encoding)
+        data = self._variants.get(key)
+        if data is None:
+            with self._lock:
+                data = self._variants.get(key)
+                if data is None:
+                    if encoding in on_disk:
+                        with open(os.path.join(self.root, path + VARIANT_SUFFIXES[encoding]),
+                                  'rb') as f:
+                            data = f.read()
+                    else:
+                        data = compress_chunks([self.files[path]], encoding)
+                    self._variants[key] = data
+        return data, encoding
+
+
+def mimetype(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+_libraries = None
+_libraries_lock = threading.Lock()
+
+
+def libraries():
+    """Return the vendored libraries whose files are all present, loading them once"""
+    global _libraries
+    if _libraries is None:
+        with _libraries_lock:
+            if _libraries is None:
+                found = {}
+                for name, (_, files) in LIBRARIES.items():
+                    root = os.path.join(vendor_dir(), name)
+                    if all(os.path.isfile(os.path.join(root, p)) for p in files):
+                        found[name] = Library(name, root, files)
+                _libraries = found
+    return _libraries
+
+
+def get_library(name):
+    return libraries().get(name)
+
+
+def asset_url(name, path):
+    """Return the URL of a library file: hashed and local if vendored, else the CDN"""
+    library = get_library(name)
+    if library is not None:
+        return library.url(path)
+    return f'{CDN}/{LIBRARIES[name][0]}/dist/{path}'
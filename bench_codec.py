@@ -0,0 +1,87 @@
+"""
+Polygon Mapper - JSON Codec Benchmark
+Compare the standard library with the active codec backend on freehand-style payloads
+
+Run: python bench_codec.py [--features N] [--vertices N]
+"""
+
+import argparse
+import json
+import math
+import random
+import time
+
+import numpy as np
+
+import json_codec
+
+
+def freehand_feature(i, vertices, rng):
+    """A wobbly closed ring like the ones traced with the freehand tool"""
+    cx = rng.uniform(-170, 170)
+    cy = rng.uniform(-70, 70)
+    ring = []
+    for k in range(vertices):
+        angle = 2 * math.pi * k / vertices
+        radius = 0.05 * (1 + 0.2 * math.sin(7 * angle) + rng.uniform(-0.02, 0.02))
+        ring.append([round(cx + radius * math.cos(angle), 7), round(cy + radius * math.sin(angle), 7)])
+    ring.append(ring[0])
+    return {
+        'type': 'Feature',
+        'id': i + 1,
+        'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+        'properties': {'name': f'Area {i}', 'drawn_at': '2024-05-01T12:00:00Z', 'tags': ['survey']},
+    }
+
+
+def best_of(function, repeat=5):
+    """Return the fastest of several timed runs, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--features', type=int, default=2000)
+    parser.add_argument('--vertices', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    features = [freehand_feature(i, args.vertices, rng) for i in range(args.features)]
+    collection = {'type': 'FeatureCollection', 'features': features}
+    body = json.dumps(collection).encode('utf-8')
+    arrays = [dict(f, geometry={'type': 'Polygon',
+                                'coordinates': [np.asarray(r) for r in f['geometry']['coordinates']]})
+              for f in features]
+
+    cases = [
+        ('parse request body',
+         lambda: json.loads(body),
+         lambda: json_codec.loads(body)),
+        ('encode response',
+         lambda: json.dumps(collection, separators=(',', ':')).encode('utf-8'),
+         lambda: json_codec.dumps(collection)),
+        ('encode pretty export',
+         lambda: json.dumps(collection, indent=2).encode('utf-8'),
+         lambda: json_codec.dumps(collection, pretty=True)),
+        ('encode NumPy coordinates',
+         lambda: json.dumps({'features': arrays}, separators=(',', ':'),
+                            default=json_codec.numpy_default).encode('utf-8'),
+         lambda: json_codec.dumps({'features': arrays})),
+    ]
+
+    print(f'{args.features} features x {args.vertices + 1} vertices, '
+          f'{len(body) / 1e6:.1f} MB of JSON, backend: {json_codec.BACKEND}')
+    print(f'{"case":<26}{"stdlib":>10}{"codec":>10}{"speedup":>10}')
+    for name, stdlib, codec in cases:
+        baseline = best_of(stdlib)
+        fast = best_of(codec)
+        print(f'{name:<26}{baseline * 1000:>8.1f}ms{fast * 1000:>8.1f}ms{baseline / fast:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""
+Polygon Mapper - Server Benchmark
+Drive the app with synthetic drawings, in-process and over loopback HTTP,
+and report throughput, latency percentiles and memory per endpoint
+
+Run: python bench_server.py [--features N] [--vertices N] [--output results.json]
+     python bench_server.py --trace-memory     (per-case allocation peaks, slower)
+     python bench_server.py --compare baseline.json results.json
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import geoparquet
+from bench_codec import freehand_feature
+from json_codec import BACKEND
+
+EXPORT_FORMATS = ('geojson', 'geojsonseq', 'topojson', 'fgb', 'parquet')
+
+
+def regular_feature(i, vertices, rng):
+    """A regular polygon, like the ones from the circle and polygon tools"""
+    cx = rng.uniform(-170, 170)
+    cy = rng.uniform(-70, 70)
+    ring = [[cx + 0.05 * math.cos(2 * math.pi * k / vertices),
+             cy + 0.05 * math.sin(2 * math.pi * k / vertices)] for k in range(vertices)]
+    ring.append(ring[0])
+    return {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            'properties': {'name': f'Area {i}'}}
+
+
+SHAPES = {'freehand': freehand_feature, 'regular': regular_feature}
+
+
+def process_peak_rss_mb():
+    """Peak resident memory of this process so far, in MB (None where unsupported)
+
+    The peak only ever grows, so it also covers every case run earlier.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class InProcessClient:
+    """Send requests straight to the WSGI app through Flask's test client"""
+
+    name = 'inprocess'
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, data=body, headers=headers or {})
+        return response.status_code, len(response.get_data())
+
+    def close(self):
+        pass
+
+
+class HttpClient:
+    """Send requests over a keep-alive loopback connection to a server thread"""
+
+    name = 'http'
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class KeepAliveHandler(WSGIRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True,
+                                  request_handler=KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+
+    def request(self, method, path, body=None, headers=None):
+        self.connection.request(method, path, body=body, headers=headers or {})
+        response = self.connection.getresponse()
+        return response.status, len(response.read())
+
+    def close(self):
+        self.connection.close()
+        self.server.shutdown()
+
+
+def summarize(endpoint, client, latencies, sizes, elapsed, peak_alloc_mb=None, **extra):
+    """Build the result record of one benchmark case"""
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'endpoint': endpoint,
+        'transport': client.name,
+        'requests': len(latencies),
+        'seconds': round(elapsed, 6),
+        'throughput_rps': round(len(latencies) / elapsed, 3) if elapsed else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'max_ms': round(float(latencies.max()), 3),
+        'response_bytes': int(np.mean(sizes)),
+        'peak_alloc_mb': peak_alloc_mb,
+        'process_peak_rss_mb': process_peak_rss_mb(),
+        **extra,
+    }
+
+
+def measure(endpoint, client, requests, before=None, **extra):
+    """Time a list of (method, path, body, headers) requests sent one after another
+
+    before() runs ahead of every request and is not timed. While
+    tracemalloc is tracing, the peak memory allocated during this case
+    alone is recorded as peak_alloc_mb.
+    """
+    traced = tracemalloc.is_tracing()
+    if traced:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    latencies = []
+    sizes = []
+    total = 0.0
+    for method, path, body, headers in requests:
+        if before:
+            before()
+        start = time.perf_counter()
+        status, size = client.request(method, path, body, headers)
+        latency = time.perf_counter() - start
+        if status >= 400:
+            raise RuntimeError(f'{method} {path} failed with HTTP {status}')
+        latencies.append(latency)
+        sizes.append(size)
+        total += latency
+    peak_alloc_mb = None
+    if traced:
+        peak_alloc_mb = round((tracemalloc.get_traced_memory()[1] - base) / (1024 * 1024), 3)
+    return summarize(endpoint, client, latencies, sizes, total, peak_alloc_mb, **extra)
+
+
+def run_suite(pm, client, features, args, rng):
+    """Run every benchmark case against one transport and return the results"""
+    json_headers = {'Content-Type': 'application/json'}
+    identity = {'Accept-Encoding': args.encoding}
+    repeat = args.repeat
+
+    def clear_caches():
+        pm.serialized_cache.clear()
+        pm.compressed_cache.clear()
+        pm.tile_cache.invalidate()
+
+    pm.store.clear()
+    results = []
+    singles = features[:args.singles]
+    rest = features[args.singles:]
+    results.append(measure('add_polygon', client, [
+        ('POST', '/api/polygons', json.dumps(f), json_headers) for f in singles]))
+    batches = [rest[i:i + args.batch_size] for i in range(0, len(rest), args.batch_size)]
+    if batches:
+        results.append(measure('add_polygons_batch', client, [
+            ('POST', '/api/polygons/batch',
+             json.dumps({'type': 'FeatureCollection', 'features': batch}), json_headers)
+            for batch in batches], features_per_request=args.batch_size))
+
+    results.append(measure('index', client, [('GET', '/', None, identity)] * repeat))
+
+    listing = [('GET', '/api/polygons', None, identity)] * repeat
+    results.append(measure('get_polygons', client, listing, before=clear_caches, cache='cold'))
+    results.append(measure('get_polygons', client, listing, cache='warm'))
+
+    def viewport():
+        x = rng.uniform(-170, 150)
+        y = rng.uniform(-70, 50)
+        return f'/api/polygons?bbox={x},{y},{x + 20},{y + 20}'
+    results.append(measure('get_polygons', client, [
+        ('GET', viewport(), None, identity) for _ in range(repeat)], query='bbox'))
+
+    results.append(measure('get_polygon_stats', client, [
+        ('GET', '/api/polygons/stats', None, identity)] * repeat, before=clear_caches))
+
+    points = np.column_stack((np.random.default_rng(args.seed).uniform(-180, 180, args.points),
+                              np.random.default_rng(args.seed + 1).uniform(-85, 85, args.points)))
+    results.append(measure('locate_points', client, [
+        ('POST', '/api/contains', points.astype('<f8').tobytes(),
+         {'Content-Type': 'application/octet-stream'})] * max(1, repeat // 4),
+        points_per_request=args.points))
+
+    formats = [f for f in args.formats if f != 'parquet' or geoparquet.available()]
+    for fmt in formats:
+        export = [('GET', f'/api/export?format={fmt}&save=0', None, identity)] * args.export_repeat
+        results.append(measure('export_geojson', client, export, before=clear_caches,
+                               format=fmt, cache='cold'))
+        results.append(measure('export_geojson', client, export, format=fmt, cache='warm'))
+
+    tiles = []
+    for _ in range(repeat):
+        x, y = rng.randrange(16), rng.randrange(16)
+        tiles.append(('GET', f'/tiles/4/{x}/{y}.pbf', None, identity))
+    results.append(measure('get_tile', client, tiles, before=clear_caches, zoom=4))
+
+    results.append(measure('clear_polygons', client, [('DELETE', '/api/polygons', None, {})]))
+    return results
+
+
+def compare(baseline_path, current_path):
+    """Print how the cases of one result file changed relative to another"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(current_path, encoding='utf-8') as f:
+        current = json.load(f)
+
+    def key(result):
+        return tuple(sorted((k, v) for k, v in result.items()
+                            if isinstance(v, str) or k.endswith('_per_request') or k == 'zoom'))
+
+    before = {key(r): r for r in baseline['results']}
+    print(f'{"case":<58}{"p50 ms":>18}{"p99 ms":>18}')
+    for result in current['results']:
+        old = before.get(key(result))
+        label = ' '.join([result['endpoint'], result['transport']] + [
+            str(v) for k, v in key(result) if isinstance(v, str) and k not in ('endpoint', 'transport')])
+        if old is None:
+            print(f'{label:<58}{"new":>18}')
+            continue
+        cells = []
+        for field in ('p50_ms', 'p99_ms'):
+            ratio = result[field] / old[field] if old[field] else float('inf')
+            cells.append(f'{result[field]:.1f} ({ratio:.2f}x)')
+        print(f'{label:<58}{cells[0]:>18}{cells[1]:>18}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--features', type=int, default=2000, help='polygons to ingest')
+    parser.add_argument('--vertices', type=int, default=200, help='vertices per polygon')
+    parser.add_argument('--shape', choices=SHAPES, default='freehand')
+    parser.add_argument('--singles', type=int, default=200,
+                        help='polygons posted one at a time before the batches')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20, help='requests per read case')
+    parser.add_argument('--export-repeat', type=int, default=3, help='requests per export case')
+    parser.add_argument('--points', type=int, default=100000, help='points per containment query')
+    parser.add_argument('--formats', nargs='+', default=list(EXPORT_FORMATS), choices=EXPORT_FORMATS)
+    parser.add_argument('--encoding', default='identity',
+                        help='Accept-Encoding sent with read requests')
+    parser.add_argument('--transport', choices=('inprocess', 'http', 'both'), default='both')
+    parser.add_argument('--store', default=':memory:',
+                        help='store path to benchmark (default: in memory)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='record the peak allocations of each case with tracemalloc '
+                             '(slows every request, so compare timings only between traced runs)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # The app opens its store on import
+    os.environ['POLYGON_MAPPER_STORE'] = args.store
+    import polygon_mapper as pm
+
+    rng = random.Random(args.seed)
+    make = SHAPES[args.shape]
+    features = [make(i, args.vertices, rng) for i in range(args.features)]
+    for feature in features:
+        feature.pop('id', None)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    transports = ('inprocess', 'http') if args.transport == 'both' else (args.transport,)
+    results = []
+    for transport in transports:
+        client = (InProcessClient if transport == 'inprocess' else HttpClient)(pm.app)
+        try:
+            results.extend(run_suite(pm, client, features, args, rng))
+        finally:
+            client.close()
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'json_backend': BACKEND,
+            'options': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        },
+        'results': results,
+    }
+
+    print(f'{args.features} {args.shape} polygons x {args.vertices} vertices, store {args.store}')
+    print(f'{"endpoint":<20}{"transport":<11}{"case":<18}{"req/s":>10}{"p50 ms":>10}'
+          f'{"p99 ms":>10}{"alloc MB":>10}{"proc MB":>9}')
+    for r in results:
+        case = ' '.join(str(r[k]) for k in ('format', 'cache', 'query') if k in r)
+        alloc = f'{r["peak_alloc_mb"]:.1f}' if r['peak_alloc_mb'] is not None else '-'
+        rss = f'{r["process_peak_rss_mb"]:.0f}' if r['process_peak_rss_mb'] is not None else '-'
+        print(f'{r["endpoint"]:<20}{r["transport"]:<11}{case:<18}{r["throughput_rps"]:>10.1f}'
+              f'{r["p50_ms"]:>10.2f}{r["p99_ms"]:>10.2f}{alloc:>10}{rss:>9}')
+    print('alloc MB: peak allocated during the case (--trace-memory); '
+          'proc MB: peak resident size of the process so far, across all cases')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nResults written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
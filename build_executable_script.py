@@ -23,17 +23,13 @@ def build_executable():
         "--onefile",                    # Single executable file
         "--windowed",                   # No console window (comment out if you want to see logs)
         "--name=PolygonMapper",         # Name of the executable
-        "--add-data=templates:templates",  # Include templates folder
+        f"--add-data=static/vendor{os.pathsep}static/vendor",  # Leaflet libraries
         "--hidden-import=flask",
         "--hidden-import=werkzeug",
         "--collect-all=flask",
         "polygon_mapper.py"
     ]
     
-    # Adjust add-data syntax for Windows
-    if sys.platform == "win32":
-        cmd[4] = "--add-data=templates;templates"
-    
     try:
         subprocess.check_call(cmd)
         print("\n" + "="*60)
@@ -72,12 +68,11 @@ def main():
         print("   Make sure you're running this script in the same directory")
         sys.exit(1)
     
-    # Check if templates directory exists
-    if not os.path.exists("templates"):
-        print("⚠️  Warning: templates directory not found")
-        print("   It will be created when you run polygon_mapper.py first")
-        print("\n   Running polygon_mapper.py once to create templates...")
-        subprocess.check_call([sys.executable, "polygon_mapper.py"])
+    # Bundle the front-end libraries so the app works without internet
+    if not os.path.exists(os.path.join("static", "vendor")):
+        print("📦 Downloading front-end libraries into static/vendor...")
+        subprocess.check_call([sys.executable, "vendor_assets.py"])
+        print()
     
     # Install PyInstaller
     try:
@@ -0,0 +1,475 @@
+"""
+Polygon Mapper - Columnar Feature Storage
+Keeps geometries in contiguous NumPy buffers (GeoArrow-style offsets)
+and properties in a separate table, building GeoJSON only when asked
+"""
+
+import numpy as np
+
+import metrics
+from geometry import geometry_bbox
+
+# Geometry type codes; RAW geometries are kept as GeoJSON dicts (null
+# geometries, GeometryCollections and positions with more than 2 values)
+RAW = 0
+POINT = 1
+LINESTRING = 2
+POLYGON = 3
+MULTIPOINT = 4
+MULTILINESTRING = 5
+MULTIPOLYGON = 6
+
+TYPE_NAMES = {
+    POINT: 'Point', LINESTRING: 'LineString', POLYGON: 'Polygon',
+    MULTIPOINT: 'MultiPoint', MULTILINESTRING: 'MultiLineString',
+    MULTIPOLYGON: 'MultiPolygon',
+}
+
+FEATURE_MEMBERS = ('type', 'id', 'geometry', 'properties')
+
+# Properties added to exported features when metrics are requested
+METRIC_PROPERTIES = (('area_m2', metrics.AREA), ('perimeter_m', metrics.PERIMETER),
+                     ('centroid_lng', metrics.CENTROID_X), ('centroid_lat', metrics.CENTROID_Y))
+
+
+def _parts(geometry):
+    """Return (type code, parts) where each part is a list of rings of positions"""
+    if not isinstance(geometry, dict):
+        return RAW, None
+    kind = geometry.get('type')
+    coordinates = geometry.get('coordinates')
+    if not isinstance(coordinates, list):
+        return RAW, None
+    if kind == 'Polygon':
+        return POLYGON, [coordinates]
+    if kind == 'MultiPolygon':
+        return MULTIPOLYGON, coordinates
+    if kind == 'LineString':
+        return LINESTRING, [[coordinates]]
+    if kind == 'MultiLineString':
+        return MULTILINESTRING, [[line] for line in coordinates]
+    if kind == 'Point':
+        return POINT, [[[coordinates]]]
+    if kind == 'MultiPoint':
+        return MULTIPOINT, [[[point]] for point in coordinates]
+    return RAW, None
+
+
+def _flatten(parts):
+    """Return (positions, ring lengths, part lengths) for nested parts"""
+    positions = []
+    ring_lengths = []
+    part_lengths = []
+    for part in parts:
+        part_lengths.append(len(part))
+        for ring in part:
+            ring_lengths.append(len(ring))
+            positions.extend(ring)
+    return positions, ring_lengths, part_lengths
+
+
+def _ring_edges(coords, rings, part_starts):
+    """Return (starts, ends, part_starts) for consecutive rings of coords
+
+    Ring i spans coords[rings[i]:rings[i + 1]] and part_starts holds the
+    coords index of each polygon's first position; see
+    FeatureColumns.polygon_edges.
+    """
+    start, end = int(rings[0]), int(rings[-1])
+    following = np.arange(start + 1, end + 1)
+    filled = rings[1:] > rings[:-1]
+    following[rings[1:][filled] - 1 - start] = rings[:-1][filled]
+    return coords[start:end], coords[following], part_starts - start
+
+
+def _raw_polygon_edges(geometry):
+    """Return polygon_edges for a GeoJSON geometry, dropping any altitude"""
+    code, parts = _parts(geometry)
+    if code not in (POLYGON, MULTIPOLYGON):
+        return None
+    positions, ring_lengths, part_lengths = _flatten(parts)
+    coords = np.array([position[:2] for position in positions], dtype=np.float64).reshape(-1, 2)
+    rings = np.concatenate(([0], np.cumsum(ring_lengths, dtype=np.int64)))
+    part_starts = rings[np.cumsum([0] + part_lengths[:-1], dtype=np.int64)]
+    return _ring_edges(coords, rings, part_starts)
+
+
+def _grow(array, needed):
+    """Return array, or a larger copy of it if it cannot hold needed rows"""
+    if needed <= len(array):
+        return array
+    grown = np.empty((max(needed, 2 * len(array), 16),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class FeatureColumns:
+    """
+    Append-only columns holding one row per stored feature version.
+
+    Row r's geometry spans parts row_offsets[r]:row_offsets[r + 1], part p
+    spans rings part_offsets[p]:part_offsets[p + 1] and ring i spans
+    coords[ring_offsets[i]:ring_offsets[i + 1]]. Rows are never modified
+    after they are written, so readers can keep using them while new rows
+    are appended. Each row's area, perimeter, centroid and bounding box
+    are computed as it is written and kept in metrics (see metrics.py).
+    """
+
+    def __init__(self):
+        self.coords = np.empty((0, 2), dtype=np.float64)
+        self.ring_offsets = np.zeros(1, dtype=np.int64)
+        self.part_offsets = np.zeros(1, dtype=np.int64)
+        self.row_offsets = np.zeros(1, dtype=np.int64)
+        self.types = np.empty(0, dtype=np.uint8)
+        self.metrics = np.empty((0, metrics.COLUMNS), dtype=np.float64)
+        self.coord_count = 0
+        self.ring_count = 0
+        self.part_count = 0
+        self.row_count = 0
+        self.properties = []
+        self.extras = {}
+        self.raw = {}
+
+    @property
+    def nbytes(self):
+        """Bytes used by the numeric buffers"""
+        return sum(a.nbytes for a in (self.coords, self.ring_offsets, self.part_offsets,
+                                      self.row_offsets, self.types, self.metrics))
+
+    def append(self, features):
+        """Append features and return their row numbers"""
+        codes = []
+        positions = []
+        ring_lengths = []
+        part_lengths = []
+        row_lengths = []
+        for feature in features:
+            code, parts = _parts(feature.get('geometry'))
+            if code != RAW:
+                try:
+                    flat = _flatten(parts)
+                except TypeError:
+                    code = RAW
+            codes.append(code)
+            if code == RAW:
+                row_lengths.append(0)
+                continue
+            row_lengths.append(len(parts))
+            positions.extend(flat[0])
+            ring_lengths.extend(flat[1])
+            part_lengths.extend(flat[2])
+
+        try:
+            points = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+            if len(points) != len(positions):
+                raise ValueError('positions must have exactly two values')
+        except (ValueError, TypeError):
+            if len(features) == 1:
+                return self._append_raw(features[0])
+            # Find the geometries that do not fit, one feature at a time
+            return [row for feature in features for row in self.append([feature])]
+
+        # Measure raw geometries first, so a malformed one fails the whole
+        # append before any buffer or counter has changed
+        raw = {offset: self._measure_raw(feature.get('geometry'))
+               for offset, (code, feature) in enumerate(zip(codes, features)) if code == RAW}
+        first_row = self.row_count
+        self._write(points, ring_lengths, part_lengths, row_lengths, codes)
+        for offset, feature in enumerate(features):
+            row = first_row + offset
+            if offset in raw:
+                self._set_raw(row, *raw[offset])
+            self._add_members(row, feature)
+        return list(range(first_row, self.row_count))
+
+    def _append_raw(self, feature):
+        measured = self._measure_raw(feature.get('geometry'))
+        row = self.row_count
+        self._write(np.empty((0, 2)), [], [], [0], [RAW])
+        self._set_raw(row, *measured)
+        self._add_members(row, feature)
+        return [row]
+
+    @staticmethod
+    def _measure_raw(geometry):
+        """Return (geometry, bbox); raises ValueError if it has malformed positions"""
+        try:
+            return geometry, geometry_bbox(geometry)
+        except (AttributeError, IndexError, KeyError, TypeError, RecursionError) as e:
+            raise ValueError(f'malformed geometry: {e}') from e
+
+    def _set_raw(self, row, geometry, bbox):
+        """Keep a geometry as GeoJSON; only its bounding box is measured"""
+        self.raw[row] = geometry
+        if bbox is not None:
+            self.metrics[row, metrics.MINX:] = bbox
+
+    def _add_members(self, row, feature):
+        self.properties.append(feature.get('properties'))
+        extra = {k: v for k, v in feature.items() if k not in FEATURE_MEMBERS}
+        if extra:
+            self.extras[row] = extra
+
+    def _write(self, points, ring_lengths, part_lengths, row_lengths, codes):
+        """Append flattened geometry data to the buffers
+
+        Only the unused tails of the buffers are written until the counters
+        move at the end, so a failure part way leaves the columns unchanged.
+        """
+        codes = np.asarray(codes, dtype=np.uint8)
+        computed = metrics.compute(
+            points, ring_lengths, part_lengths, row_lengths,
+            (codes == POLYGON) | (codes == MULTIPOLYGON), (codes == LINESTRING) | (codes == MULTILINESTRING))
+
+        coord_end = self.coord_count + len(points)
+        self.coords = _grow(self.coords, coord_end)
+        self.coords[self.coord_count:coord_end] = points
+
+        def extend(offsets, count, lengths):
+            offsets = _grow(offsets, count + len(lengths) + 1)
+            offsets[count + 1:count + 1 + len(lengths)] = offsets[count] + np.cumsum(lengths)
+            return offsets
+
+        self.ring_offsets = extend(self.ring_offsets, self.ring_count, ring_lengths)
+        self.part_offsets = extend(self.part_offsets, self.part_count, part_lengths)
+        self.row_offsets = extend(self.row_offsets, self.row_count, row_lengths)
+        self.types = _grow(self.types, self.row_count + len(codes))
+        self.types[self.row_count:self.row_count + len(codes)] = codes
+        self.metrics = _grow(self.metrics, self.row_count + len(codes))
+        self.metrics[self.row_count:self.row_count + len(codes)] = computed
+
+        self.coord_count = coord_end
+        self.ring_count += len(ring_lengths)
+        self.part_count += len(part_lengths)
+        self.row_count += len(row_lengths)
+
+    def coord_range(self, row):
+        """Return (start, end) of the row's positions in coords"""
+        part_start, part_end = self.row_offsets[row], self.row_offsets[row + 1]
+        return (int(self.ring_offsets[self.part_offsets[part_start]]),
+                int(self.ring_offsets[self.part_offsets[part_end]]))
+
+    def geometry(self, row):
+        """Build the GeoJSON geometry of a row"""
+        code = int(self.types[row])
+        if code == RAW:
+            return self.raw[row]
+
+        coords = self.coords
+        ring_offsets = self.ring_offsets
+        part_offsets = self.part_offsets
+        parts = []
+        for part in range(self.row_offsets[row], self.row_offsets[row + 1]):
+            parts.append([coords[ring_offsets[ring]:ring_offsets[ring + 1]].tolist()
+                          for ring in range(part_offsets[part], part_offsets[part + 1])])
+
+        if code == POLYGON:
+            coordinates = parts[0]
+        elif code == MULTIPOLYGON:
+            coordinates = parts
+        elif code == LINESTRING:
+            coordinates = parts[0][0]
+        elif code == MULTILINESTRING:
+            coordinates = [part[0] for part in parts]
+        elif code == POINT:
+            coordinates = parts[0][0][0]
+        else:
+            coordinates = [part[0][0] for part in parts]
+        return {'type': TYPE_NAMES[code], 'coordinates': coordinates}
+
+    def polygon_edges(self, row):
+        """Return (starts, ends, part_starts) for the ring edges of a polygonal row
+
+        starts and ends are (n, 2) arrays holding the end points of every
+        edge, each ring being closed back to its first position, and
+        part_starts the index of each polygon's first edge. Returns None
+        for rows that are not Polygons or MultiPolygons. Polygons kept as
+        raw GeoJSON because their positions carry altitudes are read from
+        it, using their lng/lat only.
+        """
+        code = self.types[row]
+        if code == RAW:
+            return _raw_polygon_edges(self.raw[row])
+        if code not in (POLYGON, MULTIPOLYGON):
+            return None
+        part_start, part_end = self.row_offsets[row], self.row_offsets[row + 1]
+        rings = self.ring_offsets[self.part_offsets[part_start]:self.part_offsets[part_end] + 1]
+        part_starts = self.ring_offsets[self.part_offsets[part_start:part_end]]
+        return _ring_edges(self.coords, rings, part_starts)
+
+    def feature(self, row, feature_id, with_metrics=False):
+        """Build the GeoJSON feature stored in a row, optionally adding its metrics as properties"""
+        properties = self.properties[row]
+        if with_metrics:
+            properties = dict(properties or {})
+            values = self.metrics[row].tolist()
+            for name, column in METRIC_PROPERTIES:
+                value = values[column]
+                properties[name] = None if value != value else value
+        feature = {
+            'type': 'Feature',
+            'id': feature_id,
+            'geometry': self.geometry(row),
+            'properties': properties,
+        }
+        extra = self.extras.get(row)
+        if extra:
+            feature.update(extra)
+        return feature
+
+    def bbox(self, row):
+        """Return the bounding box of a row's geometry, or None"""
+        box = self.metrics[row, metrics.MINX:]
+        if np.isnan(box[0]):
+            return None
+        return tuple(box.tolist())
+
+    def bboxes(self, rows):
+        """Return bounding boxes for many rows at once (None for empty geometries)"""
+        boxes = self.metrics[np.asarray(rows, dtype=np.int64), metrics.MINX:]
+        empty = np.isnan(boxes[:, 0]).tolist()
+        return [None if e else tuple(b) for e, b in zip(empty, boxes.tolist())]
+
+
+class FeatureSequence:
+    """Read-only sequence of features materialized on access"""
+
+    __slots__ = ('_ids', '_rows', '_columns', '_with_metrics')
+
+    def __init__(self, ids, rows, columns, with_metrics=False):
+        self._ids = ids
+        self._rows = rows
+        self._columns = columns
+        self._with_metrics = with_metrics
+
+    @property
+    def ids(self):
+        """Tuple of the feature ids, in order"""
+        return self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FeatureSequence(self._ids[index], self._rows[index], self._columns,
+                                   self._with_metrics)
+        return self._columns.feature(self._rows[index], self._ids[index], self._with_metrics)
+
+    def __iter__(self):
+        feature = self._columns.feature
+        for row, feature_id in zip(self._rows, self._ids):
+            yield feature(row, feature_id, self._with_metrics)
+
+    def rows(self):
+        """Return (columns, rows) holding the features"""
+        return self._columns, self._rows
+
+    def metrics(self):
+        """Return the (len, metrics.COLUMNS) array of the features' cached metrics"""
+        return self._columns.metrics[np.asarray(self._rows, dtype=np.int64).reshape(-1)]
+
+    def with_metrics(self):
+        """Return a view whose features carry their metrics as properties"""
+        return FeatureSequence(self._ids, self._rows, self._columns, True)
+
+    def vertex_count(self):
+        """Return the number of positions in the features' flattened geometries
+
+        Geometries kept as raw GeoJSON (positions with altitude) count as 0.
+        """
+        columns = self._columns
+        rows = np.asarray(self._rows, dtype=np.int64).reshape(-1)
+        # The buffers are grown ahead of use, so only their filled part is valid
+        row_offsets = columns.row_offsets[:columns.row_count + 1]
+        ring_starts = columns.ring_offsets[columns.part_offsets[row_offsets]]
+        return int((ring_starts[rows + 1] - ring_starts[rows]).sum())
+
+
+class FeatureTable:
+    """
+    Mapping of feature id to GeoJSON feature backed by FeatureColumns.
+
+    Replacing or removing a feature leaves its old row behind; the columns
+    are rewritten once dead rows outnumber live ones. Features are built
+    from the columns on every read, so callers get fresh dicts.
+    """
+
+    def __init__(self):
+        self._rows = {}
+        self._columns = FeatureColumns()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, feature_id):
+        return feature_id in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __getitem__(self, feature_id):
+        return self._columns.feature(self._rows[feature_id], feature_id)
+
+    def __setitem__(self, feature_id, feature):
+        self.insert_many([(feature_id, feature)])
+
+    @property
+    def nbytes(self):
+        """Bytes used by the geometry buffers"""
+        return self._columns.nbytes
+
+    def get(self, feature_id, default=None):
+        row = self._rows.get(feature_id)
+        if row is None:
+            return default
+        return self._columns.feature(row, feature_id)
+
+    def insert_many(self, items):
+        """Store (feature_id, feature) pairs, replacing existing ids in place"""
+        items = list(items)
+        rows = self._columns.append([feature for _, feature in items])
+        for (feature_id, _), row in zip(items, rows):
+            self._rows[feature_id] = row
+        self._maybe_vacuum()
+
+    def remove(self, feature_id):
+        """Remove a feature; returns False if it does not exist"""
+        if self._rows.pop(feature_id, None) is None:
+            return False
+        self._maybe_vacuum()
+        return True
+
+    def bbox(self, feature_id):
+        """Return the bounding box of a stored feature, or None"""
+        return self._columns.bbox(self._rows[feature_id])
+
+    def bboxes(self, feature_ids=None):
+        """Yield (feature_id, bbox) for the given features, or all of them"""
+        if feature_ids is None:
+            feature_ids = list(self._rows)
+        boxes = self._columns.bboxes([self._rows[i] for i in feature_ids])
+        return zip(feature_ids, boxes)
+
+    def rows(self, feature_ids):
+        """Return (columns, rows) locating the given features
+
+        The rows stay valid after the table changes, as columns are only
+        ever appended to or replaced.
+        """
+        return self._columns, [self._rows[i] for i in feature_ids]
+
+    def view(self):
+        """Return an immutable FeatureSequence of the current features"""
+        return FeatureSequence(tuple(self._rows), tuple(self._rows.values()), self._columns)
+
+    def _maybe_vacuum(self):
+        """Rewrite the columns without dead rows once they dominate"""
+        columns = self._columns
+        if columns.row_count < 1024 or columns.row_count < 2 * len(self._rows):
+            return
+        fresh = FeatureColumns()
+        items = list(self._rows.items())
+        rows = fresh.append([columns.feature(row, feature_id) for feature_id, row in items])
+        self._rows = dict(zip((feature_id for feature_id, _ in items), rows))
+        self._columns = fresh
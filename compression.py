@@ -0,0 +1,83 @@
+"""
+Polygon Mapper - Response Compression
+Content-Encoding negotiation and streaming compressors
+"""
+
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies smaller than this are sent as they are
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+
+def available_encodings():
+    """Return the supported content codings, most preferred first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+ENCODINGS = available_encodings()
+
+
+def negotiate(accept_encodings):
+    """Pick a content coding from a parsed Accept-Encoding header, or None"""
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def _compressor(encoding):
+    """Return (compress, flush) functions for a streaming compressor"""
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress, compressor.flush
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        return compressor.compress, compressor.flush
+    raise ValueError(f'unsupported content coding {encoding!r}')
+
+
+def iter_compressed(chunks, encoding):
+    """Compress text or byte chunks, yielding output as the compressor emits it"""
+    compress, flush = _compressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compress(chunk)
+        if data:
+            yield data
+    yield flush()
+
+
+def compress_chunks(chunks, encoding):
+    """Compress text or byte chunks into a single body"""
+    return b''.join(iter_compressed(chunks, encoding))
+
+
+def decompress(data, encoding):
+    """Undo compress_chunks"""
+    if encoding == 'gzip':
+        return zlib.decompress(data, 31)
+    if encoding == 'br':
+        return brotli.decompress(data)
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f'unsupported content coding {encoding!r}')
@@ -0,0 +1,197 @@
+"""
+Polygon Mapper - Dissolve
+Merge overlapping and touching polygons into one MultiPolygon per group
+"""
+
+from importlib.util import find_spec
+
+import numpy as np
+
+from columnar import MULTIPOLYGON, POLYGON, RAW, FeatureColumns, FeatureSequence
+from json_codec import dumps_text, loads
+
+# shapely is only imported by the first dissolve, to keep startup fast
+shapely = None
+
+POLYGONAL = ('Polygon', 'MultiPolygon')
+
+
+def available():
+    """Return True if shapely is installed (without importing it)"""
+    return shapely is not None or find_spec('shapely') is not None
+
+
+def _load():
+    global shapely
+    if shapely is None:
+        import shapely as module
+        shapely = module
+
+
+def _components(count, left, right):
+    """Label the connected components of a graph given as edge arrays
+
+    Every node ends up labelled with the smallest node index in its
+    component.
+    """
+    labels = np.arange(count)
+    while True:
+        hooked = labels.copy()
+        np.minimum.at(hooked, left, labels[right])
+        np.minimum.at(hooked, right, labels[left])
+        # Labels are node indices no larger than the node, so jumping to
+        # the label's own label shortcuts long chains
+        hooked = hooked[hooked]
+        if (hooked == labels).all():
+            return labels
+        labels = hooked
+
+
+def dissolve_geometries(geometries):
+    """Return the union of shapely polygons as a list of disjoint Polygons
+
+    An STRtree finds the pairs that actually intersect; only clusters of
+    overlapping or touching polygons go through the (cascaded) union, and
+    isolated polygons are passed through untouched.
+    """
+    _load()
+    geometries = np.asarray(geometries, dtype=object)
+    if not len(geometries):
+        return []
+    # Freehand rings often cross themselves, which the union cannot handle
+    invalid = ~shapely.is_valid(geometries)
+    if invalid.any():
+        geometries = geometries.copy()
+        geometries[invalid] = shapely.make_valid(geometries[invalid])
+
+    left, right = shapely.STRtree(geometries).query(geometries, predicate='intersects')
+    pairs = left < right
+    labels = _components(len(geometries), left[pairs], right[pairs])
+
+    order = np.argsort(labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    merged = []
+    for members in np.split(order, bounds):
+        if len(members) == 1:
+            merged.append(geometries[members[0]])
+        else:
+            merged.append(shapely.union_all(geometries[members]))
+
+    parts = shapely.get_parts(np.asarray(merged, dtype=object))
+    # make_valid and union can leave stray lines and points behind, and
+    # collapsed rings come out as empty Polygons
+    parts = parts[(shapely.get_type_id(parts) == shapely.GeometryType.POLYGON)
+                  & ~shapely.is_empty(parts)]
+    return list(parts)
+
+
+def _ranges(offsets, indices):
+    """Return the concatenated offsets[i]:offsets[i + 1] ranges and their new offsets"""
+    starts = offsets[indices]
+    lengths = offsets[indices + 1] - starts
+    ends = np.cumsum(lengths)
+    flat = np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - (ends - lengths), lengths)
+    return flat, np.concatenate(([0], ends))
+
+
+def _kept(offsets, keep):
+    """Return offsets into an array once the items where keep is False are removed"""
+    return np.concatenate(([0], np.cumsum(keep)))[offsets]
+
+
+def _to_shapely(columns, rows):
+    """Build shapely geometries for polygonal rows of a columnar.FeatureColumns
+
+    The rows' offsets are gathered into the ragged arrays shapely builds
+    geometries from in bulk; Polygons are MultiPolygons with one part.
+    Rings of fewer than 4 positions, polygons without rings and holes of
+    such polygons are left out, as GEOS cannot build them (and crashes on
+    empty parts); rows left without a part become empty geometries.
+    """
+    parts, row_offsets = _ranges(columns.row_offsets, rows)
+    rings, part_offsets = _ranges(columns.part_offsets, parts)
+    lengths = columns.ring_offsets[rings + 1] - columns.ring_offsets[rings]
+    ring_kept = lengths >= 4
+    ring_counts = np.diff(part_offsets)
+    part_kept = ring_counts > 0
+    part_kept[part_kept] = ring_kept[part_offsets[:-1][part_kept]]
+    ring_kept &= np.repeat(part_kept, ring_counts)
+
+    part_offsets = _kept(part_offsets, ring_kept)
+    part_offsets = np.concatenate(([0], np.cumsum(np.diff(part_offsets)[part_kept])))
+    row_offsets = _kept(row_offsets, part_kept)
+    coords, ring_offsets = _ranges(columns.ring_offsets, rings[ring_kept])
+    geometries = shapely.from_ragged_array(
+        shapely.GeometryType.MULTIPOLYGON, columns.coords[coords],
+        (ring_offsets, part_offsets, row_offsets))
+    for i, row in enumerate(rows.tolist()):
+        if columns.types[row] == RAW:
+            # Positions with more than two values are kept as GeoJSON
+            geometries[i] = shapely.from_geojson(dumps_text(columns.raw[row]))
+    return geometries
+
+
+def _to_geojson(polygons):
+    """Return a GeoJSON MultiPolygon made of shapely Polygons"""
+    if not polygons:
+        return {'type': 'MultiPolygon', 'coordinates': []}
+    _, coords, (ring_offsets, polygon_offsets) = shapely.to_ragged_array(polygons)
+    coords = coords.tolist()
+    ring_offsets = ring_offsets.tolist()
+    polygon_offsets = polygon_offsets.tolist()
+    rings = [coords[a:b] for a, b in zip(ring_offsets[:-1], ring_offsets[1:])]
+    return {'type': 'MultiPolygon',
+            'coordinates': [rings[a:b] for a, b in zip(polygon_offsets[:-1], polygon_offsets[1:])]}
+
+
+def dissolve(features, by=None):
+    """Return one MultiPolygon feature per group of features
+
+    Features are grouped by the value of the property named by (all in
+    one group when by is None); geometries other than Polygons and
+    MultiPolygons are left out. Each result carries the group value and
+    the number of features merged into it.
+    """
+    if not available():
+        raise RuntimeError('Dissolve requires shapely')
+    _load()
+
+    # Stored features are read straight from their columnar buffers
+    if isinstance(features, FeatureSequence):
+        columns, rows = features.rows()
+    else:
+        columns = FeatureColumns()
+        rows = columns.append(list(features))
+
+    groups = {}
+    polygonal = []
+    for row in rows:
+        code = columns.types[row]
+        if code == RAW:
+            geometry = columns.raw[row]
+            if not geometry or geometry.get('type') not in POLYGONAL:
+                continue
+        elif code != POLYGON and code != MULTIPOLYGON:
+            continue
+        value = (columns.properties[row] or {}).get(by) if by is not None else None
+        # Group on the JSON text so unhashable values (lists, objects) work too
+        groups.setdefault(dumps_text(value), []).append(len(polygonal))
+        polygonal.append(row)
+
+    geometries = _to_shapely(columns, np.asarray(polygonal, dtype=np.int64))
+    result = []
+    for key, members in groups.items():
+        polygons = dissolve_geometries(geometries[members])
+        if not polygons:
+            # Nothing but degenerate rings in this group
+            continue
+        properties = {'count': len(members)}
+        if by is not None:
+            properties = {by: loads(key), **properties}
+        result.append({
+            'type': 'Feature',
+            'id': len(result) + 1,
+            'geometry': _to_geojson(polygons),
+            'properties': properties,
+        })
+    return result
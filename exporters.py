@@ -0,0 +1,125 @@
+"""
+Polygon Mapper - Exporters
+Stream stored features out as GeoJSON, or encode them as TopoJSON or in
+binary formats
+"""
+
+import os
+
+import geoparquet
+from flatgeobuf import encode_flatgeobuf
+from json_codec import dumps
+from topojson import DEFAULT_QUANTIZATION, encode_topojson
+
+CHUNK_SIZE = 64 * 1024
+RECORD_SEPARATOR = b'\x1e'
+
+# format name -> (file extension, mimetype, binary)
+EXPORT_FORMATS = {
+    'geojson': ('geojson', 'application/geo+json', False),
+    'geojsonseq': ('geojsons', 'application/geo+json-seq', False),
+    'topojson': ('topojson', 'application/json', False),
+    'fgb': ('fgb', 'application/flatgeobuf', True),
+    'parquet': ('parquet', 'application/vnd.apache.parquet', True),
+}
+
+# Formats that are compressed internally and gain nothing from Content-Encoding
+PRECOMPRESSED_FORMATS = {'parquet'}
+
+
+class ExportError(ValueError):
+    """Raised when an export format cannot be produced"""
+
+
+def iter_geojson(features, pretty=False, chunk_size=CHUNK_SIZE):
+    """Yield a GeoJSON FeatureCollection as UTF-8 chunks of roughly chunk_size bytes"""
+    if pretty:
+        header = b'{\n  "type": "FeatureCollection",\n  "features": [\n'
+        separator = b',\n'
+        footer = b'\n  ]\n}'
+    else:
+        header = b'{"type":"FeatureCollection","features":['
+        separator = b','
+        footer = b']}'
+
+    buffer = [header]
+    size = len(header)
+    for i, feature in enumerate(features):
+        if pretty:
+            text = b'    ' + dumps(feature, pretty=True).replace(b'\n', b'\n    ')
+        else:
+            text = dumps(feature)
+        if i:
+            text = separator + text
+        buffer.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(footer)
+    yield b''.join(buffer)
+
+
+def iter_geojson_seq(features, chunk_size=CHUNK_SIZE):
+    """Yield an RFC 8142 GeoJSON text sequence, one feature per record"""
+    buffer = []
+    size = 0
+    for feature in features:
+        text = RECORD_SEPARATOR + dumps(feature) + b'\n'
+        buffer.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def iter_export(features, fmt='geojson', pretty=False, quantization=DEFAULT_QUANTIZATION):
+    """Return an iterator of chunks encoding features in the given format
+
+    TopoJSON and the binary formats need every feature up front (for shared
+    arcs, the header or the spatial index), so they are encoded before the
+    first chunk is returned. quantization only applies to TopoJSON.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f'unknown format {fmt!r}, expected one of '
+                          f'{", ".join(EXPORT_FORMATS)}')
+    if fmt == 'geojson':
+        return iter_geojson(features, pretty=pretty)
+    if fmt == 'geojsonseq':
+        return iter_geojson_seq(features)
+    if fmt == 'topojson':
+        if quantization == 1:
+            raise ExportError('quantization must be 0 (off) or at least 2')
+        data = dumps(encode_topojson(features, quantization), pretty=pretty)
+    elif fmt == 'fgb':
+        data = encode_flatgeobuf(features)
+    else:
+        if not geoparquet.available():
+            raise ExportError('GeoParquet export requires pyarrow')
+        data = geoparquet.encode_geoparquet(features)
+    return iter([data])
+
+
+def tee_to_file(chunks, path):
+    """Pass chunks through while also writing them to path
+
+    The file is written under a temporary name and only renamed into place
+    once every chunk has been written, so an aborted download never leaves
+    a truncated export behind.
+    """
+    part_path = path + '.part'
+    completed = False
+    try:
+        with open(part_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+                yield chunk
+        os.replace(part_path, path)
+        completed = True
+    finally:
+        if not completed and os.path.exists(part_path):
+            os.remove(part_path)
@@ -0,0 +1,369 @@
+"""
+Polygon Mapper - FlatGeobuf Export
+Encode features as FlatGeobuf with a packed Hilbert R-tree index
+"""
+
+import math
+import struct
+
+import numpy as np
+
+from geometry import union_bbox
+from json_codec import dumps
+
+MAGIC = b'fgb\x03fgb\x01'
+NODE_SIZE = 16
+NODE_ITEM = np.dtype([('minx', '<f8'), ('miny', '<f8'), ('maxx', '<f8'),
+                      ('maxy', '<f8'), ('offset', '<u8')])
+
+GEOMETRY_TYPES = {
+    'Point': 1, 'LineString': 2, 'Polygon': 3, 'MultiPoint': 4,
+    'MultiLineString': 5, 'MultiPolygon': 6, 'GeometryCollection': 7,
+}
+
+# Column types from the FlatGeobuf schema
+BOOL = 2
+LONG = 7
+DOUBLE = 10
+STRING = 11
+JSON = 12
+
+# Flatbuffer field kinds: struct format for scalars, or a nested value
+_OFFSET_KINDS = ('string', 'vector', 'tables', 'table')
+
+
+class _Builder:
+    """
+    Minimal forward-writing FlatBuffers encoder for size-prefixed buffers.
+
+    A table is a list of (field index, kind, value) where kind is a struct
+    format character for scalars, 'string', 'vector' (value is (format,
+    values)), 'tables' (a list of tables) or 'table'. Children are always
+    written after the field that points to them, so every uoffset is
+    positive as the format requires.
+    """
+
+    def __init__(self):
+        # Alignment is relative to the start of the size prefix
+        self.buf = bytearray(8)
+
+    def finish(self, table):
+        self._patch(4, self._table(table))
+        self._align(8)
+        struct.pack_into('<I', self.buf, 0, len(self.buf) - 4)
+        return bytes(self.buf)
+
+    def _align(self, size, extra=0):
+        self.buf.extend(bytes(-(len(self.buf) + extra) % size))
+
+    def _patch(self, at, target):
+        struct.pack_into('<I', self.buf, at, target - at)
+
+    def _table(self, fields):
+        fields = [f for f in fields if f[2] is not None]
+        vtable, size, offsets = _layout(tuple((f[0], f[1]) for f in fields))
+        self._align(2)
+        vtable_pos = len(self.buf)
+        self.buf += vtable
+
+        self._align(8)
+        table_pos = len(self.buf)
+        self.buf += bytes(size)
+        struct.pack_into('<i', self.buf, table_pos, table_pos - vtable_pos)
+        children = []
+        for (index, kind, value), offset in zip(fields, offsets):
+            if kind in _OFFSET_KINDS:
+                children.append((table_pos + offset, kind, value))
+            else:
+                struct.pack_into('<' + kind, self.buf, table_pos + offset, value)
+        for at, kind, value in children:
+            self._patch(at, self._child(kind, value))
+        return table_pos
+
+    def _child(self, kind, value):
+        if kind == 'table':
+            return self._table(value)
+        if kind == 'string':
+            data = value.encode('utf-8')
+            self._align(4)
+            pos = len(self.buf)
+            self.buf.extend(struct.pack('<I', len(data)) + data + b'\0')
+            return pos
+        if kind == 'vector':
+            fmt, values = value
+            if isinstance(values, bytes):
+                data = values
+            else:
+                data = struct.pack(f'<{len(values)}{fmt}', *values)
+            self._align(max(4, _size(fmt)), extra=4)
+            pos = len(self.buf)
+            self.buf.extend(struct.pack('<I', len(values)) + data)
+            return pos
+        # A vector of tables
+        self._align(4)
+        pos = len(self.buf)
+        self.buf.extend(struct.pack('<I', len(value)) + bytes(4 * len(value)))
+        for i, table in enumerate(value):
+            self._patch(pos + 4 + 4 * i, self._table(table))
+        return pos
+
+
+def _size(kind):
+    return 4 if kind in _OFFSET_KINDS else struct.calcsize(kind)
+
+
+_layouts = {}
+
+
+def _layout(signature):
+    """Return (vtable bytes, table size, field offsets) for (index, kind) pairs
+
+    Fields are placed largest first to keep padding down. Every feature
+    has one of a handful of shapes, so layouts are cached.
+    """
+    layout = _layouts.get(signature)
+    if layout is not None:
+        return layout
+    offsets = [0] * len(signature)
+    size = 4
+    for position in sorted(range(len(signature)), key=lambda p: -_size(signature[p][1])):
+        width = _size(signature[position][1])
+        size += -size % width
+        offsets[position] = size
+        size += width
+
+    slots = 1 + max((index for index, _ in signature), default=-1)
+    vtable = [4 + 2 * slots, size] + [0] * slots
+    for (index, _), offset in zip(signature, offsets):
+        vtable[2 + index] = offset
+    layout = _layouts[signature] = (struct.pack(f'<{len(vtable)}H', *vtable), size, offsets)
+    return layout
+
+
+def _geometry_table(geometry, bounds):
+    """Return the Geometry table for a GeoJSON geometry, or None
+
+    The bounding box of every coordinate run is appended to bounds.
+    """
+    if not geometry:
+        return None
+    kind = geometry.get('type')
+    code = GEOMETRY_TYPES.get(kind)
+    if code is None:
+        return None
+    if kind == 'GeometryCollection':
+        parts = [_geometry_table(g, bounds) for g in geometry.get('geometries') or []]
+        return [(6, 'B', code), (7, 'tables', [p for p in parts if p is not None])]
+    coordinates = geometry.get('coordinates') or []
+    if kind == 'MultiPolygon':
+        parts = [_geometry_table({'type': 'Polygon', 'coordinates': polygon}, bounds)
+                 for polygon in coordinates]
+        return [(6, 'B', code), (7, 'tables', parts)]
+
+    if kind == 'Point':
+        lines = [[coordinates]] if coordinates else []
+    elif kind in ('LineString', 'MultiPoint'):
+        lines = [coordinates]
+    else:
+        lines = coordinates
+    xy = [value for line in lines for position in line for value in position[:2]]
+    if xy:
+        xs = xy[0::2]
+        ys = xy[1::2]
+        bounds.append((min(xs), min(ys), max(xs), max(ys)))
+    fields = [(1, 'vector', ('d', xy)), (6, 'B', code)]
+    if len(lines) > 1:
+        ends = np.cumsum([len(line) for line in lines]).tolist()
+        fields.append((0, 'vector', ('I', ends)))
+    return fields
+
+
+def _column_type(values):
+    """Pick the narrowest FlatGeobuf column type holding every value"""
+    kinds = set()
+    for value in values:
+        if isinstance(value, bool):
+            kinds.add(BOOL)
+        elif isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+            kinds.add(LONG)
+        elif isinstance(value, float):
+            kinds.add(DOUBLE)
+        elif isinstance(value, str):
+            kinds.add(STRING)
+        else:
+            kinds.add(JSON)
+    if len(kinds) == 1:
+        return kinds.pop()
+    if kinds == {LONG, DOUBLE}:
+        return DOUBLE
+    return JSON
+
+
+def _encode_properties(properties, columns):
+    """Encode properties as (column index, value) pairs"""
+    out = bytearray()
+    for key, value in (properties or {}).items():
+        if value is None:
+            continue
+        index, column_type = columns[key]
+        out += struct.pack('<H', index)
+        if column_type == BOOL:
+            out += struct.pack('<?', value)
+        elif column_type == LONG:
+            out += struct.pack('<q', value)
+        elif column_type == DOUBLE:
+            out += struct.pack('<d', value)
+        else:
+            data = dumps(value) if column_type == JSON else value.encode('utf-8')
+            out += struct.pack('<I', len(data)) + data
+    return bytes(out)
+
+
+def _hilbert(x, y):
+    """Hilbert curve index of 16-bit grid positions (uint32 arrays)"""
+    a = x ^ y
+    b = 0xFFFF ^ a
+    c = 0xFFFF ^ (x | y)
+    d = x & (y ^ 0xFFFF)
+
+    A = a | (b >> 1)
+    B = (a >> 1) ^ a
+    C = ((c >> 1) ^ (b & (d >> 1))) ^ c
+    D = ((a & (c >> 1)) ^ (d >> 1)) ^ d
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 2)) ^ (b & (b >> 2))
+    B = (a & (b >> 2)) ^ (b & ((a ^ b) >> 2))
+    C = C ^ ((a & (c >> 2)) ^ (b & (d >> 2)))
+    D = D ^ ((b & (c >> 2)) ^ ((a ^ b) & (d >> 2)))
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 4)) ^ (b & (b >> 4))
+    B = (a & (b >> 4)) ^ (b & ((a ^ b) >> 4))
+    C = C ^ ((a & (c >> 4)) ^ (b & (d >> 4)))
+    D = D ^ ((b & (c >> 4)) ^ ((a ^ b) & (d >> 4)))
+
+    a, b, c, d = A, B, C, D
+    C = C ^ ((a & (c >> 8)) ^ (b & (d >> 8)))
+    D = D ^ ((b & (c >> 8)) ^ ((a ^ b) & (d >> 8)))
+
+    a = C ^ (C >> 1)
+    b = D ^ (D >> 1)
+    i0 = x ^ y
+    i1 = b | (0xFFFF ^ (i0 | a))
+
+    def spread(v):
+        v = (v | (v << 8)) & 0x00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F
+        v = (v | (v << 2)) & 0x33333333
+        return (v | (v << 1)) & 0x55555555
+
+    return (spread(i1) << 1) | spread(i0)
+
+
+def _hilbert_order(boxes, extent):
+    """Return the order that sorts boxes along a Hilbert curve over extent"""
+    width = max(extent[2] - extent[0], 1e-300)
+    height = max(extent[3] - extent[1], 1e-300)
+    with np.errstate(invalid='ignore'):
+        cx = (boxes[:, 0] + boxes[:, 2]) / 2
+        cy = (boxes[:, 1] + boxes[:, 3]) / 2
+    # Features without a geometry sort to the start
+    cx = np.nan_to_num(cx, nan=extent[0], posinf=extent[0], neginf=extent[0])
+    cy = np.nan_to_num(cy, nan=extent[1], posinf=extent[1], neginf=extent[1])
+    x = np.floor(0xFFFF * (cx - extent[0]) / width).astype(np.uint32)
+    y = np.floor(0xFFFF * (cy - extent[1]) / height).astype(np.uint32)
+    return np.argsort(_hilbert(x, y), kind='stable')
+
+
+def _packed_rtree(boxes, offsets, node_size=NODE_SIZE):
+    """Build the packed R-tree (root first) over leaf boxes in Hilbert order"""
+    count = len(boxes)
+    level_sizes = [count]
+    n = count
+    while True:
+        n = math.ceil(n / node_size)
+        level_sizes.append(n)
+        if n == 1:
+            break
+    total = sum(level_sizes)
+    bounds = []
+    end = total
+    for size in level_sizes:
+        bounds.append((end - size, end))
+        end -= size
+
+    nodes = np.zeros(total, dtype=NODE_ITEM)
+    start = bounds[0][0]
+    for i, name in enumerate(('minx', 'miny', 'maxx', 'maxy')):
+        nodes[name][start:] = boxes[:, i]
+    nodes['offset'][start:] = offsets
+
+    for (start, end), (parent_start, parent_end) in zip(bounds, bounds[1:]):
+        groups = np.arange(start, end, node_size)
+        parents = nodes[parent_start:parent_end]
+        parents['minx'] = np.minimum.reduceat(nodes['minx'][start:end], groups - start)
+        parents['miny'] = np.minimum.reduceat(nodes['miny'][start:end], groups - start)
+        parents['maxx'] = np.maximum.reduceat(nodes['maxx'][start:end], groups - start)
+        parents['maxy'] = np.maximum.reduceat(nodes['maxy'][start:end], groups - start)
+        parents['offset'] = groups
+    return nodes.tobytes()
+
+
+def encode_flatgeobuf(features, name='polygons'):
+    """Return a FlatGeobuf file holding the features, with a spatial index"""
+    features = list(features)
+    columns = {}
+    values = {}
+    for feature in features:
+        for key, value in (feature.get('properties') or {}).items():
+            if value is not None:
+                values.setdefault(key, []).append(value)
+            columns.setdefault(key, len(columns))
+    columns = {key: (index, _column_type(values.get(key, ())))
+               for key, index in columns.items()}
+
+    # Encode in input order, then write features and index in Hilbert order
+    empty = (math.inf, math.inf, -math.inf, -math.inf)
+    encoded = []
+    boxes = []
+    for feature in features:
+        bounds = []
+        table = [(0, 'table', _geometry_table(feature.get('geometry'), bounds))]
+        properties = _encode_properties(feature.get('properties'), columns)
+        if properties:
+            table.append((1, 'vector', ('B', properties)))
+        encoded.append(_Builder().finish(table))
+        boxes.append(union_bbox(bounds) or empty)
+    boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+
+    filled = np.isfinite(boxes).all(axis=1)
+    if filled.any():
+        extent = (boxes[filled, 0].min(), boxes[filled, 1].min(),
+                  boxes[filled, 2].max(), boxes[filled, 3].max())
+    else:
+        extent = (0.0, 0.0, 0.0, 0.0)
+
+    order = _hilbert_order(boxes, extent) if features else np.empty(0, dtype=np.intp)
+    encoded = [encoded[i] for i in order.tolist()]
+    sizes = np.array([len(data) for data in encoded], dtype=np.uint64)
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.uint64)
+
+    kinds = {(f.get('geometry') or {}).get('type') for f in features}
+    geometry_type = GEOMETRY_TYPES.get(kinds.pop(), 0) if len(kinds) == 1 else 0
+    header = _Builder().finish([
+        (0, 'string', name),
+        (1, 'vector', ('d', list(extent))) if filled.any() else (1, 'vector', None),
+        (2, 'B', geometry_type),
+        (7, 'tables', [[(0, 'string', key), (1, 'B', column_type)]
+                       for key, (_, column_type) in columns.items()] or None),
+        (8, 'Q', len(features)),
+        (9, 'H', NODE_SIZE if features else 0),
+        (10, 'table', [(0, 'string', 'EPSG'), (1, 'i', 4326)]),
+    ])
+
+    out = [MAGIC, header]
+    if features:
+        out.append(_packed_rtree(boxes[order], offsets))
+    out.extend(encoded)
+    return b''.join(out)
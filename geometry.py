@@ -0,0 +1,72 @@
+"""
+Polygon Mapper - Geometry Helpers
+Small utilities for working with GeoJSON geometries
+"""
+
+import math
+
+
+def iter_positions(coordinates):
+    """Yield every [x, y] position in a nested GeoJSON coordinates array"""
+    if not coordinates:
+        return
+    if isinstance(coordinates[0], (int, float)):
+        yield coordinates
+        return
+    for part in coordinates:
+        yield from iter_positions(part)
+
+
+def geometry_bbox(geometry):
+    """Return (minx, miny, maxx, maxy) for a GeoJSON geometry, or None if empty"""
+    if not geometry:
+        return None
+    if geometry.get('type') == 'GeometryCollection':
+        boxes = [geometry_bbox(g) for g in geometry.get('geometries', [])]
+        return union_bbox(b for b in boxes if b is not None)
+
+    xs = []
+    ys = []
+    for position in iter_positions(geometry.get('coordinates')):
+        xs.append(position[0])
+        ys.append(position[1])
+    if not xs:
+        return None
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def feature_bbox(feature):
+    """Return the bounding box of a GeoJSON feature, or None if it has no geometry"""
+    if not isinstance(feature, dict):
+        return None
+    return geometry_bbox(feature.get('geometry'))
+
+
+def union_bbox(boxes):
+    """Return the bounding box covering all the given boxes, or None"""
+    result = None
+    for box in boxes:
+        if result is None:
+            result = box
+        else:
+            result = (min(result[0], box[0]), min(result[1], box[1]),
+                      max(result[2], box[2]), max(result[3], box[3]))
+    return result
+
+
+def bbox_intersects(a, b):
+    """Return True if two bounding boxes overlap"""
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+def parse_bbox(value):
+    """Parse a 'minx,miny,maxx,maxy' string into a bounding box tuple"""
+    parts = value.split(',')
+    if len(parts) != 4:
+        raise ValueError('bbox must be minx,miny,maxx,maxy')
+    minx, miny, maxx, maxy = bbox = tuple(float(p) for p in parts)
+    if not all(math.isfinite(v) for v in bbox):
+        raise ValueError('bbox values must be finite numbers')
+    if minx > maxx or miny > maxy:
+        raise ValueError('bbox min values must not exceed max values')
+    return bbox
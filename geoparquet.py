@@ -0,0 +1,120 @@
+"""
+Polygon Mapper - GeoParquet Export
+Encode features as GeoParquet (WKB geometries plus a bbox covering column)
+"""
+
+import struct
+from importlib.util import find_spec
+
+# pyarrow takes longer to import than the rest of the app, so it is only
+# loaded by the first GeoParquet export
+pa = pq = None
+
+from geometry import feature_bbox
+from json_codec import dumps_text
+
+GEOPARQUET_VERSION = '1.1.0'
+WKB_TYPES = {
+    'Point': 1, 'LineString': 2, 'Polygon': 3, 'MultiPoint': 4,
+    'MultiLineString': 5, 'MultiPolygon': 6, 'GeometryCollection': 7,
+}
+RESERVED_COLUMNS = ('id', 'geometry', 'bbox')
+
+
+def available():
+    """Return True if pyarrow is installed (without importing it)"""
+    return pa is not None or find_spec('pyarrow') is not None
+
+
+def _load():
+    global pa, pq
+    if pq is None:
+        import pyarrow
+        import pyarrow.parquet
+        pa, pq = pyarrow, pyarrow.parquet
+
+
+def _points(positions):
+    return struct.pack('<I', len(positions)) + b''.join(
+        struct.pack('<2d', p[0], p[1]) for p in positions)
+
+
+def encode_wkb(geometry):
+    """Encode a GeoJSON geometry as little-endian 2D WKB, or None"""
+    if not geometry:
+        return None
+    kind = geometry.get('type')
+    header = struct.pack('<BI', 1, WKB_TYPES[kind])
+    coordinates = geometry.get('coordinates')
+    if kind == 'Point':
+        x, y = coordinates[:2] if coordinates else (float('nan'), float('nan'))
+        return header + struct.pack('<2d', x, y)
+    if kind == 'LineString':
+        return header + _points(coordinates)
+    if kind == 'Polygon':
+        return header + struct.pack('<I', len(coordinates)) + b''.join(
+            _points(ring) for ring in coordinates)
+    if kind == 'GeometryCollection':
+        parts = [{'type': g['type'], 'coordinates': g.get('coordinates'),
+                  'geometries': g.get('geometries')} for g in geometry['geometries']]
+    else:
+        single = kind[len('Multi'):]
+        parts = [{'type': single, 'coordinates': c} for c in coordinates]
+    return header + struct.pack('<I', len(parts)) + b''.join(map(encode_wkb, parts))
+
+
+def _column(values):
+    """Build an Arrow array, falling back to JSON text for mixed or nested values"""
+    if not any(isinstance(v, (dict, list)) for v in values):
+        try:
+            return pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+    return pa.array([None if v is None else dumps_text(v) for v in values], pa.string())
+
+
+def encode_geoparquet(features):
+    """Return a GeoParquet file holding the features"""
+    if not available():
+        raise RuntimeError('GeoParquet export requires pyarrow')
+    _load()
+    features = list(features)
+
+    keys = {}
+    for feature in features:
+        for key in feature.get('properties') or {}:
+            keys.setdefault(key, f'properties.{key}' if key in RESERVED_COLUMNS else key)
+
+    boxes = [feature_bbox(f) for f in features]
+    columns = {
+        'id': pa.array([f.get('id') for f in features], pa.int64()),
+        'geometry': pa.array([encode_wkb(f.get('geometry')) for f in features], pa.binary()),
+        'bbox': pa.array([dict(zip(('xmin', 'ymin', 'xmax', 'ymax'), b)) if b else None
+                          for b in boxes],
+                         pa.struct([(name, pa.float64())
+                                    for name in ('xmin', 'ymin', 'xmax', 'ymax')])),
+    }
+    for key, name in keys.items():
+        columns[name] = _column([(f.get('properties') or {}).get(key) for f in features])
+
+    filled = [b for b in boxes if b]
+    types = {(f.get('geometry') or {}).get('type') for f in features} - {None}
+    geo = {
+        'version': GEOPARQUET_VERSION,
+        'primary_column': 'geometry',
+        'columns': {'geometry': {
+            'encoding': 'WKB',
+            'geometry_types': sorted(types),
+            'covering': {'bbox': {axis: ['bbox', axis]
+                                  for axis in ('xmin', 'ymin', 'xmax', 'ymax')}},
+        }},
+    }
+    if filled:
+        geo['columns']['geometry']['bbox'] = [
+            min(b[0] for b in filled), min(b[1] for b in filled),
+            max(b[2] for b in filled), max(b[3] for b in filled)]
+
+    table = pa.table(columns).replace_schema_metadata({'geo': dumps_text(geo)})
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression='zstd')
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,255 @@
+"""
+Polygon Mapper - Ingest
+Incremental parsing and validation of uploaded GeoJSON
+"""
+
+import codecs
+import json
+import sys
+
+from json_codec import loads
+
+from simplify import simplify_geometry
+
+READ_SIZE = 64 * 1024
+RECORD_SEPARATOR = b'\x1e'
+
+# Array nesting around the positions of each geometry type
+COORDINATE_DEPTHS = {
+    'Point': 0, 'MultiPoint': 1, 'LineString': 1,
+    'MultiLineString': 2, 'Polygon': 2, 'MultiPolygon': 3,
+}
+
+GEOMETRY_TYPES = set(COORDINATE_DEPTHS) | {'GeometryCollection'}
+
+# Integer positions must still fit in a float64 column
+MAX_COORDINATE = sys.float_info.max
+
+SEQUENCE_MIMETYPES = {
+    'application/geo+json-seq', 'application/json-seq',
+    'application/x-ndjson', 'application/geo+json-lines',
+}
+
+
+class IngestError(ValueError):
+    """Raised when an uploaded document is not valid GeoJSON"""
+
+
+def validate_feature(feature):
+    """Check that feature is a GeoJSON Feature, raising IngestError otherwise"""
+    if not isinstance(feature, dict) or feature.get('type') != 'Feature':
+        raise IngestError('expected an object with "type": "Feature"')
+
+    geometry = feature.get('geometry')
+    if geometry is not None:
+        _validate_geometry(geometry)
+
+    properties = feature.get('properties')
+    if properties is not None and not isinstance(properties, dict):
+        raise IngestError('properties must be null or an object')
+
+
+def _validate_geometry(geometry):
+    """Check a geometry's type, coordinate nesting and positions"""
+    if not isinstance(geometry, dict) or geometry.get('type') not in GEOMETRY_TYPES:
+        raise IngestError('geometry must be null or a GeoJSON geometry object')
+    kind = geometry['type']
+    if kind == 'GeometryCollection':
+        geometries = geometry.get('geometries')
+        if not isinstance(geometries, list):
+            raise IngestError('GeometryCollection requires a "geometries" array')
+        for member in geometries:
+            _validate_geometry(member)
+        return
+
+    coordinates = geometry.get('coordinates')
+    if not isinstance(coordinates, list):
+        raise IngestError(f'{kind} requires a "coordinates" array')
+    # Walk down to the arrays of positions
+    arrays = [coordinates]
+    for _ in range(COORDINATE_DEPTHS[kind] - 1):
+        arrays = [item for array in arrays for item in array]
+        if not all(isinstance(array, list) for array in arrays):
+            raise IngestError(f'{kind} coordinates are not nested '
+                              f'{COORDINATE_DEPTHS[kind] + 1} arrays deep')
+    if COORDINATE_DEPTHS[kind] == 0:
+        arrays = [[coordinates]]
+    for positions in arrays:
+        _validate_positions(positions)
+
+
+def _validate_positions(positions):
+    """Require every position to be an array of two or more finite numbers"""
+    for position in positions:
+        if type(position) is not list or len(position) < 2:
+            raise IngestError('positions must be arrays of two or more numbers')
+        for value in position:
+            if type(value) is float:
+                # Only NaN and the infinities have a non-zero x - x
+                if value - value:
+                    raise IngestError(f'position values must be finite, got {value!r}')
+            elif type(value) is not int or not -MAX_COORDINATE <= value <= MAX_COORDINATE:
+                raise IngestError(f'position values must be numbers, got {value!r}')
+
+
+def iter_sequence(stream):
+    """Yield features from an RFC 8142 GeoJSON text sequence or newline-delimited GeoJSON"""
+    delimiter = None
+    buffer = b''
+    while True:
+        data = stream.read(READ_SIZE)
+        buffer += data
+        if delimiter is None:
+            stripped = buffer.lstrip()
+            if not stripped and data:
+                continue
+            delimiter = RECORD_SEPARATOR if stripped.startswith(RECORD_SEPARATOR) else b'\n'
+
+        records = buffer.split(delimiter)
+        buffer = records.pop() if data else b''
+        for record in records:
+            yield from _decode_record(record)
+        if not data:
+            return
+
+
+def _decode_record(record):
+    record = record.strip()
+    if not record:
+        return
+    try:
+        value = loads(record)
+    except ValueError as e:
+        raise IngestError(f'invalid JSON text in sequence: {e}') from None
+    if isinstance(value, dict) and value.get('type') == 'FeatureCollection':
+        yield from value.get('features') or []
+    else:
+        yield value
+
+
+class _StreamReader:
+    """Decode a byte stream into text on demand for incremental JSON parsing"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=READ_SIZE):
+        """Read up to size more bytes; returns False at end of stream"""
+        if self.eof:
+            return False
+        data = self.stream.read(size)
+        if not data:
+            self.eof = True
+        self.text = self.text[self.pos:] + self.decoder.decode(data, final=not data)
+        self.pos = 0
+        return bool(data)
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise IngestError(f'expected {char!r} in FeatureCollection')
+        self.pos += 1
+
+    def value(self):
+        """Decode the next JSON value, reading more input until it is complete
+
+        Each attempt re-parses the value from its start, so the reads grow
+        with the text already buffered to keep a large value linear.
+        """
+        decoder = json.JSONDecoder()
+        self.peek()
+        while True:
+            size = max(READ_SIZE, len(self.text) - self.pos)
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+            except ValueError as e:
+                if self.fill(size):
+                    continue
+                raise IngestError(f'invalid JSON: {e}') from None
+            # A number could continue in the next chunk
+            if end == len(self.text) and not self.eof and self.fill(size):
+                continue
+            self.pos = end
+            return value
+
+
+def iter_feature_collection(stream):
+    """Yield features from a GeoJSON FeatureCollection without loading it whole"""
+    reader = _StreamReader(stream)
+    reader.expect('{')
+    seen_type = None
+    if reader.peek() == '}':
+        raise IngestError('expected a FeatureCollection')
+
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'features':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.peek() == ',':
+                        reader.pos += 1
+                        continue
+                    reader.expect(']')
+                    break
+        elif key == 'type':
+            seen_type = reader.value()
+            if seen_type != 'FeatureCollection':
+                raise IngestError('expected a FeatureCollection')
+        else:
+            reader.value()
+
+        if reader.peek() == ',':
+            reader.pos += 1
+            continue
+        reader.expect('}')
+        break
+
+    if reader.peek():
+        raise IngestError('unexpected data after the FeatureCollection')
+    if seen_type != 'FeatureCollection':
+        raise IngestError('expected a FeatureCollection')
+
+
+def read_features(stream, mimetype):
+    """Parse and validate every feature in an uploaded body"""
+    if mimetype in SEQUENCE_MIMETYPES:
+        source = iter_sequence(stream)
+    else:
+        source = iter_feature_collection(stream)
+
+    features = []
+    for feature in source:
+        try:
+            validate_feature(feature)
+        except IngestError as e:
+            raise IngestError(f'feature {len(features)}: {e}') from None
+        features.append(feature)
+    return features
+
+
+def simplify_feature(feature, tolerance, method='dp'):
+    """Return (feature, vertices_removed) with the feature's geometry simplified"""
+    if not tolerance or not isinstance(feature, dict):
+        return feature, 0
+    geometry, removed = simplify_geometry(feature.get('geometry'), tolerance, method)
+    if not removed:
+        return feature, 0
+    return dict(feature, geometry=geometry), removed
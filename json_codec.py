@@ -0,0 +1,74 @@
+"""
+Polygon Mapper - JSON Codec
+JSON encoding and decoding through orjson when it is installed, with the
+standard library as a fallback
+"""
+
+import json
+
+import numpy as np
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def numpy_default(value):
+    """Encode NumPy values the standard library does not know about"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _stdlib_dumps(value, pretty=False):
+    if pretty:
+        text = json.dumps(value, indent=2, ensure_ascii=False, default=numpy_default)
+    else:
+        text = json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=numpy_default)
+    return text.encode('utf-8')
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(value, pretty=False):
+        """Encode value as compact (or 2-space indented) UTF-8 JSON bytes"""
+        try:
+            return orjson.dumps(value, option=(_OPTIONS | orjson.OPT_INDENT_2) if pretty else _OPTIONS)
+        except orjson.JSONEncodeError:
+            # Integers beyond 64 bits and other values orjson rejects
+            return _stdlib_dumps(value, pretty)
+
+    # orjson.JSONDecodeError is a ValueError, like the stdlib's
+    loads = orjson.loads
+else:
+    dumps = _stdlib_dumps
+
+    def loads(data):
+        """Decode JSON from bytes or text"""
+        return json.loads(data)
+
+
+def dumps_text(value, pretty=False):
+    """Encode value as a JSON string"""
+    return dumps(value, pretty).decode('utf-8')
+
+
+class CodecJSONProvider(JSONProvider):
+    """Flask JSON provider that routes jsonify and request.json through the codec"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps_text(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        value = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(value), mimetype='application/json')
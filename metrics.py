@@ -0,0 +1,118 @@
+"""
+Polygon Mapper - Geometry Metrics
+Vectorized area, perimeter, centroid and bounding box of flattened
+geometries, computed once when they are stored
+"""
+
+import numpy as np
+
+# Mean Earth radius in metres; areas and lengths are measured on a sphere
+EARTH_RADIUS = 6371008.8
+
+# Columns of a metrics array
+AREA, PERIMETER, CENTROID_X, CENTROID_Y, MINX, MINY, MAXX, MAXY = range(8)
+COLUMNS = 8
+
+
+def _divide(a, b):
+    return np.divide(a, b, out=np.full_like(a, np.nan), where=b != 0)
+
+
+def compute(points, ring_lengths, part_lengths, row_lengths, polygonal, linear):
+    """Return a (rows, COLUMNS) array of metrics for flattened geometries
+
+    The arguments describe rows the way columnar.FeatureColumns stores
+    them; polygonal and linear flag the rows holding (Multi)Polygons and
+    (Multi)LineStrings. Area is in square metres (holes subtracted) and
+    perimeter in metres (the length of lines). The centroid is the planar
+    area centroid of polygons, the length-weighted centroid of lines and
+    the mean of points. Rows without positions are all NaN.
+    """
+    ring_lengths = np.asarray(ring_lengths, dtype=np.int64)
+    part_lengths = np.asarray(part_lengths, dtype=np.int64)
+    row_lengths = np.asarray(row_lengths, dtype=np.int64)
+    rows = len(row_lengths)
+    rings = len(ring_lengths)
+    result = np.full((rows, COLUMNS), np.nan)
+    if not len(points):
+        return result
+
+    row_of_part = np.repeat(np.arange(rows), row_lengths)
+    row_of_ring = row_of_part[np.repeat(np.arange(len(part_lengths)), part_lengths)]
+    ring_starts = np.cumsum(ring_lengths) - ring_lengths
+    filled = ring_lengths > 0
+    starts = ring_starts[filled]
+
+    def ring_sums(values):
+        sums = np.zeros((rings,) + values.shape[1:])
+        sums[filled] = np.add.reduceat(values, starts)
+        return sums
+
+    def row_sums(values):
+        return np.bincount(row_of_ring, values, rows)
+
+    # Each position's edge runs to the next one in its ring; polygon rings
+    # close back to their first position and the end of a line stays put
+    following = np.arange(1, len(points) + 1)
+    ring_ends = (ring_starts + ring_lengths - 1)[filled]
+    following[ring_ends] = np.where(polygonal[row_of_ring[filled]], starts, ring_ends)
+    ends = points[following]
+
+    # Planar moments, relative to each ring's first position for precision
+    origins = np.zeros((rings, 2))
+    origins[filled] = points[starts]
+    relative = points - np.repeat(origins[filled], ring_lengths[filled], axis=0)
+    x1, y1 = relative.T
+    x2, y2 = relative[following].T
+    cross = x1 * y2 - x2 * y1
+    signed = ring_sums(cross) / 2
+    moment_x = ring_sums((x1 + x2) * cross) / 6
+    moment_y = ring_sums((y1 + y2) * cross) / 6
+
+    # Spherical ring area and great-circle edge lengths
+    lng, lat = np.radians(points).T
+    sin_lat = np.sin(lat)
+    cos_lat = np.cos(lat)
+    lng_step = lng[following] - lng
+    sphere = ring_sums(lng_step * (sin_lat + sin_lat[following]))
+    haversine = (np.sin((lat[following] - lat) / 2) ** 2
+                 + cos_lat * cos_lat[following] * np.sin(lng_step / 2) ** 2)
+    length = ring_sums(np.arcsin(np.sqrt(np.minimum(haversine, 1)))) * (2 * EARTH_RADIUS)
+
+    # The first ring of each polygon is its exterior, the rest are holes
+    exterior = np.zeros(rings, dtype=bool)
+    part_starts = np.cumsum(part_lengths) - part_lengths
+    exterior[part_starts[part_lengths > 0]] = True
+    sign = np.where(exterior, 1.0, -1.0) * polygonal[row_of_ring]
+
+    result[:, AREA] = row_sums(sign * np.abs(sphere) * (EARTH_RADIUS * EARTH_RADIUS / 2))
+    result[:, PERIMETER] = row_sums(length)
+
+    orient = sign * np.sign(signed)
+    area = row_sums(np.abs(signed) * sign)
+    result[:, CENTROID_X] = _divide(row_sums((moment_x + signed * origins[:, 0]) * orient), area)
+    result[:, CENTROID_Y] = _divide(row_sums((moment_y + signed * origins[:, 1]) * orient), area)
+
+    # Lines, points and degenerate polygons fall back to the length-weighted
+    # centre of their segments, or the mean of their positions
+    count = row_sums(ring_lengths.astype(np.float64))
+    fallback = np.flatnonzero(~(polygonal & (area != 0)) & (count > 0))
+    if len(fallback):
+        segment = np.hypot(x2 - x1, y2 - y1)
+        middle = ring_sums(segment[:, None] * (points + ends) / 2)
+        total = ring_sums(points)
+        line = row_sums(ring_sums(segment))[fallback]
+        use_line = (polygonal | linear)[fallback] & (line != 0)
+        for column, axis in ((CENTROID_X, 0), (CENTROID_Y, 1)):
+            result[fallback, column] = np.where(
+                use_line,
+                _divide(row_sums(middle[:, axis])[fallback], line),
+                row_sums(total[:, axis])[fallback] / count[fallback])
+
+    # Rows are contiguous, so their bounds reduce over runs of positions
+    occupied = np.flatnonzero(count)
+    row_starts = (np.cumsum(count) - count).astype(np.int64)[occupied]
+    result[occupied, MINX:MINY + 1] = np.minimum.reduceat(points, row_starts, axis=0)
+    result[occupied, MAXX:MAXY + 1] = np.maximum.reduceat(points, row_starts, axis=0)
+    result[count == 0, AREA:PERIMETER + 1] = np.nan
+    return result
@@ -0,0 +1,660 @@
+"""
+Polygon Mapper - Main Page
+The drawing page, encoded once and served from memory
+"""
+
+import hashlib
+import re
+import threading
+
+from assets import asset_url
+from compression import compress_chunks
+
+HTML = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Polygon Mapper</title>
+    <link rel="stylesheet" href="asset:leaflet/leaflet.css" />
+    <link rel="stylesheet" href="asset:leaflet-draw/leaflet.draw.css" />
+    <link rel="stylesheet" href="asset:leaflet-freedraw/leaflet-freedraw.css" />
+    <style>
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            background: #f5f5f5;
+        }
+
+        .header {
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            padding: 20px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+        }
+
+        .header h1 {
+            font-size: 28px;
+            margin-bottom: 10px;
+        }
+
+        .header p {
+            opacity: 0.9;
+            font-size: 14px;
+        }
+
+        .container {
+            max-width: 1400px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+
+        .controls {
+            background: white;
+            padding: 20px;
+            border-radius: 10px;
+            margin-bottom: 20px;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.05);
+        }
+
+        .instructions {
+            background: #e8f4f8;
+            border-left: 4px solid #3388ff;
+            padding: 15px;
+            border-radius: 5px;
+            margin-bottom: 15px;
+        }
+
+        .instructions h3 {
+            color: #2c3e50;
+            margin-bottom: 10px;
+            font-size: 16px;
+        }
+
+        .instructions ol {
+            margin-left: 20px;
+            color: #555;
+            font-size: 14px;
+            line-height: 1.8;
+        }
+
+        .button-group {
+            display: flex;
+            gap: 10px;
+            flex-wrap: wrap;
+        }
+
+        .btn {
+            padding: 12px 24px;
+            border: none;
+            border-radius: 6px;
+            font-size: 14px;
+            font-weight: 600;
+            cursor: pointer;
+            transition: all 0.3s ease;
+            display: inline-flex;
+            align-items: center;
+            gap: 8px;
+        }
+
+        .btn:hover {
+            transform: translateY(-2px);
+            box-shadow: 0 4px 12px rgba(0,0,0,0.15);
+        }
+
+        .btn-primary {
+            background: #3388ff;
+            color: white;
+        }
+
+        .btn-success {
+            background: #28a745;
+            color: white;
+        }
+
+        .btn-warning {
+            background: #ffc107;
+            color: #333;
+        }
+
+        .btn:disabled {
+            opacity: 0.5;
+            cursor: not-allowed;
+        }
+
+        .btn:disabled:hover {
+            transform: none;
+            box-shadow: none;
+        }
+
+        #map {
+            height: 600px;
+            border-radius: 10px;
+            box-shadow: 0 2px 20px rgba(0,0,0,0.1);
+            border: 2px solid #ddd;
+        }
+
+        .status {
+            margin-top: 15px;
+            padding: 12px;
+            border-radius: 6px;
+            font-size: 14px;
+            display: none;
+        }
+
+        .status.success {
+            background: #d4edda;
+            color: #155724;
+            border: 1px solid #c3e6cb;
+            display: block;
+        }
+
+        .status.error {
+            background: #f8d7da;
+            color: #721c24;
+            border: 1px solid #f5c6cb;
+            display: block;
+        }
+
+        .status.info {
+            background: #d1ecf1;
+            color: #0c5460;
+            border: 1px solid #bee5eb;
+            display: block;
+        }
+
+        .counter {
+            background: #667eea;
+            color: white;
+            padding: 8px 16px;
+            border-radius: 20px;
+            font-weight: 600;
+            font-size: 14px;
+        }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <div class="container">
+            <h1>Polygon Mapper</h1>
+            <p>Draw polygons on the map and export them as GeoJSON files</p>
+        </div>
+    </div>
+
+    <div class="container">
+        <div class="controls">
+            <div class="instructions">
+                <h3>How to Use:</h3>
+                <ol>
+                    <li><strong>Click-to-draw mode:</strong> Use the polygon tool in left toolbar, click to add vertices</li>
+                    <li><strong>Freehand mode:</strong> Click "Enable Freehand" below, then click and drag to draw</li>
+                    <li>Draw as many polygons as you need</li>
+                    <li>Click a saved polygon to edit or delete it with the toolbar</li>
+                    <li>Click <strong>"Export GeoJSON"</strong> to download all polygons</li>
+                </ol>
+            </div>
+
+            <div class="button-group">
+                <button class="btn btn-primary" onclick="toggleFreehand()" id="freehandBtn">
+                    Enable Freehand
+                </button>
+                <button class="btn btn-success" onclick="exportGeoJSON()" id="exportBtn">
+                    Export GeoJSON
+                </button>
+                <button class="btn btn-warning" onclick="clearAll()">
+                    Clear All
+                </button>
+                <span class="counter" id="counter">Polygons: 0</span>
+            </div>
+
+            <div id="status" class="status"></div>
+        </div>
+
+        <div id="map"></div>
+    </div>
+
+    <script src="asset:leaflet/leaflet.js"></script>
+    <script src="asset:leaflet-draw/leaflet.draw.js"></script>
+    <script src="asset:leaflet-freedraw/leaflet-freedraw.web.js"></script>
+    <script src="asset:leaflet.vectorgrid/Leaflet.VectorGrid.bundled.js"></script>
+    <script>
+        // Initialize map
+        const map = L.map('map').setView([39.8283, -98.5795], 4);
+
+        // Add OpenStreetMap tiles
+        L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+            attribution: '© OpenStreetMap contributors',
+            maxZoom: 19
+        }).addTo(map);
+
+        // Optional layer rendering every stored polygon from vector tiles
+        const storedTiles = L.vectorGrid.protobuf('/tiles/{z}/{x}/{y}.pbf', {
+            vectorTileLayerStyles: {
+                polygons: {
+                    color: '#764ba2',
+                    weight: 1,
+                    fill: true,
+                    fillOpacity: 0.2
+                }
+            },
+            maxZoom: 19
+        });
+        L.control.layers(null, {
+            'Stored polygons (tiles)': storedTiles
+        }).addTo(map);
+
+        // Add regular Leaflet.Draw controls for click-to-draw polygons
+        const drawnItems = new L.FeatureGroup();
+        map.addLayer(drawnItems);
+
+        const drawControl = new L.Control.Draw({
+            draw: {
+                polygon: {
+                    shapeOptions: {
+                        color: '#3388ff',
+                        weight: 3
+                    }
+                },
+                polyline: false,
+                rectangle: false,
+                circle: false,
+                marker: false,
+                circlemarker: false
+            },
+            edit: {
+                featureGroup: drawnItems,
+                remove: true
+            }
+        });
+        map.addControl(drawControl);
+
+        // Add FreeDraw for freehand drawing
+        const freeDraw = new FreeDraw({
+            mode: FreeDraw.NONE,
+            smoothFactor: 0.5,
+            strokeWidth: 3
+        });
+        map.addLayer(freeDraw);
+
+        let polygonCount = 0;
+        let freehandMode = false;
+
+        // Stored polygons are loaded for the visible area only, a page at
+        // a time, and become editable once clicked
+        const PAGE_SIZE = 500;
+        const MAX_VIEW_POLYGONS = 2000;
+        const shownIds = new Set();
+        let viewRequest = 0;
+
+        const storedItems = L.geoJSON(null, {
+            style: { color: '#3388ff', weight: 3 },
+            onEachFeature: function(feature, layer) {
+                layer.featureId = feature.id;
+                layer.on('click', makeEditable);
+            }
+        }).addTo(map);
+
+        function makeEditable(event) {
+            const layer = event.target;
+            layer.off('click', makeEditable);
+            storedItems.removeLayer(layer);
+            drawnItems.addLayer(layer);
+            showStatus('Polygon can now be edited or deleted from the toolbar', 'info');
+        }
+
+        // Handle regular polygon creation from Leaflet.Draw
+        map.on(L.Draw.Event.CREATED, function(event) {
+            const layer = event.layer;
+            drawnItems.addLayer(layer);
+
+            const geojson = layer.toGeoJSON();
+
+            fetch('/api/polygons', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(geojson)
+            })
+            .then(response => response.json())
+            .then(data => {
+                layer.featureId = data.id;
+                shownIds.add(data.id);
+                polygonCount = data.count;
+                updateCounter();
+                showStatus('Polygon ' + polygonCount + ' added successfully!', 'success');
+            });
+        });
+
+        // Keep FreeDraw polygons in sync with the server; each polygon
+        // remembers its server id and the geometry last sent
+        const freehandPolygons = new Set();
+
+        function freehandGeometry(polygon) {
+            const ring = polygon.getLatLngs()[0].map(point => [point.lng, point.lat]);
+            ring.push(ring[0]);
+            return { type: 'Polygon', coordinates: [ring] };
+        }
+
+        function saveFreehand(polygon) {
+            freehandPolygons.add(polygon);
+            polygon.sentGeometry = JSON.stringify(freehandGeometry(polygon));
+            // Edits and deletes made before the POST answers wait for the id
+            polygon.saved = fetch('/api/polygons', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ type: 'Feature', properties: {}, geometry: JSON.parse(polygon.sentGeometry) })
+            })
+            .then(response => response.json())
+            .then(data => {
+                polygon.featureId = data.id;
+                shownIds.add(data.id);
+                polygonCount = data.count;
+                updateCounter();
+                showStatus('Freehand polygon ' + polygonCount + ' added successfully!', 'success');
+            });
+        }
+
+        function updateFreehand(polygon) {
+            const geometry = JSON.stringify(freehandGeometry(polygon));
+            if (geometry === polygon.sentGeometry) {
+                return;
+            }
+            polygon.sentGeometry = geometry;
+            polygon.saved = polygon.saved.then(function() {
+                return fetch('/api/polygons/' + polygon.featureId, {
+                    method: 'PATCH',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify({ geometry: JSON.parse(geometry) })
+                });
+            });
+            showStatus('Freehand polygon updated', 'info');
+        }
+
+        function deleteFreehand(polygon) {
+            freehandPolygons.delete(polygon);
+            polygon.saved.then(function() {
+                shownIds.delete(polygon.featureId);
+                return fetch('/api/polygons/' + polygon.featureId, {
+                    method: 'DELETE'
+                });
+            })
+            .then(response => response.json())
+            .then(data => {
+                polygonCount = data.count;
+                updateCounter();
+            });
+        }
+
+        freeDraw.on('markers', function(event) {
+            const current = new Set(freeDraw.all());
+            switch (event.eventType) {
+                case 'create':
+                case 'remove':
+                    // Merging overlapping shapes also removes polygons on create
+                    freehandPolygons.forEach(function(polygon) {
+                        if (!current.has(polygon)) {
+                            deleteFreehand(polygon);
+                        }
+                    });
+                    current.forEach(function(polygon) {
+                        if (!freehandPolygons.has(polygon)) {
+                            saveFreehand(polygon);
+                        }
+                    });
+                    break;
+                case 'edit':
+                    current.forEach(function(polygon) {
+                        if (freehandPolygons.has(polygon)) {
+                            updateFreehand(polygon);
+                        }
+                    });
+                    break;
+                case 'clear':
+                    // Only clearAll() clears FreeDraw, and it deletes every polygon itself
+                    freehandPolygons.clear();
+                    break;
+            }
+        });
+
+        // Handle polygon deletion from Leaflet.Draw
+        map.on(L.Draw.Event.DELETED, function(event) {
+            const layers = event.layers;
+            layers.eachLayer(function(layer) {
+                polygonCount--;
+                if (layer.featureId !== undefined) {
+                    shownIds.delete(layer.featureId);
+                    fetch('/api/polygons/' + layer.featureId, {
+                        method: 'DELETE'
+                    });
+                }
+            });
+            updateCounter();
+            showStatus('Polygon(s) deleted', 'info');
+        });
+
+        // Send edited shapes back to the server
+        map.on(L.Draw.Event.EDITED, function(event) {
+            event.layers.eachLayer(function(layer) {
+                if (layer.featureId === undefined) {
+                    return;
+                }
+                fetch('/api/polygons/' + layer.featureId, {
+                    method: 'PATCH',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify({ geometry: layer.toGeoJSON().geometry })
+                });
+            });
+            showStatus('Polygon(s) updated', 'info');
+        });
+
+        function toggleFreehand() {
+            freehandMode = !freehandMode;
+            const btn = document.getElementById('freehandBtn');
+
+            if (freehandMode) {
+                freeDraw.mode(FreeDraw.CREATE);
+                btn.textContent = 'Disable Freehand';
+                btn.classList.remove('btn-primary');
+                btn.classList.add('btn-warning');
+                showStatus('Freehand mode enabled - click and drag to draw', 'info');
+            } else {
+                freeDraw.mode(FreeDraw.NONE);
+                btn.textContent = 'Enable Freehand';
+                btn.classList.remove('btn-warning');
+                btn.classList.add('btn-primary');
+                showStatus('Freehand mode disabled', 'info');
+            }
+        }
+
+        function updateCounter() {
+            document.getElementById('counter').textContent = 'Polygons: ' + polygonCount;
+            document.getElementById('exportBtn').disabled = polygonCount === 0;
+        }
+
+        function showStatus(message, type) {
+            const status = document.getElementById('status');
+            status.textContent = message;
+            status.className = 'status ' + type;
+
+            setTimeout(function() {
+                status.className = 'status';
+            }, 5000);
+        }
+
+        function exportGeoJSON() {
+            if (polygonCount === 0) {
+                showStatus('No polygons to export. Draw some polygons first!', 'error');
+                return;
+            }
+
+            fetch('/api/export')
+                .then(function(response) {
+                    if (!response.ok) {
+                        throw new Error('Export failed');
+                    }
+                    return response.blob();
+                })
+                .then(function(blob) {
+                    const url = window.URL.createObjectURL(blob);
+                    const a = document.createElement('a');
+                    a.href = url;
+                    a.download = 'polygons_' + new Date().getTime() + '.geojson';
+                    document.body.appendChild(a);
+                    a.click();
+                    window.URL.revokeObjectURL(url);
+                    document.body.removeChild(a);
+                    showStatus('Exported ' + polygonCount + ' polygon(s) successfully!', 'success');
+                })
+                .catch(function(error) {
+                    showStatus('Export failed. Please try again.', 'error');
+                });
+        }
+
+        function clearAll() {
+            if (polygonCount === 0) {
+                showStatus('No polygons to clear', 'info');
+                return;
+            }
+
+            if (confirm('Are you sure you want to clear all ' + polygonCount + ' polygon(s)?')) {
+                // Clear Leaflet.Draw and loaded layers
+                drawnItems.clearLayers();
+                storedItems.clearLayers();
+                shownIds.clear();
+
+                // Clear FreeDraw layers
+                freeDraw.clear();
+
+                fetch('/api/polygons', {
+                    method: 'DELETE'
+                })
+                .then(function(response) {
+                    return response.json();
+                })
+                .then(function(data) {
+                    polygonCount = 0;
+                    updateCounter();
+                    showStatus('All polygons cleared', 'success');
+                });
+            }
+        }
+
+        // Load the stored polygons in view, dropping read-only ones that left it
+        function loadVisiblePolygons() {
+            const request = ++viewRequest;
+            const bounds = map.getBounds();
+            const bbox = [
+                Math.max(bounds.getWest(), -180), Math.max(bounds.getSouth(), -90),
+                Math.min(bounds.getEast(), 180), Math.min(bounds.getNorth(), 90)
+            ].join(',');
+
+            storedItems.eachLayer(function(layer) {
+                if (!bounds.intersects(layer.getBounds())) {
+                    storedItems.removeLayer(layer);
+                    shownIds.delete(layer.featureId);
+                }
+            });
+
+            let loaded = 0;
+            function loadPage(cursor) {
+                let url = '/api/polygons?bbox=' + bbox + '&limit=' + PAGE_SIZE;
+                if (cursor) {
+                    url += '&cursor=' + cursor;
+                }
+                return fetch(url)
+                    .then(function(response) {
+                        return response.json();
+                    })
+                    .then(function(data) {
+                        if (request !== viewRequest) {
+                            // The map moved on while this page was loading
+                            return;
+                        }
+                        data.features.forEach(function(feature) {
+                            if (!shownIds.has(feature.id)) {
+                                shownIds.add(feature.id);
+                                storedItems.addData(feature);
+                            }
+                        });
+                        loaded += data.features.length;
+                        if (data.next_cursor === undefined) {
+                            return;
+                        }
+                        if (loaded >= MAX_VIEW_POLYGONS) {
+                            showStatus('Too many polygons to show here - zoom in, or turn on the stored polygons tile layer', 'info');
+                            return;
+                        }
+                        return loadPage(data.next_cursor);
+                    });
+            }
+            loadPage(null);
+        }
+
+        map.on('moveend', loadVisiblePolygons);
+        loadVisiblePolygons();
+
+        // Count the polygons saved in previous sessions without loading them
+        fetch('/api/polygons/stats?summary=1')
+            .then(function(response) {
+                return response.json();
+            })
+            .then(function(data) {
+                polygonCount = data.count;
+                updateCounter();
+            });
+
+        // Initialize counter
+        updateCounter();
+    </script>
+</body>
+</html>'''
+
+# src and href values naming a library file, resolved by asset_url
+ASSET_REFERENCE = re.compile(r'"asset:([\w.-]+)/([\w./-]+)"')
+
+_page = None
+_compressed = {}
+_lock = threading.Lock()
+
+
+def _build():
+    """Return (bytes, etag) of the page with its library URLs filled in"""
+    global _page
+    if _page is None:
+        with _lock:
+            if _page is None:
+                html = ASSET_REFERENCE.sub(lambda m: f'"{asset_url(m.group(1), m.group(2))}"', HTML)
+                data = html.encode('utf-8')
+                # Content hash, so the ETag changes with the page or its libraries
+                _page = (data, hashlib.sha256(data).hexdigest()[:20])
+    return _page
+
+
+def etag():
+    return _build()[1]
+
+
+def body(encoding=None):
+    """Return the page bytes, compressed with encoding (each coding only once)"""
+    data = _build()[0]
+    if not encoding:
+        return data
+    compressed = _compressed.get(encoding)
+    if compressed is None:
+        with _lock:
+            compressed = _compressed.get(encoding)
+            if compressed is None:
+                compressed = _compressed[encoding] = compress_chunks([data], encoding)
+    return compressed
@@ -0,0 +1,137 @@
+"""
+Polygon Mapper - Point in Polygon
+Find the stored polygons containing many points at once with vectorized
+even-odd ray casting
+"""
+
+import numpy as np
+
+# Largest number of point/edge pairs evaluated in one NumPy operation
+BLOCK_SIZE = 1 << 20
+
+def as_points(value):
+    """Return value as an (n, 2) float array of finite lng/lat pairs, raising ValueError"""
+    try:
+        points = np.asarray(value, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError('points must be a list of [lng, lat] pairs') from None
+    if points.size == 0:
+        return points.reshape(0, 2)
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError('points must be a list of [lng, lat] pairs')
+    if not np.isfinite(points).all():
+        raise ValueError('coordinates must be finite numbers')
+    return points
+
+
+def contains(points, starts, ends, part_starts):
+    """Return a boolean mask of the points lying inside a polygon
+
+    Each polygon part (exterior ring plus holes) is tested with the
+    even-odd rule, and a point is inside when any part contains it.
+    With the points sorted by latitude, each edge only looks at the
+    contiguous run of points within its latitude span, so the work grows
+    with the number of crossings rather than points x edges. Points
+    exactly on an edge may fall either way.
+    """
+    count = len(points)
+    inside = np.zeros(count, dtype=bool)
+    if not len(starts) or not count:
+        return inside
+    x1, y1 = starts[:, 0], starts[:, 1]
+    y2 = ends[:, 1]
+    dy = y2 - y1
+    # Horizontal edges never straddle a ray, so their slope is never used
+    slope = np.divide(ends[:, 0] - x1, dy, out=np.zeros_like(dy), where=dy != 0)
+    part_starts = np.unique(part_starts[part_starts < len(starts)])
+
+    order = np.argsort(points[:, 1], kind='stable')
+    xs = points[order, 0]
+    ys = points[order, 1]
+    # A ray from (x, y) towards +x crosses edges with min(y1, y2) <= y < max(y1, y2)
+    first = np.searchsorted(ys, np.minimum(y1, y2), 'left')
+    counts = np.searchsorted(ys, np.maximum(y1, y2), 'left') - first
+    totals = np.cumsum(counts)
+    blocks = [np.arange(len(starts))]
+    if totals[-1] > BLOCK_SIZE:
+        splits = np.searchsorted(totals, np.arange(BLOCK_SIZE, totals[-1], BLOCK_SIZE), 'right')
+        blocks = np.split(blocks[0], splits)
+
+    crossings = np.zeros(count, dtype=np.int64)
+    keys = []
+    for edges in blocks:
+        runs = counts[edges]
+        pairs = int(runs.sum())
+        if not pairs:
+            continue
+        edge = np.repeat(edges, runs)
+        position = np.arange(pairs) + np.repeat(first[edges] - (np.cumsum(runs) - runs), runs)
+        hit = xs[position] < x1[edge] + (ys[position] - y1[edge]) * slope[edge]
+        if len(part_starts) == 1:
+            crossings += np.bincount(position[hit], minlength=count)
+        else:
+            part = np.searchsorted(part_starts, edge[hit], 'right') - 1
+            keys.append(part * count + position[hit])
+
+    if len(part_starts) == 1:
+        inside[order] = crossings & 1
+    elif keys:
+        keys, hits = np.unique(np.concatenate(keys), return_counts=True)
+        inside[order[np.unique(keys[hits & 1 == 1] % count)]] = True
+    return inside
+
+
+def locate(points, columns, feature_ids, rows, bboxes):
+    """Return (point indices, feature ids) for every point inside a feature
+
+    The features are given as rows of a columnar.FeatureColumns along
+    with their bounding boxes. Points are bucketed once into longitude
+    strips sorted by latitude, so each polygon only gathers the runs of
+    points inside its bounding box, and polygons without any are skipped
+    before their edges are read. Pairs are ordered by point, then feature
+    id.
+    """
+    found_points = []
+    found_ids = []
+    if len(points):
+        west = points[:, 0].min()
+        strips = min(int(np.sqrt(len(points))) + 1, 1024)
+        width = (points[:, 0].max() - west) / strips or 1.0
+        strip = np.minimum(((points[:, 0] - west) / width).astype(np.int16), strips - 1)
+        # Sort by latitude, then stably (a radix sort for int16) by strip
+        order = np.argsort(points[:, 1])
+        order = order[np.argsort(strip[order], kind='stable')]
+        ys = points[order, 1]
+        bounds = np.searchsorted(strip[order], np.arange(strips + 1)).tolist()
+
+    for feature_id, row, (minx, miny, maxx, maxy) in zip(feature_ids, rows, bboxes):
+        runs = []
+        for k in range(max(int((minx - west) // width), 0),
+                       min(int((maxx - west) // width), strips - 1) + 1):
+            start, end = bounds[k], bounds[k + 1]
+            lo = start + np.searchsorted(ys[start:end], miny, 'left')
+            hi = start + np.searchsorted(ys[start:end], maxy, 'right')
+            if hi > lo:
+                runs.append(order[lo:hi])
+        if not runs:
+            continue
+        candidates = np.concatenate(runs)
+        x = points[candidates, 0]
+        candidates = candidates[(x >= minx) & (x <= maxx)]
+        if not len(candidates):
+            continue
+        edges = columns.polygon_edges(row)
+        if edges is None or not len(edges[0]):
+            continue
+        inside = np.sort(candidates[contains(points[candidates], *edges)])
+        if len(inside):
+            found_points.append(inside)
+            found_ids.append(np.full(len(inside), feature_id, dtype=np.int64))
+
+    if not found_points:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # Features come in id order and each run of points is sorted, so a
+    # stable merge of the runs orders the pairs by point, then id
+    point_indices = np.concatenate(found_points)
+    order = np.argsort(point_indices, kind='stable')
+    return point_indices[order], np.concatenate(found_ids)[order]
@@ -3,520 +3,925 @@ Polygon Mapper - Standalone Web Application
 Draw polygons on a map and export as GeoJSON
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
-import json
+import time
+
+# Taken before anything else is imported, for --startup-time
+startup_marks = [('start', time.perf_counter())]
+
+from flask import Flask, Response, g, request, jsonify
+import numpy as np
+import argparse
+import atexit
+import math
 import os
 import sys
 from datetime import datetime
-import webbrowser
-import threading
+
+from assets import CACHE_CONTROL as ASSET_CACHE_CONTROL, get_library, mimetype as asset_mimetype
+from compression import MIN_SIZE, compress_chunks, decompress, iter_compressed, negotiate
+from dissolve import available as dissolve_available, dissolve
+from exporters import EXPORT_FORMATS, PRECOMPRESSED_FORMATS, ExportError, iter_export, tee_to_file
+from geometry import parse_bbox
+from ingest import IngestError, read_features, simplify_feature, validate_feature
+from json_codec import CodecJSONProvider
+from metrics import AREA, CENTROID_X, CENTROID_Y, MINX, PERIMETER
+from page import body as page_body, etag as page_etag
+from point_in_polygon import as_points
+from simplify import METHODS as SIMPLIFY_METHODS
+from tiles import MAX_ZOOM, TileCache, encode_tile, tile_bbox
+from topojson import DEFAULT_QUANTIZATION
+from polygon_store import AppendLogStore, MemoryStore, SqliteStore
+from profiling import RequestProfiler
+from response_cache import ResponseCache
+from telemetry import CONTENT_TYPE as METRICS_CONTENT_TYPE, SIZE_BUCKETS, Registry
+
+startup_marks.append(('imports', time.perf_counter()))
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
 
 app = Flask(__name__)
+app.json = CodecJSONProvider(app)
+
+# Optional server-wide simplification of incoming geometries (0 disables)
+app.config['SIMPLIFY_TOLERANCE'] = float(os.environ.get('POLYGON_MAPPER_SIMPLIFY', 0))
+app.config['SIMPLIFY_METHOD'] = os.environ.get('POLYGON_MAPPER_SIMPLIFY_METHOD', 'dp')
+
+# Largest request body accepted, in megabytes; bigger uploads get a 413
+app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ.get('POLYGON_MAPPER_MAX_UPLOAD_MB', 256))
+                                       * 1024 * 1024)
+
+# Grid steps across the data extent for TopoJSON exports (0 keeps full precision)
+app.config['TOPOJSON_QUANTIZATION'] = int(os.environ.get('POLYGON_MAPPER_TOPOJSON_QUANTIZATION',
+                                                         DEFAULT_QUANTIZATION))
+
+# Memory for serialized and compressed API and export bodies, reused until
+# the store changes
+app.config['RESPONSE_CACHE_MB'] = float(os.environ.get('POLYGON_MAPPER_RESPONSE_CACHE_MB', 128))
+app.config['COMPRESSED_CACHE_MB'] = float(os.environ.get('POLYGON_MAPPER_COMPRESSED_CACHE_MB', 64))
+
+# Request metrics served at /metrics for Prometheus (0 turns them off)
+app.config['METRICS'] = os.environ.get('POLYGON_MAPPER_METRICS', '1').lower() not in (
+    '0', 'false', 'no', 'off')
+
+# Share of requests to profile, how many of the slowest profiles to keep and
+# whether clients may ask for a profile with an X-Profile: 1 header (all of
+# these can be changed at runtime through /api/profiling)
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('POLYGON_MAPPER_PROFILE_SAMPLE', 0))
+app.config['PROFILE_KEEP'] = int(os.environ.get('POLYGON_MAPPER_PROFILE_KEEP', 20))
+app.config['PROFILE_HEADER'] = os.environ.get('POLYGON_MAPPER_PROFILE_HEADER', '1').lower() not in (
+    '0', 'false', 'no', 'off')
+
+def get_base_dir():
+    """Return the directory where the executable/script is located"""
+    if getattr(sys, 'frozen', False):
+        # Running as compiled executable
+        return os.path.dirname(sys.executable)
+    # Running as script
+    return os.path.dirname(os.path.abspath(__file__))
+
+def get_data_dir(name):
+    """Return the folder for name ('data' or 'output') next to the app
+
+    When the app sits in a read-only location, such as an installed
+    frozen build, the folder is placed under ~/.polygon_mapper instead.
+    """
+    path = os.path.join(get_base_dir(), name)
+    if os.access(path if os.path.isdir(path) else get_base_dir(), os.W_OK):
+        return path
+    return os.path.join(os.path.expanduser('~'), '.polygon_mapper', name)
+
+def create_store(path=None, shared=False):
+    """Create the polygon store at path, POLYGON_MAPPER_STORE or the default location
+
+    ':memory:' keeps polygons in memory only, a .db/.sqlite path uses
+    SQLite and anything else an append-only log. Only SQLite can be
+    shared by several worker processes, so by default they use
+    data/polygons.db while a single process uses data/polygons.log, or
+    the database when only that exists. A warning names the other file
+    when both hold polygons, as only one of them is shown.
+    """
+    path = path or os.environ.get('POLYGON_MAPPER_STORE')
+    if path == ':memory:' and not shared:
+        return MemoryStore()
+    if not path:
+        data_dir = get_data_dir('data')
+        log_path = os.path.join(data_dir, 'polygons.log')
+        db_path = os.path.join(data_dir, 'polygons.db')
+        if shared or (os.path.exists(db_path) and not os.path.exists(log_path)):
+            path, other = db_path, log_path
+        else:
+            path, other = log_path, db_path
+        if os.path.exists(other):
+            print(f'Warning: opening {path}; polygons saved in {other} are not shown '
+                  f'(pass --store to choose the file)', file=sys.stderr)
+    if path.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteStore(path)
+    if shared:
+        sys.exit(f'Error: worker processes need a SQLite store ({", ".join(SQLITE_EXTENSIONS)}), got {path}')
+    return AppendLogStore(path)
+
+def parse_args():
+    """Parse the command line options"""
+    parser = argparse.ArgumentParser(description='Draw polygons on a map and export them as GeoJSON')
+    parser.add_argument('--serve', action='store_true',
+                        help='run under a production WSGI server with worker processes, without opening a browser')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=5000, help='port to listen on')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes in --serve mode (default: one per core)')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='threads per worker process in --serve mode')
+    parser.add_argument('--store',
+                        help="polygon store: ':memory:', a .db/.sqlite file or a log file path")
+    parser.add_argument('--startup-time', action='store_true',
+                        help='report how long startup takes up to serving the first page, then exit')
+    return parser.parse_args()
+
+def get_flag(name, default):
+    """Read a boolean query parameter such as ?pretty=1"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+def get_int_arg(name, minimum):
+    """Read an integer query parameter, raising ValueError if it is below minimum"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    value = int(value)
+    if value < minimum:
+        raise ValueError(f'{name} must be at least {minimum}')
+    return value
+
+def get_simplify_options():
+    """Return (tolerance, method) from ?simplify=&simplify_method= or the server config"""
+    tolerance = request.args.get('simplify', app.config['SIMPLIFY_TOLERANCE'])
+    method = request.args.get('simplify_method', app.config['SIMPLIFY_METHOD'])
+    tolerance = float(tolerance)
+    if not (math.isfinite(tolerance) and tolerance >= 0) or method not in SIMPLIFY_METHODS:
+        raise ValueError(f'simplify must be a finite number >= 0 and simplify_method '
+                         f'one of {SIMPLIFY_METHODS}')
+    return tolerance, method
+
+def get_encoding():
+    """Return the negotiated response content coding, or None for identity"""
+    return negotiate(request.accept_encodings)
+
+def send_body(data, mimetype, etag, encoding, headers=None):
+    """Build a response for a possibly compressed body
+
+    Compressed variants get a weak ETag, as their bytes differ from the
+    identity response while the content is the same.
+    """
+    response = Response(data, mimetype=mimetype, headers=headers)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag, weak=bool(encoding))
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def send_json_body(data, etag, encoding, cache_status):
+    """Send a serialized JSON body, compressing and caching it if worthwhile"""
+    if encoding and len(data) >= MIN_SIZE:
+        data = compress_chunks([data], encoding)
+        compressed_cache.put((etag, request.full_path, encoding), data)
+    else:
+        encoding = None
+    return send_body(data, 'application/json', etag, encoding, {'X-Cache': cache_status})
+
+# Command line options decide which store to open
+cli_args = parse_args() if __name__ == '__main__' else None
+
+# Store polygons durably so they survive restarts
+if cli_args:
+    store = create_store(cli_args.store, shared=cli_args.serve and cli_args.workers > 1)
+else:
+    store = create_store()
+atexit.register(store.close)
+startup_marks.append(('store', time.perf_counter()))
+
+# Encoded vector tiles, dropped when a mutation touches their area
+tile_cache = TileCache()
+store.subscribe(tile_cache.invalidate)
+
+# Response bodies are keyed by store ETag; mutations just free the memory
+serialized_cache = ResponseCache(int(app.config['RESPONSE_CACHE_MB'] * 1024 * 1024))
+compressed_cache = ResponseCache(int(app.config['COMPRESSED_CACHE_MB'] * 1024 * 1024))
+store.subscribe(serialized_cache.clear)
+store.subscribe(compressed_cache.clear)
+
+# Per-process request metrics; each worker process reports its own
+telemetry = Registry()
+request_count = telemetry.counter(
+    'polygon_mapper_requests_total', 'Requests handled, by route, method and status',
+    ('endpoint', 'method', 'status'))
+request_duration = telemetry.histogram(
+    'polygon_mapper_request_duration_seconds',
+    'Time from receiving a request until its body was sent', labels=('endpoint',))
+request_size = telemetry.histogram(
+    'polygon_mapper_request_size_bytes', 'Size of request bodies', SIZE_BUCKETS, ('endpoint',))
+response_size = telemetry.histogram(
+    'polygon_mapper_response_size_bytes', 'Size of response bodies as sent', SIZE_BUCKETS,
+    ('endpoint',))
+export_duration = telemetry.histogram(
+    'polygon_mapper_export_duration_seconds',
+    'Time to build and send successful exports, by format and response cache status',
+    labels=('format', 'cache'))
+
+_store_size = {}
+
+def get_store_size():
+    """Return (features, vertices) of the current snapshot, counted once per revision"""
+    snapshot = store.snapshot()
+    size = _store_size.get(snapshot.etag)
+    if size is None:
+        size = (len(snapshot), snapshot.features.vertex_count() if len(snapshot) else 0)
+        _store_size.clear()
+        _store_size[snapshot.etag] = size
+    return size
+
+def get_cache_counters(name):
+    """Return a gauge function reading one counter of both response caches"""
+    return lambda: [(('serialized',), serialized_cache.stats()[name]),
+                    (('compressed',), compressed_cache.stats()[name])]
+
+telemetry.gauge('polygon_mapper_store_features', 'Features in the store',
+                lambda: get_store_size()[0])
+telemetry.gauge('polygon_mapper_store_vertices', 'Positions in the stored geometries',
+                lambda: get_store_size()[1])
+telemetry.gauge('polygon_mapper_store_revision', 'Mutations applied to the store',
+                lambda: store.revision)
+telemetry.gauge('polygon_mapper_response_cache_bytes', 'Bytes held by the response caches',
+                get_cache_counters('bytes'), ('cache',))
+telemetry.gauge('polygon_mapper_response_cache_entries', 'Bodies held by the response caches',
+                get_cache_counters('entries'), ('cache',))
+for counter in ('hits', 'misses', 'evictions'):
+    telemetry.gauge(f'polygon_mapper_response_cache_{counter}_total',
+                    f'Response cache {counter}', get_cache_counters(counter), ('cache',),
+                    kind='counter')
+
+@app.before_request
+def start_request_timer():
+    """Note when the request arrived"""
+    g.request_start = time.perf_counter()
+
+def record_request(endpoint, start, size, export_labels):
+    """Record the latency and body size of a finished response"""
+    elapsed = time.perf_counter() - start
+    request_duration.observe(elapsed, endpoint)
+    response_size.observe(size, endpoint)
+    if export_labels:
+        export_duration.observe(elapsed, *export_labels)
+
+def count_sent_bytes(chunks, endpoint, start, export_labels):
+    """Pass a streamed body through, recording the request once it was sent"""
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        # Also runs when the client disconnects part way through
+        record_request(endpoint, start, size, export_labels)
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and time it, up to the end of streamed bodies
+
+    Observing a value is a bisect and a few additions under a lock, so
+    this stays on under load.
+    """
+    if not app.config['METRICS'] or 'request_start' not in g:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    request_count.inc(endpoint, request.method, str(response.status_code))
+    if request.content_length is not None:
+        request_size.observe(request.content_length, endpoint)
+    export_labels = None
+    if endpoint == 'export_geojson' and response.status_code == 200:
+        export_labels = (request.args.get('format', 'geojson'),
+                         response.headers.get('X-Cache', 'MISS'))
+    if response.is_streamed:
+        # Streamed bodies are produced after the request context is gone
+        response.response = count_sent_bytes(response.iter_encoded(), endpoint,
+                                             g.request_start, export_labels)
+    else:
+        record_request(endpoint, g.request_start, response.content_length or 0, export_labels)
+    return response
+
+# Profiles of sampled or requested requests, the slowest ones kept
+request_profiler = RequestProfiler(app.config['PROFILE_SAMPLE_RATE'], app.config['PROFILE_KEEP'],
+                                   app.config['PROFILE_HEADER'])
+
+@app.before_request
+def start_profiling():
+    """Profile the request if it is sampled or asks for it with X-Profile: 1"""
+    trigger = request_profiler.should_profile(request.headers.get('X-Profile'))
+    if trigger:
+        g.profiling = request_profiler.start(request.method, request.full_path,
+                                             request.endpoint, trigger)
+
+@app.after_request
+def finish_profiling(response):
+    """Stop profiling, after the body was sent for streamed responses"""
+    profiling = g.pop('profiling', None)
+    if profiling is None:
+        return response
+    profile, profiler = profiling
+    response.headers['X-Profile-Id'] = str(profile.id)
+    if response.is_streamed:
+        response.response = request_profiler.stream(response.iter_encoded(), profile, profiler,
+                                                    response.status_code)
+    else:
+        request_profiler.finish(profile, profiler, response.status_code)
+    return response
 
-# Store polygons in memory
-polygons = []
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Report request, store and cache metrics in the Prometheus text format"""
+    if not app.config['METRICS']:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(telemetry.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/')
 def index():
-    """Serve the main page"""
-    return render_template('index.html')
+    """Serve the main page from memory, honouring If-None-Match"""
+    etag = page_etag()
+    if request.if_none_match.contains_weak(etag):
+        return '', 304, {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache',
+                         'Vary': 'Accept-Encoding'}
+    encoding = get_encoding()
+    return send_body(page_body(encoding), 'text/html', etag, encoding)
+
+@app.route('/assets/<name>/<digest>/<path:filename>', methods=['GET'])
+def get_asset(name, digest, filename):
+    """Serve a vendored library file from its content-hashed URL
+
+    The URL changes whenever the library does, so responses may be cached
+    for good; precompressed variants are sent to clients accepting them.
+    """
+    library = get_library(name)
+    if library is None or library.digest != digest or filename not in library.files:
+        return jsonify({'error': 'Asset not found'}), 404
+    if request.if_none_match.contains_weak(digest):
+        return '', 304, {'ETag': f'"{digest}"', 'Cache-Control': ASSET_CACHE_CONTROL,
+                         'Vary': 'Accept-Encoding'}
+    data, encoding = library.body(filename, request.accept_encodings)
+    response = send_body(data, asset_mimetype(filename), digest, encoding)
+    response.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+    return response
+
+def send_cached_json(build):
+    """Answer a JSON GET from the response caches, honouring If-None-Match
+
+    build() runs only on a miss and returns (etag, body), etag being the
+    store revision the body reflects. Bodies are keyed by the full request
+    path, so query parameters must be validated before calling this.
+    """
+    # Answer unchanged polls before doing any work
+    etag = store.etag
+    if request.if_none_match.contains_weak(etag):
+        return '', 304, {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache',
+                         'Vary': 'Accept-Encoding'}
+
+    # Repeated requests for an unchanged store reuse the encoded body
+    encoding = get_encoding()
+    if encoding:
+        data = compressed_cache.get((etag, request.full_path, encoding))
+        if data is not None:
+            return send_body(data, 'application/json', etag, encoding, {'X-Cache': 'HIT'})
+    data = serialized_cache.get((etag, request.full_path))
+    if data is not None:
+        return send_json_body(data, etag, encoding, 'HIT')
+
+    etag, body = build()
+    data = jsonify(body).get_data()
+    serialized_cache.put((etag, request.full_path), data)
+    return send_json_body(data, etag, encoding, 'MISS')
+
+def get_bbox_arg():
+    """Read ?bbox=minx,miny,maxx,maxy, raising ValueError if it is malformed"""
+    bbox = request.args.get('bbox')
+    return parse_bbox(bbox) if bbox is not None else None
 
 @app.route('/api/polygons', methods=['GET'])
 def get_polygons():
-    """Return all polygons"""
+    """Return polygons, honouring If-None-Match and optional filters
+
+    Query parameters:
+        bbox=minx,miny,maxx,maxy  only polygons intersecting the box
+        limit=N                   return at most N polygons
+        cursor=C                  continue from a previous page's next_cursor
+    """
+    try:
+        bbox = get_bbox_arg()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid bbox: {e}'}), 400
+
+    try:
+        limit = get_int_arg('limit', 1)
+        cursor = get_int_arg('cursor', 0) or 0
+    except ValueError as e:
+        return jsonify({'error': f'Invalid paging options: {e}'}), 400
+
+    def build():
+        etag, items, next_cursor = store.page(bbox=bbox, cursor=cursor, limit=limit)
+        body = {
+            'type': 'FeatureCollection',
+            'features': [feature for _, feature in items]
+        }
+        if next_cursor is not None:
+            body['next_cursor'] = str(next_cursor)
+        return etag, body
+
+    return send_cached_json(build)
+
+@app.route('/api/polygons/stats', methods=['GET'])
+def get_polygon_stats():
+    """Return the cached area, perimeter, centroid and bbox of the polygons
+
+    Areas are in square metres and perimeters in metres. Totals are summed
+    from values computed when each polygon was stored, so no geometry is
+    read.
+
+    Query parameters:
+        bbox=minx,miny,maxx,maxy  only polygons intersecting the box
+        summary=1                 return the totals without per-polygon values
+    """
+    try:
+        bbox = get_bbox_arg()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid bbox: {e}'}), 400
+    summary = get_flag('summary', False)
+
+    def build():
+        etag, ids, values = store.metrics(bbox)
+        boxes = values[:, MINX:]
+        filled = boxes[~np.isnan(boxes[:, 0])]
+        body = {
+            'count': len(ids),
+            'area': float(np.nansum(values[:, AREA])),
+            'perimeter': float(np.nansum(values[:, PERIMETER])),
+            'bbox': (filled[:, :2].min(axis=0).tolist() + filled[:, 2:].max(axis=0).tolist()
+                     if len(filled) else None),
+        }
+        if not summary:
+            # NaN marks values a geometry does not have; send them as null
+            rows = values.astype(object)
+            rows[np.isnan(values)] = None
+            body['features'] = [
+                {'id': feature_id, 'area': row[AREA], 'perimeter': row[PERIMETER],
+                 'centroid': None if row[CENTROID_X] is None else row[CENTROID_X:CENTROID_Y + 1],
+                 'bbox': None if row[MINX] is None else row[MINX:]}
+                for feature_id, row in zip(ids, rows.tolist())
+            ]
+        return etag, body
+
+    return send_cached_json(build)
+
+@app.route('/api/polygons/changes', methods=['GET'])
+def get_changes():
+    """Return the changes made after ?since=<revision>
+
+    When the changelog no longer covers that revision the response sets
+    "resync": true and the client should reload /api/polygons.
+    """
+    try:
+        since = get_int_arg('since', 0)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid revision: {e}'}), 400
+    if since is None:
+        return jsonify({'error': 'since is required'}), 400
+
+    revision, changes = store.changes_since(since)
+    if changes is None:
+        return jsonify({'revision': revision, 'resync': True, 'changes': []})
+
     return jsonify({
-        'type': 'FeatureCollection',
-        'features': polygons
+        'revision': revision,
+        'resync': False,
+        'changes': [
+            {'revision': rev, 'op': op, 'id': feature_id, 'feature': feature}
+            for rev, op, feature_id, feature in changes
+        ]
     })
 
 @app.route('/api/polygons', methods=['POST'])
 def add_polygon():
-    """Add a new polygon"""
-    data = request.json
-    polygons.append(data)
-    return jsonify({'success': True, 'count': len(polygons)})
+    """Add a new polygon, optionally simplifying its geometry"""
+    try:
+        tolerance, method = get_simplify_options()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid simplification options: {e}'}), 400
+
+    try:
+        validate_feature(request.json)
+    except IngestError as e:
+        return jsonify({'error': f'Invalid GeoJSON: {e}'}), 400
+
+    data, removed = simplify_feature(request.json, tolerance, method)
+    feature_id = store.add(data)
+    return jsonify({
+        'success': True,
+        'id': feature_id,
+        'count': len(store),
+        'vertices_removed': removed
+    })
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """Answer oversized uploads with a JSON error like the other API errors"""
+    limit = app.config['MAX_CONTENT_LENGTH']
+    return jsonify({'error': f'Request body larger than {limit} bytes'}), 413
+
+@app.route('/api/polygons/batch', methods=['POST'])
+def add_polygons_batch():
+    """Add many polygons from a FeatureCollection or GeoJSON text sequence
+
+    The response lists the new ids and, in the same order, the vertices
+    simplification removed from each feature.
+    """
+    try:
+        tolerance, method = get_simplify_options()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid simplification options: {e}'}), 400
+
+    try:
+        features = read_features(request.stream, request.mimetype)
+    except IngestError as e:
+        return jsonify({'error': f'Invalid GeoJSON: {e}'}), 400
+
+    # Vertices removed from each feature, in the order of ids
+    removed = [0] * len(features)
+    if tolerance:
+        for i, feature in enumerate(features):
+            features[i], removed[i] = simplify_feature(feature, tolerance, method)
+
+    ids = store.add_many(features)
+    return jsonify({
+        'success': True,
+        'added': len(features),
+        'ids': ids,
+        'count': len(store),
+        'vertices_removed': sum(removed),
+        'vertices_removed_per_feature': removed
+    })
+
+@app.route('/api/polygons/<int:feature_id>', methods=['GET'])
+def get_polygon(feature_id):
+    """Return a single polygon by id"""
+    feature = store.get(feature_id)
+    if feature is None:
+        return jsonify({'error': 'Polygon not found'}), 404
+    return jsonify(feature)
+
+@app.route('/api/polygons/<int:feature_id>', methods=['PATCH'])
+def update_polygon(feature_id):
+    """Update a polygon's geometry and/or properties
+
+    A new geometry replaces the old one. Properties are merged, and a
+    property set to null is removed.
+    """
+    try:
+        tolerance, method = get_simplify_options()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid simplification options: {e}'}), 400
+
+    changes = request.json
+    feature = store.get(feature_id)
+    if feature is None:
+        return jsonify({'error': 'Polygon not found'}), 404
+    if not isinstance(changes, dict):
+        return jsonify({'error': 'Invalid GeoJSON: expected an object'}), 400
+
+    feature = dict(feature)
+    if 'geometry' in changes:
+        feature['geometry'] = changes['geometry']
+    if isinstance(changes.get('properties'), dict):
+        properties = dict(feature.get('properties') or {})
+        for key, value in changes['properties'].items():
+            if value is None:
+                properties.pop(key, None)
+            else:
+                properties[key] = value
+        feature['properties'] = properties
+
+    try:
+        validate_feature(feature)
+    except IngestError as e:
+        return jsonify({'error': f'Invalid GeoJSON: {e}'}), 400
+
+    feature, removed = simplify_feature(feature, tolerance, method)
+    if not store.update(feature_id, feature):
+        return jsonify({'error': 'Polygon not found'}), 404
+    return jsonify({'success': True, 'id': feature_id, 'vertices_removed': removed})
+
+@app.route('/api/polygons/<int:feature_id>', methods=['DELETE'])
+def delete_polygon(feature_id):
+    """Delete a single polygon by id"""
+    if not store.delete(feature_id):
+        return jsonify({'error': 'Polygon not found'}), 404
+    return jsonify({'success': True, 'count': len(store)})
+
+@app.route('/api/contains', methods=['GET'])
+def find_containing():
+    """Return the polygons containing the point ?lng=&lat= as a FeatureCollection"""
+    try:
+        points = as_points([[float(request.args['lng']), float(request.args['lat'])]])
+    except KeyError as e:
+        return jsonify({'error': f'Invalid point: {e.args[0]} is required'}), 400
+    except ValueError as e:
+        return jsonify({'error': f'Invalid point: {e}'}), 400
+
+    _, ids = store.locate(points)
+    features = [feature for feature in map(store.get, ids.tolist()) if feature is not None]
+    return jsonify({'type': 'FeatureCollection', 'features': features})
+
+@app.route('/api/contains', methods=['POST'])
+def locate_points():
+    """Match many points against the stored polygons
+
+    The body is a JSON list of [lng, lat] pairs (or {"points": [...]}), or
+    packed little-endian float64 lng/lat pairs sent as
+    application/octet-stream. The response lists a [point index, polygon
+    id] pair for every point inside a polygon, ordered by point.
+    """
+    try:
+        if request.mimetype == 'application/octet-stream':
+            data = request.get_data()
+            if len(data) % 16:
+                raise ValueError('binary points must be pairs of float64 values')
+            points = as_points(np.frombuffer(data, dtype='<f8').reshape(-1, 2))
+        else:
+            body = request.get_json(silent=True)
+            if isinstance(body, dict):
+                body = body.get('points')
+            if body is None:
+                raise ValueError('expected a JSON list of [lng, lat] pairs')
+            points = as_points(body)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid points: {e}'}), 400
+
+    point_indices, ids = store.locate(points)
+    return jsonify({
+        'count': len(points),
+        'matched': len(np.unique(point_indices)),
+        'matches': np.column_stack((point_indices, ids)),
+    })
 
 @app.route('/api/polygons', methods=['DELETE'])
 def clear_polygons():
     """Clear all polygons"""
-    global polygons
-    polygons = []
+    store.clear()
     return jsonify({'success': True})
 
 @app.route('/api/export', methods=['GET'])
 def export_geojson():
-    """Export polygons as GeoJSON file"""
-    if not polygons:
+    """Stream polygons as a file download
+
+    Query parameters:
+        format=   geojson (default), geojsonseq, topojson, fgb (FlatGeobuf)
+                  or parquet (GeoParquet)
+        pretty=1  indent the output (geojson and topojson)
+        metrics=1 add area_m2, perimeter_m, centroid_lng and centroid_lat
+                  properties from the cached metrics
+        dissolve=1      merge overlapping and touching polygons into a
+                  single MultiPolygon (needs shapely)
+        dissolve_by=P   dissolve into one MultiPolygon per value of
+                  property P
+        quantization=N  TopoJSON grid steps across the extent, 0 to keep
+                  full precision (default from the server config)
+        save=0    skip writing a copy to the 'output' folder
+
+    Clients accepting gzip, br or zstd get a compressed body. Serialized
+    and compressed bodies are kept until the store changes, so repeated
+    downloads skip encoding.
+    """
+    snapshot = store.snapshot()
+    if not snapshot:
         return jsonify({'error': 'No polygons to export'}), 400
 
-    feature_collection = {
-        'type': 'FeatureCollection',
-        'features': polygons
-    }
-
-    # Get the directory where the executable/script is located
-    if getattr(sys, 'frozen', False):
-        # Running as compiled executable
-        base_dir = os.path.dirname(sys.executable)
+    fmt = request.args.get('format', 'geojson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Invalid export options: unknown format {fmt!r}'}), 400
+    extension, mimetype, _ = EXPORT_FORMATS[fmt]
+    pretty = get_flag('pretty', False)
+    save = get_flag('save', True)
+    with_metrics = get_flag('metrics', False)
+    dissolve_by = request.args.get('dissolve_by')
+    dissolved = get_flag('dissolve', False) or dissolve_by is not None
+    if dissolved and not dissolve_available():
+        return jsonify({'error': 'Invalid export options: dissolve requires shapely'}), 400
+    if dissolved and with_metrics:
+        return jsonify({'error': 'Invalid export options: metrics cannot be combined '
+                                 'with dissolve'}), 400
+    quantization = None
+    if fmt == 'topojson':
+        try:
+            quantization = get_int_arg('quantization', 0)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid export options: {e}'}), 400
+        if quantization is None:
+            quantization = app.config['TOPOJSON_QUANTIZATION']
+
+    encoding = None if fmt in PRECOMPRESSED_FORMATS else get_encoding()
+    cache_key = (snapshot.etag, 'export', fmt, pretty, quantization, with_metrics,
+                 dissolved, dissolve_by)
+    body = compressed_cache.get(cache_key + (encoding,)) if encoding else None
+    cache_status = 'HIT'
+    if body is not None:
+        # Decode the cached body again for the saved copy
+        chunks = [decompress(body, encoding)] if save else []
     else:
-        # Running as script
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Create output directory if it doesn't exist
-    output_dir = os.path.join(base_dir, 'output')
-    os.makedirs(output_dir, exist_ok=True)
+        data = serialized_cache.get(cache_key)
+        if data is not None:
+            chunks = [data]
+        else:
+            features = snapshot.features.with_metrics() if with_metrics else snapshot.features
+            if dissolved:
+                features = dissolve(features, dissolve_by)
+            try:
+                chunks = iter_export(features, fmt, pretty=pretty,
+                                     quantization=quantization)
+            except ExportError as e:
+                return jsonify({'error': f'Invalid export options: {e}'}), 400
+            chunks = serialized_cache.collect(cache_key, chunks)
+            cache_status = 'MISS'
 
     # Generate filename with timestamp
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = os.path.join(output_dir, f'polygons_{timestamp}.geojson')
+    filename = f'polygons_{timestamp}.{extension}'
+    headers = {'Content-Disposition': f'attachment; filename={filename}', 'X-Cache': cache_status}
+
+    if save:
+        # Create output directory if it doesn't exist
+        output_dir = get_data_dir('output')
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Save a copy to file while streaming the response
+        chunks = tee_to_file(chunks, os.path.join(output_dir, filename))
+
+    if not encoding:
+        return send_body(chunks, mimetype, snapshot.etag, None, headers)
+    if body is None:
+        # Compress as the chunks go out, caching the body once it is complete
+        body = compressed_cache.collect(cache_key + (encoding,), iter_compressed(chunks, encoding))
+    else:
+        # Finish writing the saved copy
+        for _ in chunks:
+            pass
+    return send_body(body, mimetype, snapshot.etag, encoding, headers)
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """Report hit and miss counters of the response caches"""
+    return jsonify({
+        'serialized': serialized_cache.stats(),
+        'compressed': compressed_cache.stats(),
+    })
 
-    # Save to file
-    with open(filename, 'w') as f:
-        json.dump(feature_collection, f, indent=2)
+@app.route('/api/profiling', methods=['GET'])
+def get_profiling():
+    """Report the profiling settings and the kept profiles, slowest first"""
+    return jsonify({
+        **request_profiler.settings(),
+        'profiles': [p.summary() for p in request_profiler.profiles()],
+    })
 
-    return send_file(filename, as_attachment=True)
+@app.route('/api/profiling', methods=['PATCH'])
+def configure_profiling():
+    """Change sample_rate (0 to 1), keep and allow_header at runtime"""
+    options = request.get_json(silent=True)
+    if not isinstance(options, dict):
+        return jsonify({'error': 'Invalid profiling options: expected a JSON object'}), 400
+    try:
+        request_profiler.configure(options.get('sample_rate'), options.get('keep'),
+                                   options.get('allow_header'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid profiling options: {e}'}), 400
+    return jsonify(request_profiler.settings())
+
+@app.route('/api/profiling', methods=['DELETE'])
+def clear_profiles():
+    """Drop the kept profiles"""
+    request_profiler.clear()
+    return jsonify({'success': True})
 
-def open_browser():
+@app.route('/api/profiling/<int:profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Download a kept profile
+
+    Query parameters:
+        format=   pstats (default; open with pstats, snakeviz or
+                  gprof2dot), folded (flamegraph.pl, speedscope,
+                  inferno) or text (a pstats report)
+        sort=     sort key of the text report (default cumulative)
+    """
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+
+    fmt = request.args.get('format', 'pstats')
+    if fmt == 'pstats':
+        data, mimetype, extension = profile.pstats_bytes(), 'application/octet-stream', 'pstats'
+    elif fmt == 'folded':
+        data, mimetype, extension = profile.folded(), 'text/plain', 'folded'
+    elif fmt == 'text':
+        try:
+            return Response(profile.text(request.args.get('sort', 'cumulative')),
+                            mimetype='text/plain')
+        except KeyError as e:
+            return jsonify({'error': f'Invalid profile options: unknown sort key {e}'}), 400
+    else:
+        return jsonify({'error': f'Invalid profile options: unknown format {fmt!r}'}), 400
+    return Response(data, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=profile_{profile_id}.{extension}'})
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.pbf', methods=['GET'])
+def get_tile(z, x, y):
+    """Return stored polygons as a Mapbox Vector Tile"""
+    if z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({'error': 'Tile out of range'}), 404
+
+    key = (z, x, y)
+    data = tile_cache.get(key)
+    if data is None:
+        generation = tile_cache.generation
+        bbox = tile_bbox(z, x, y)
+        data = encode_tile(store.items_in_bbox(bbox), z, x, y)
+        tile_cache.put(key, bbox, data, generation)
+
+    return Response(data, mimetype='application/vnd.mapbox-vector-tile')
+
+def open_browser(url):
     """Open the browser after a short delay"""
-    import time
+    import webbrowser
     time.sleep(1.5)
-    webbrowser.open('http://127.0.0.1:5000')
+    webbrowser.open(url)
+
+def report_startup_time():
+    """Serve the main page once and print how long each startup phase took"""
+    with app.test_client() as client:
+        client.get('/')
+    startup_marks.append(('first page', time.perf_counter()))
+    print(f"{'phase':<14}{'ms':>10}")
+    for (_, previous), (phase, mark) in zip(startup_marks, startup_marks[1:]):
+        print(f'{phase:<14}{(mark - previous) * 1000:>10.1f}')
+    print(f"{'total':<14}{(startup_marks[-1][1] - startup_marks[0][1]) * 1000:>10.1f}")
+
+def serve(host, port, workers, threads):
+    """Run the app under gunicorn with several worker processes"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit('Error: --serve needs gunicorn (pip install gunicorn)')
+
+    class PolygonMapperServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+
+        def load(self):
+            return app
+
+    PolygonMapperServer().run()
 
 if __name__ == '__main__':
-    # Create templates directory if it doesn't exist
-    os.makedirs('templates', exist_ok=True)
-    
-    # Create the HTML template
-    html_content = '''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Polygon Mapper</title>
-    <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css" />
-    <link rel="stylesheet" href="https://unpkg.com/leaflet-draw@1.0.4/dist/leaflet.draw.css" />
-    <link rel="stylesheet" href="https://unpkg.com/leaflet-freedraw@2.15.0/dist/leaflet-freedraw.css" />
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: #f5f5f5;
-        }
-
-        .header {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 20px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }
+    if cli_args.startup_time:
+        report_startup_time()
+        sys.exit(0)
 
-        .header h1 {
-            font-size: 28px;
-            margin-bottom: 10px;
-        }
+    url = f'http://{cli_args.host}:{cli_args.port}'
 
-        .header p {
-            opacity: 0.9;
-            font-size: 14px;
-        }
+    if cli_args.serve:
+        print("\n" + "="*60)
+        print("🗺️  POLYGON MAPPER - SERVING")
+        print("="*60)
+        print(f"\n✓ Listening on: {url}")
+        print(f"✓ Workers: {cli_args.workers} x {cli_args.threads} threads")
+        print(f"💾 Store: {getattr(store, 'path', 'memory')}")
+        print("\n" + "="*60 + "\n")
 
-        .container {
-            max-width: 1400px;
-            margin: 0 auto;
-            padding: 20px;
-        }
+        serve(cli_args.host, cli_args.port, cli_args.workers, cli_args.threads)
+        sys.exit(0)
 
-        .controls {
-            background: white;
-            padding: 20px;
-            border-radius: 10px;
-            margin-bottom: 20px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.05);
-        }
-
-        .instructions {
-            background: #e8f4f8;
-            border-left: 4px solid #3388ff;
-            padding: 15px;
-            border-radius: 5px;
-            margin-bottom: 15px;
-        }
-
-        .instructions h3 {
-            color: #2c3e50;
-            margin-bottom: 10px;
-            font-size: 16px;
-        }
-
-        .instructions ol {
-            margin-left: 20px;
-            color: #555;
-            font-size: 14px;
-            line-height: 1.8;
-        }
-
-        .button-group {
-            display: flex;
-            gap: 10px;
-            flex-wrap: wrap;
-        }
-
-        .btn {
-            padding: 12px 24px;
-            border: none;
-            border-radius: 6px;
-            font-size: 14px;
-            font-weight: 600;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            display: inline-flex;
-            align-items: center;
-            gap: 8px;
-        }
-
-        .btn:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-        }
-
-        .btn-primary {
-            background: #3388ff;
-            color: white;
-        }
-
-        .btn-success {
-            background: #28a745;
-            color: white;
-        }
-
-        .btn-warning {
-            background: #ffc107;
-            color: #333;
-        }
-
-        .btn:disabled {
-            opacity: 0.5;
-            cursor: not-allowed;
-        }
-
-        .btn:disabled:hover {
-            transform: none;
-            box-shadow: none;
-        }
-
-        #map {
-            height: 600px;
-            border-radius: 10px;
-            box-shadow: 0 2px 20px rgba(0,0,0,0.1);
-            border: 2px solid #ddd;
-        }
-
-        .status {
-            margin-top: 15px;
-            padding: 12px;
-            border-radius: 6px;
-            font-size: 14px;
-            display: none;
-        }
-
-        .status.success {
-            background: #d4edda;
-            color: #155724;
-            border: 1px solid #c3e6cb;
-            display: block;
-        }
-
-        .status.error {
-            background: #f8d7da;
-            color: #721c24;
-            border: 1px solid #f5c6cb;
-            display: block;
-        }
-
-        .status.info {
-            background: #d1ecf1;
-            color: #0c5460;
-            border: 1px solid #bee5eb;
-            display: block;
-        }
-
-        .counter {
-            background: #667eea;
-            color: white;
-            padding: 8px 16px;
-            border-radius: 20px;
-            font-weight: 600;
-            font-size: 14px;
-        }
-    </style>
-</head>
-<body>
-    <div class="header">
-        <div class="container">
-            <h1>Polygon Mapper</h1>
-            <p>Draw polygons on the map and export them as GeoJSON files</p>
-        </div>
-    </div>
-
-    <div class="container">
-        <div class="controls">
-            <div class="instructions">
-                <h3>How to Use:</h3>
-                <ol>
-                    <li><strong>Click-to-draw mode:</strong> Use the polygon tool in left toolbar, click to add vertices</li>
-                    <li><strong>Freehand mode:</strong> Click "Enable Freehand" below, then click and drag to draw</li>
-                    <li>Draw as many polygons as you need</li>
-                    <li>Click <strong>"Export GeoJSON"</strong> to download all polygons</li>
-                </ol>
-            </div>
-
-            <div class="button-group">
-                <button class="btn btn-primary" onclick="toggleFreehand()" id="freehandBtn">
-                    Enable Freehand
-                </button>
-                <button class="btn btn-success" onclick="exportGeoJSON()" id="exportBtn">
-                    Export GeoJSON
-                </button>
-                <button class="btn btn-warning" onclick="clearAll()">
-                    Clear All
-                </button>
-                <span class="counter" id="counter">Polygons: 0</span>
-            </div>
-
-            <div id="status" class="status"></div>
-        </div>
-
-        <div id="map"></div>
-    </div>
-
-    <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
-    <script src="https://unpkg.com/leaflet-draw@1.0.4/dist/leaflet.draw.js"></script>
-    <script src="https://unpkg.com/leaflet-freedraw@2.15.0/dist/leaflet-freedraw.web.js"></script>
-    <script>
-        // Initialize map
-        const map = L.map('map').setView([39.8283, -98.5795], 4);
-
-        // Add OpenStreetMap tiles
-        L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
-            attribution: '© OpenStreetMap contributors',
-            maxZoom: 19
-        }).addTo(map);
-
-        // Add regular Leaflet.Draw controls for click-to-draw polygons
-        const drawnItems = new L.FeatureGroup();
-        map.addLayer(drawnItems);
-
-        const drawControl = new L.Control.Draw({
-            draw: {
-                polygon: {
-                    shapeOptions: {
-                        color: '#3388ff',
-                        weight: 3
-                    }
-                },
-                polyline: false,
-                rectangle: false,
-                circle: false,
-                marker: false,
-                circlemarker: false
-            },
-            edit: {
-                featureGroup: drawnItems,
-                remove: true
-            }
-        });
-        map.addControl(drawControl);
-
-        // Add FreeDraw for freehand drawing
-        const freeDraw = new FreeDraw({
-            mode: FreeDraw.NONE,
-            smoothFactor: 0.5,
-            strokeWidth: 3
-        });
-        map.addLayer(freeDraw);
-
-        let polygonCount = 0;
-        let freehandMode = false;
-
-        // Handle regular polygon creation from Leaflet.Draw
-        map.on(L.Draw.Event.CREATED, function(event) {
-            const layer = event.layer;
-            drawnItems.addLayer(layer);
-
-            const geojson = layer.toGeoJSON();
-
-            fetch('/api/polygons', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(geojson)
-            })
-            .then(response => response.json())
-            .then(data => {
-                polygonCount = data.count;
-                updateCounter();
-                showStatus('Polygon ' + polygonCount + ' added successfully!', 'success');
-            });
-        });
-
-        // Handle FreeDraw polygon creation
-        freeDraw.on('markers', function(event) {
-            const polygons = freeDraw.all();
-
-            if (polygons.length > 0) {
-                const latestPolygon = polygons[polygons.length - 1];
-                const geojson = {
-                    type: 'Feature',
-                    properties: {},
-                    geometry: {
-                        type: 'Polygon',
-                        coordinates: [latestPolygon.map(point => [point.lng, point.lat])]
-                    }
-                };
-
-                fetch('/api/polygons', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(geojson)
-                })
-                .then(response => response.json())
-                .then(data => {
-                    polygonCount = data.count;
-                    updateCounter();
-                    showStatus('Freehand polygon ' + polygonCount + ' added successfully!', 'success');
-                });
-            }
-        });
-
-        // Handle polygon deletion from Leaflet.Draw
-        map.on(L.Draw.Event.DELETED, function(event) {
-            const layers = event.layers;
-            layers.eachLayer(function(layer) {
-                polygonCount--;
-            });
-            updateCounter();
-            showStatus('Polygon(s) deleted', 'info');
-        });
-
-        function toggleFreehand() {
-            freehandMode = !freehandMode;
-            const btn = document.getElementById('freehandBtn');
-
-            if (freehandMode) {
-                freeDraw.mode(FreeDraw.CREATE);
-                btn.textContent = 'Disable Freehand';
-                btn.classList.remove('btn-primary');
-                btn.classList.add('btn-warning');
-                showStatus('Freehand mode enabled - click and drag to draw', 'info');
-            } else {
-                freeDraw.mode(FreeDraw.NONE);
-                btn.textContent = 'Enable Freehand';
-                btn.classList.remove('btn-warning');
-                btn.classList.add('btn-primary');
-                showStatus('Freehand mode disabled', 'info');
-            }
-        }
-
-        function updateCounter() {
-            document.getElementById('counter').textContent = 'Polygons: ' + polygonCount;
-            document.getElementById('exportBtn').disabled = polygonCount === 0;
-        }
-
-        function showStatus(message, type) {
-            const status = document.getElementById('status');
-            status.textContent = message;
-            status.className = 'status ' + type;
-
-            setTimeout(function() {
-                status.className = 'status';
-            }, 5000);
-        }
-
-        function exportGeoJSON() {
-            if (polygonCount === 0) {
-                showStatus('No polygons to export. Draw some polygons first!', 'error');
-                return;
-            }
-
-            fetch('/api/export')
-                .then(function(response) {
-                    if (!response.ok) {
-                        throw new Error('Export failed');
-                    }
-                    return response.blob();
-                })
-                .then(function(blob) {
-                    const url = window.URL.createObjectURL(blob);
-                    const a = document.createElement('a');
-                    a.href = url;
-                    a.download = 'polygons_' + new Date().getTime() + '.geojson';
-                    document.body.appendChild(a);
-                    a.click();
-                    window.URL.revokeObjectURL(url);
-                    document.body.removeChild(a);
-                    showStatus('Exported ' + polygonCount + ' polygon(s) successfully!', 'success');
-                })
-                .catch(function(error) {
-                    showStatus('Export failed. Please try again.', 'error');
-                });
-        }
-
-        function clearAll() {
-            if (polygonCount === 0) {
-                showStatus('No polygons to clear', 'info');
-                return;
-            }
-
-            if (confirm('Are you sure you want to clear all ' + polygonCount + ' polygon(s)?')) {
-                // Clear Leaflet.Draw layers
-                drawnItems.clearLayers();
-
-                // Clear FreeDraw layers
-                freeDraw.clear();
-
-                fetch('/api/polygons', {
-                    method: 'DELETE'
-                })
-                .then(function(response) {
-                    return response.json();
-                })
-                .then(function(data) {
-                    polygonCount = 0;
-                    updateCounter();
-                    showStatus('All polygons cleared', 'success');
-                });
-            }
-        }
-
-        // Initialize counter
-        updateCounter();
-    </script>
-</body>
-</html>'''
-
-    # Write HTML template
-    with open('templates/index.html', 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
     # Start browser in a separate thread
-    threading.Thread(target=open_browser, daemon=True).start()
+    import threading
+    threading.Thread(target=open_browser, args=(url,), daemon=True).start()
     
     print("\n" + "="*60)
     print("🗺️  POLYGON MAPPER - STARTING")
     print("="*60)
-    print("\n✓ Server starting at: http://127.0.0.1:5000")
+    print(f"\n✓ Server starting at: {url}")
     print("✓ Browser will open automatically...")
     print("\n📁 Exported files will be saved in the 'output' folder")
+    print("💾 Polygons are kept in the 'data' folder between restarts")
     print("\n⚠️  Press CTRL+C to stop the server\n")
     print("="*60 + "\n")
     
     # Run Flask app
-    app.run(debug=False, port=5000)
\ No newline at end of file
+    app.run(debug=False, host=cli_args.host, port=cli_args.port)
\ No newline at end of file
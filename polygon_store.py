@@ -0,0 +1,746 @@
+"""
+Polygon Mapper - Polygon Storage
+Keeps drawn features in memory or in a durable append-only log
+"""
+
+import os
+import sqlite3
+import threading
+import weakref
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
+from itertools import takewhile
+
+import numpy as np
+
+from columnar import FeatureSequence, FeatureTable
+from geometry import union_bbox
+from json_codec import dumps_text, loads
+from point_in_polygon import locate
+from spatial_index import RTree
+
+
+class Snapshot:
+    """Immutable view of the store contents at one revision"""
+
+    __slots__ = ('etag', 'revision', 'ids', 'features')
+
+    def __init__(self, etag, revision, ids, features):
+        self.etag = etag
+        self.revision = revision
+        self.ids = ids
+        self.features = features
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class MemoryStore:
+    """
+    Keep features in memory only (lost when the server stops).
+
+    Writers serialize on a lock. Readers work from an immutable Snapshot
+    that is built once per revision, so long reads such as exports never
+    block writers and never see a half-applied mutation. Geometries live
+    in append-only columnar buffers (see columnar.FeatureTable), so a
+    snapshot only has to copy row numbers, and features are built as
+    GeoJSON when they are read.
+    """
+
+    def __init__(self, changelog_size=10000):
+        self._features = FeatureTable()
+        self._snapshot = Snapshot(None, -1, (), ())
+        self._index = RTree()
+        self._next_id = 1
+        self._revision = 0
+        self._changes = deque(maxlen=changelog_size)
+        self._changes_floor = 0
+        self._lock = threading.RLock()
+        self._listeners = []
+        self.epoch = os.urandom(4).hex()
+
+    def __len__(self):
+        self._refresh()
+        return len(self._features)
+
+    @property
+    def revision(self):
+        """Counter bumped by every mutation"""
+        self._refresh()
+        return self._revision
+
+    @property
+    def etag(self):
+        """Identifier of the current store contents, unique across restarts"""
+        self._refresh()
+        return f'{self.epoch}-{self._revision}'
+
+    def _refresh(self):
+        """Pick up changes made outside this process (nothing to do in memory)"""
+
+    def snapshot(self):
+        """Return a Snapshot of the current contents
+
+        Only the first read after a mutation takes the lock, to copy the
+        id and row references; later reads share that snapshot.
+        """
+        self._refresh()
+        snapshot = self._snapshot
+        if snapshot.revision == self._revision:
+            return snapshot
+        with self._lock:
+            if self._snapshot.revision != self._revision:
+                features = self._features.view()
+                self._snapshot = Snapshot(self.etag, self._revision,
+                                          features.ids, features)
+            return self._snapshot
+
+    def page(self, bbox=None, cursor=0, limit=None):
+        """Return (etag, [(id, feature)], next_cursor) for features after cursor
+
+        Features are returned in insertion order, optionally restricted to
+        those intersecting bbox. next_cursor is None on the last page.
+        """
+        self._refresh()
+        if bbox is None:
+            snapshot = self.snapshot()
+            etag = snapshot.etag
+            start = bisect_right(snapshot.ids, cursor)
+            end = len(snapshot) if limit is None else start + limit
+            items = list(zip(snapshot.ids[start:end], snapshot.features[start:end]))
+            more = end < len(snapshot)
+        else:
+            with self._lock:
+                etag = self.etag
+                ids = sorted(self._index.search(bbox))
+                start = bisect_right(ids, cursor)
+                end = len(ids) if limit is None else start + limit
+                columns, rows = self._features.rows(ids[start:end])
+                more = end < len(ids)
+            # Rows are never modified, so features are built without the lock
+            items = list(zip(ids[start:end], FeatureSequence(ids[start:end], rows, columns)))
+
+        next_cursor = items[-1][0] if more and items else None
+        return etag, items, next_cursor
+
+    def changes_since(self, since):
+        """Return (revision, changes) for every mutation after revision since
+
+        Each change is a (revision, op, id, feature) tuple. changes is None
+        when the changelog no longer reaches back to since, in which case
+        the caller has to reload the whole store.
+        """
+        self._refresh()
+        with self._lock:
+            floor = self._changes_floor
+            if len(self._changes) == self._changes.maxlen:
+                # The oldest revision may have been partly rolled off
+                floor = max(floor, self._changes[0][0])
+            if since < floor or since > self._revision:
+                return self._revision, None
+            changes = list(takewhile(lambda c: c[0] > since, reversed(self._changes)))
+            changes.reverse()
+            return self._revision, changes
+
+    def features(self):
+        """Return all stored features in insertion order as an immutable sequence"""
+        return self.snapshot().features
+
+    def query_bbox(self, bbox):
+        """Return the features whose bounding box intersects bbox, in insertion order"""
+        return [feature for _, feature in self.items_in_bbox(bbox)]
+
+    def items_in_bbox(self, bbox):
+        """Return (id, feature) pairs whose bounding box intersects bbox"""
+        self._refresh()
+        with self._lock:
+            ids = sorted(self._index.search(bbox))
+            columns, rows = self._features.rows(ids)
+        return list(zip(ids, FeatureSequence(ids, rows, columns)))
+
+    def metrics(self, bbox=None):
+        """Return (etag, ids, metrics) for all features or those intersecting bbox
+
+        metrics holds one row of cached values per id, laid out as
+        described in metrics.py, so no geometry is read.
+        """
+        if bbox is None:
+            snapshot = self.snapshot()
+            return snapshot.etag, snapshot.ids, snapshot.features.metrics()
+        self._refresh()
+        with self._lock:
+            etag = self.etag
+            ids = sorted(self._index.search(bbox))
+            columns, rows = self._features.rows(ids)
+        return etag, ids, columns.metrics[np.asarray(rows, dtype=np.int64)]
+
+    def locate(self, points):
+        """Return (point indices, feature ids) pairing points with the polygons containing them
+
+        points is an (n, 2) array of lng/lat positions. Only polygons whose
+        bounding box meets the points' extent are tested.
+        """
+        self._refresh()
+        if not len(points):
+            return locate(points, None, (), (), ())
+        bbox = tuple(points.min(axis=0).tolist() + points.max(axis=0).tolist())
+        with self._lock:
+            entries = sorted(self._index.search_entries(bbox), key=lambda e: e[1])
+            ids = [item_id for _, item_id in entries]
+            columns, rows = self._features.rows(ids)
+        return locate(points, columns, ids, rows, [b for b, _ in entries])
+
+    def subscribe(self, callback):
+        """Call callback(bbox) after every mutation with the area it touched
+
+        bbox is None when the whole store changed (it was cleared or
+        reloaded); mutations of features without geometry touch no area
+        and are not reported.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, bbox):
+        for callback in self._listeners:
+            callback(bbox)
+
+    def _notify_area(self, boxes):
+        """Notify listeners of the area covered by boxes (None for empty geometries)
+
+        Nobody is told about changes that touched no area, as None would
+        mean the whole store changed. Cached responses are keyed by ETag,
+        so they never outlive the revision they were built for.
+        """
+        bbox = union_bbox(b for b in boxes if b is not None)
+        if bbox is not None:
+            self._notify(bbox)
+
+    def get(self, feature_id):
+        """Return the feature with the given id, or None"""
+        self._refresh()
+        return self._features.get(feature_id)
+
+    def add(self, feature):
+        """Store a single feature and return its id"""
+        return self.add_many([feature])[0]
+
+    def add_many(self, features):
+        """Store several features in one operation and return their ids
+
+        Each stored feature gets its server-assigned id as its "id" member.
+        """
+        features = list(features)
+        if not features:
+            return []
+        with self._lock:
+            # Large batches are cheaper to index by repacking the whole tree
+            repack = len(features) > max(len(self._features), 1000)
+
+            ids = list(range(self._next_id, self._next_id + len(features)))
+            features = [dict(feature, id=feature_id) for feature_id, feature in zip(ids, features)]
+            # The revision and changelog only move once the features are stored
+            self._features.insert_many(zip(ids, features))
+            self._next_id += len(ids)
+            self._revision += 1
+            records = []
+            for feature_id, feature in zip(ids, features):
+                self._changes.append((self._revision, 'insert', feature_id, feature))
+                records.append({'op': 'add', 'rev': self._revision, 'id': feature_id,
+                                'feature': feature})
+            if repack:
+                self._rebuild_index()
+                boxes = [b for _, b in self._features.bboxes(ids)]
+            else:
+                boxes = [self._index_feature(feature_id) for feature_id in ids]
+            self._record(records)
+            self._notify_area(boxes)
+            return ids
+
+    def update(self, feature_id, feature):
+        """Replace the feature with the given id; returns False if it does not exist"""
+        with self._lock:
+            if feature_id not in self._features:
+                return False
+            old_bbox = self._features.bbox(feature_id)
+            feature = dict(feature, id=feature_id)
+            self._features[feature_id] = feature
+            self._revision += 1
+            self._index.delete(feature_id)
+            new_bbox = self._index_feature(feature_id)
+            self._changes.append((self._revision, 'update', feature_id, feature))
+            self._record([{'op': 'update', 'rev': self._revision, 'id': feature_id,
+                           'feature': feature}])
+            self._notify_area((old_bbox, new_bbox))
+            return True
+
+    def delete(self, feature_id):
+        """Remove the feature with the given id; returns False if it does not exist"""
+        with self._lock:
+            if feature_id not in self._features:
+                return False
+            old_bbox = self._features.bbox(feature_id)
+            self._features.remove(feature_id)
+            self._revision += 1
+            self._index.delete(feature_id)
+            self._changes.append((self._revision, 'delete', feature_id, None))
+            self._record([{'op': 'delete', 'rev': self._revision, 'id': feature_id}])
+            self._notify_area((old_bbox,))
+            return True
+
+    def clear(self):
+        """Remove every stored feature"""
+        with self._lock:
+            self._revision += 1
+            self._features = FeatureTable()
+            self._index.clear()
+            self._changes.append((self._revision, 'clear', None, None))
+            self._record([{'op': 'clear', 'rev': self._revision}])
+            self._notify(None)
+
+    def close(self):
+        """Release any resources held by the store"""
+
+    def _index_feature(self, feature_id):
+        """Index a stored feature by its cached bounding box and return the box"""
+        bbox = self._features.bbox(feature_id)
+        if bbox is not None:
+            self._index.insert(feature_id, bbox)
+        return bbox
+
+    def _rebuild_index(self):
+        """Bulk load the spatial index from the stored features"""
+        self._index.bulk_load((i, b) for i, b in self._features.bboxes() if b is not None)
+
+    def _record(self, records):
+        """Persist mutation records (no-op for the memory store)"""
+
+
+# Open stores with threads or connections to restore in forked children,
+# such as the workers gunicorn forks after the app has been loaded
+_open_stores = weakref.WeakSet()
+
+
+def _reopen_after_fork():
+    for store in list(_open_stores):
+        store._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+class AppendLogStore(MemoryStore):
+    """
+    Durable store backed by an append-only log of JSON lines.
+
+    Every mutation is appended to the log and fsynced in batches by a
+    background thread. The log is replayed on startup and rewritten in
+    the background once it holds mostly superseded records.
+    """
+
+    def __init__(self, path, fsync_interval=0.05, compact_min_records=10000,
+                 compact_ratio=2.0, changelog_size=10000):
+        super().__init__(changelog_size)
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.compact_min_records = compact_min_records
+        self.compact_ratio = compact_ratio
+
+        self._io_lock = threading.Lock()
+        self._log_records = 0
+        self._pending = None
+        self._compactor = None
+        self._dirty = threading.Event()
+        self._closed = threading.Event()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        has_epoch = self._replay()
+        self._changes_floor = self._revision
+        self._file = open(path, 'a', encoding='utf-8')
+        if not has_epoch:
+            # Remember the epoch so ETags stay valid across restarts
+            self._file.write(self._encode(self._meta()))
+            self._file.flush()
+            self._log_records += 1
+
+        self._start_flusher()
+        _open_stores.add(self)
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def _after_fork(self):
+        """Restart the flusher, as threads do not survive a fork"""
+        # Locks may have been held by threads of the parent
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()
+        self._pending = None
+        self._compactor = None
+        self._start_flusher()
+
+    def _replay(self):
+        """Rebuild the in-memory state from the log file"""
+        if not os.path.exists(self.path):
+            return False
+
+        features = self._features
+        good_offset = 0
+        has_epoch = False
+        # Runs of adds are written to the columns in one batch
+        added = []
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = loads(line)
+                except ValueError:
+                    break
+                op = record['op']
+                self._revision = max(self._revision, record.get('rev', 0))
+                if op == 'add':
+                    added.append((record['id'], dict(record['feature'], id=record['id'])))
+                    self._next_id = max(self._next_id, record['id'] + 1)
+                    good_offset += len(line)
+                    self._log_records += 1
+                    continue
+                if added:
+                    features.insert_many(added)
+                    added = []
+                if op == 'update':
+                    if record['id'] in features:
+                        features[record['id']] = record['feature']
+                elif op == 'delete':
+                    features.remove(record['id'])
+                elif op == 'clear':
+                    features = self._features = FeatureTable()
+                elif op == 'meta':
+                    self._next_id = max(self._next_id, record['next_id'])
+                    self._revision = max(self._revision, record.get('revision', 0))
+                    self.epoch = record.get('epoch', self.epoch)
+                    has_epoch = 'epoch' in record
+                good_offset += len(line)
+                self._log_records += 1
+        if added:
+            features.insert_many(added)
+
+        # Drop a partially written record left behind by a crash
+        if good_offset != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_offset)
+
+        self._rebuild_index()
+        return has_epoch
+
+    def _meta(self):
+        return {'op': 'meta', 'epoch': self.epoch, 'next_id': self._next_id,
+                'revision': self._revision}
+
+    def _encode(self, record):
+        return dumps_text(record) + '\n'
+
+    def _record(self, records):
+        """Append mutation records to the log (caller holds the lock)"""
+        data = ''.join(self._encode(record) for record in records)
+        with self._io_lock:
+            self._file.write(data)
+            self._file.flush()
+        if self._pending is not None:
+            self._pending.append(data)
+        self._log_records += len(records)
+        self._dirty.set()
+        self._maybe_compact()
+
+    def _flush_loop(self):
+        """Fsync the log in batches instead of once per write"""
+        while not self._closed.is_set():
+            self._dirty.wait()
+            self._closed.wait(self.fsync_interval)
+            self._dirty.clear()
+            self.sync()
+
+    def sync(self):
+        """Force everything written so far to disk"""
+        with self._io_lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def _maybe_compact(self):
+        """Start a background compaction once the log is mostly garbage"""
+        if self._compactor is not None or self._log_records < self.compact_min_records:
+            return
+        if self._log_records < self.compact_ratio * max(len(self._features), 1):
+            return
+        self._compactor = threading.Thread(target=self.compact, daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        """Rewrite the log so it only holds the live features"""
+        with self._lock:
+            live = self._features.view()
+            meta = self._meta()
+            self._pending = []
+
+        # Write the snapshot without blocking writers
+        tmp_path = self.path + '.compact'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self._encode(meta))
+                for feature_id, feature in zip(live.ids, live):
+                    f.write(self._encode({'op': 'add', 'id': feature_id, 'feature': feature}))
+
+                # Catch up with records appended while the snapshot was written
+                with self._lock:
+                    pending = self._pending
+                    f.write(''.join(pending))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                    with self._io_lock:
+                        self._file.close()
+                        os.replace(tmp_path, self.path)
+                        self._file = open(self.path, 'a', encoding='utf-8')
+                    self._log_records = 1 + len(live) + sum(p.count('\n') for p in pending)
+        finally:
+            with self._lock:
+                self._pending = None
+                self._compactor = None
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def close(self):
+        """Stop the background flusher and sync the log"""
+        _open_stores.discard(self)
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        self._closed.set()
+        self._dirty.set()
+        self._flusher.join()
+        self.sync()
+        with self._io_lock:
+            self._file.close()
+
+
+class SqliteStore(MemoryStore):
+    """
+    Store shared by several processes through a SQLite database in WAL mode.
+
+    Each process keeps the usual in-memory state for fast reads and
+    catches up with other processes' writes through a shared changes
+    table, checked cheaply with PRAGMA data_version on a separate read
+    connection, so reads do not wait for the lock writers hold through
+    their transaction. Writes run in an IMMEDIATE transaction, so
+    revisions are assigned in one global order.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS features (id INTEGER PRIMARY KEY, feature TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            rev INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            id INTEGER,
+            feature TEXT
+        );
+        CREATE INDEX IF NOT EXISTS changes_rev ON changes (rev);
+    """
+
+    def __init__(self, path, changelog_size=10000):
+        super().__init__(changelog_size)
+        self.path = path
+        self._conn = None
+        self._reader = None
+        self._data_version = None
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connect()
+        _open_stores.add(self)
+
+    def _connect(self):
+        """Open this process's connections and load the current contents"""
+        self._lock = threading.RLock()
+        self._reader_lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, isolation_level=None,
+                                     check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # WAL with synchronous=NORMAL only fsyncs at checkpoints
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('epoch', ?)", (self.epoch,))
+        # Only used to poll data_version, which never waits for writers in WAL mode
+        self._reader = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._load()
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def _meta(self, key, default=None):
+        row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _load(self):
+        """Reload every feature from the database"""
+        with self._lock:
+            self.epoch = self._meta('epoch')
+            self._revision = int(self._meta('revision', 0))
+            self._next_id = int(self._meta('next_id', 1))
+            self._features = FeatureTable()
+            self._features.insert_many(
+                (feature_id, loads(text))
+                for feature_id, text in self._conn.execute(
+                    'SELECT id, feature FROM features ORDER BY id'))
+            self._rebuild_index()
+            self._changes.clear()
+            self._changes_floor = self._revision
+            self._data_version = self._read_version()
+            self._notify(None)
+
+    def _after_fork(self):
+        """Open connections of this process, as SQLite ones must not cross a fork"""
+        self._connect()
+
+    def _read_version(self):
+        """Return the read connection's data_version, which changes with every commit"""
+        with self._reader_lock:
+            return self._reader.execute('PRAGMA data_version').fetchone()[0]
+
+    def _refresh(self, force=False):
+        """Apply writes committed by other processes since the last check"""
+        version = self._read_version()
+        if version == self._data_version and not force:
+            return
+        if not self._lock.acquire(blocking=force):
+            # A writer in this process holds the lock and catches up inside
+            # its own transaction; serve the current state meanwhile
+            return
+        try:
+            self._data_version = version
+
+            revision = int(self._meta('revision', 0))
+            if revision <= self._revision:
+                return
+            oldest = self._conn.execute('SELECT min(rev) FROM changes').fetchone()[0]
+            if oldest is None or oldest > self._revision + 1:
+                # The shared changelog was pruned past our revision
+                self._load()
+                return
+
+            rows = self._conn.execute(
+                'SELECT rev, op, id, feature FROM changes WHERE rev > ? ORDER BY seq',
+                (self._revision,)).fetchall()
+            self._apply(rows)
+            self._next_id = max(self._next_id, int(self._meta('next_id', 1)))
+        finally:
+            self._lock.release()
+
+    def _apply(self, rows):
+        """Apply change rows written by another process to the in-memory state"""
+        boxes = []
+        whole_store = False
+        for rev, op, feature_id, text in rows:
+            feature = loads(text) if text is not None else None
+            if op == 'clear':
+                self._features = FeatureTable()
+                self._index.clear()
+                whole_store = True
+            else:
+                if feature_id in self._features:
+                    boxes.append(self._features.bbox(feature_id))
+                    self._index.delete(feature_id)
+                    if op == 'delete':
+                        self._features.remove(feature_id)
+                if feature is not None:
+                    # Updates replace the feature in place, keeping ids in order
+                    self._features[feature_id] = feature
+                    boxes.append(self._index_feature(feature_id))
+            self._changes.append((rev, 'insert' if op == 'add' else op, feature_id, feature))
+            self._revision = rev
+
+        if whole_store:
+            self._notify(None)
+        else:
+            self._notify_area(boxes)
+
+    @contextmanager
+    def _write(self):
+        """Run a mutation inside a transaction, after catching up with other writers"""
+        with self._lock:
+            try:
+                with self._transaction():
+                    self._refresh(force=True)
+                    yield
+                    self._conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', [
+                        ('revision', str(self._revision)),
+                        ('next_id', str(self._next_id)),
+                    ])
+                    if self._revision % 100 == 0:
+                        self._prune()
+            except BaseException:
+                # The in-memory state may hold the rolled back mutation
+                self._load()
+                raise
+
+    def _prune(self):
+        """Drop the oldest whole revisions from the shared changes table"""
+        row = self._conn.execute(
+            'SELECT rev FROM changes ORDER BY seq DESC LIMIT 1 OFFSET ?',
+            (self._changes.maxlen,)).fetchone()
+        if row is not None:
+            self._conn.execute('DELETE FROM changes WHERE rev < ?', (row[0],))
+
+    def _record(self, records):
+        """Write mutation records to the database (caller holds the transaction)"""
+        changes = []
+        for record in records:
+            op = record['op']
+            text = None
+            if op in ('add', 'update'):
+                text = dumps_text(record['feature'])
+                self._conn.execute('INSERT OR REPLACE INTO features VALUES (?, ?)',
+                                   (record['id'], text))
+            elif op == 'delete':
+                self._conn.execute('DELETE FROM features WHERE id = ?', (record['id'],))
+            elif op == 'clear':
+                self._conn.execute('DELETE FROM features')
+            changes.append((record['rev'], op, record.get('id'), text))
+        self._conn.executemany(
+            'INSERT INTO changes (rev, op, id, feature) VALUES (?, ?, ?, ?)', changes)
+
+    def add_many(self, features):
+        features = list(features)
+        if not features:
+            return []
+        with self._write():
+            return super().add_many(features)
+
+    def update(self, feature_id, feature):
+        with self._write():
+            return super().update(feature_id, feature)
+
+    def delete(self, feature_id):
+        with self._write():
+            return super().delete(feature_id)
+
+    def clear(self):
+        with self._write():
+            super().clear()
+
+    def close(self):
+        """Close this process's database connections"""
+        _open_stores.discard(self)
+        with self._lock:
+            self._conn.close()
+            self._reader.close()
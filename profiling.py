@@ -0,0 +1,236 @@
+"""
+Polygon Mapper - Request Profiling
+cProfile requests on demand and keep the slowest profiles for download
+as pstats files or folded stacks for flame graphs
+"""
+
+import cProfile
+import heapq
+import io
+import itertools
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+
+# Call paths whose share of a profile is below this many seconds are left
+# out of folded stacks
+MIN_FOLDED_TIME = 1e-6
+MAX_FOLDED_DEPTH = 256
+
+
+class RequestProfile:
+    """A finished profile and the request it measured"""
+
+    def __init__(self, profile_id, method, path, endpoint, trigger):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.trigger = trigger
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        self.status = None
+        self.duration = None
+        self.stats = None
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'status': self.status,
+            'trigger': self.trigger,
+            'started': self.started,
+            'duration_ms': round(self.duration * 1000, 3),
+        }
+
+    def pstats_bytes(self):
+        """Return the profile in the file format read by pstats.Stats and snakeviz"""
+        return marshal.dumps(self.stats)
+
+    def text(self, sort='cumulative', limit=60):
+        """Return the pstats report of the most expensive functions"""
+        out = io.StringIO()
+        stats = pstats.Stats(_StatsSource(self.stats), stream=out)
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def folded(self):
+        """Return 'frame;frame;frame microseconds' lines for flamegraph.pl or speedscope
+
+        cProfile records caller/callee pairs rather than whole stacks, so a
+        function's time is split between its callers in proportion to the
+        time each caller spent in it.
+        """
+        callees = {}
+        for function, (_, _, _, _, callers) in self.stats.items():
+            for caller, (_, _, _, edge_time) in callers.items():
+                callees.setdefault(caller, []).append((function, edge_time))
+        roots = [f for f, (_, _, _, _, callers) in self.stats.items() if not callers]
+
+        lines = {}
+
+        def walk(function, share, stack):
+            _, _, own_time, total_time, _ = self.stats[function]
+            stack.append(_frame_name(function))
+            if own_time * share >= MIN_FOLDED_TIME:
+                key = ';'.join(stack)
+                lines[key] = lines.get(key, 0) + own_time * share
+            if len(stack) < MAX_FOLDED_DEPTH:
+                for callee, edge_time in callees.get(function, ()):
+                    callee_total = self.stats[callee][3]
+                    if not callee_total or _frame_name(callee) in stack:
+                        continue
+                    child_share = share * edge_time / callee_total
+                    if child_share * callee_total >= MIN_FOLDED_TIME:
+                        walk(callee, child_share, stack)
+            stack.pop()
+
+        for root in roots:
+            walk(root, 1.0, [])
+        return ''.join(f'{stack} {round(seconds * 1e6)}\n'
+                       for stack, seconds in lines.items() if round(seconds * 1e6))
+
+
+class _StatsSource:
+    """Adapter letting pstats.Stats load a raw stats dictionary"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _frame_name(function):
+    filename, line, name = function
+    if filename == '~':
+        # Built-in functions
+        return name
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+class RequestProfiler:
+    """
+    Decide which requests to profile and keep the slowest of them.
+
+    A request is profiled when its X-Profile header asks for it (if
+    allowed) or when it falls into the random sample. Only the keep
+    slowest profiles are retained. Profilers are per request and per
+    thread; on Python versions that allow a single active profiler, a
+    request arriving while another is profiled is simply not profiled.
+    """
+
+    def __init__(self, sample_rate=0.0, keep=20, allow_header=True):
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.allow_header = allow_header
+        self._profiles = []     # min-heap of (duration, id, RequestProfile)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def configure(self, sample_rate=None, keep=None, allow_header=None):
+        """Change the settings at runtime, raising ValueError for bad values"""
+        if sample_rate is not None:
+            sample_rate = float(sample_rate)
+            if not 0 <= sample_rate <= 1:
+                raise ValueError('sample_rate must be between 0 and 1')
+            self.sample_rate = sample_rate
+        if keep is not None:
+            keep = int(keep)
+            if keep < 0:
+                raise ValueError('keep must be at least 0')
+            with self._lock:
+                self.keep = keep
+                self._trim()
+        if allow_header is not None:
+            self.allow_header = bool(allow_header)
+
+    def settings(self):
+        return {'sample_rate': self.sample_rate, 'keep': self.keep,
+                'allow_header': self.allow_header}
+
+    def should_profile(self, header):
+        """Return the trigger ('header' or 'sample') if a request should be profiled"""
+        if header and self.allow_header and header.lower() in ('1', 'true', 'yes', 'on'):
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def start(self, method, path, endpoint, trigger):
+        """Start profiling the current thread; returns (profile, profiler) or None"""
+        if not self.keep:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active (Python 3.12+ allows only one)
+            return None
+        profile = RequestProfile(next(self._ids), method, path, endpoint, trigger)
+        return profile, profiler
+
+    def finish(self, profile, profiler, status):
+        """Stop profiling and store the profile if it is among the slowest"""
+        profiler.disable()
+        profile.status = status
+        profile.duration = time.perf_counter() - profile.clock
+        with self._lock:
+            if len(self._profiles) >= self.keep and self._profiles \
+                    and self._profiles[0][0] >= profile.duration:
+                return
+        # Collecting the stats is the expensive part, done outside the lock
+        profiler.create_stats()
+        profile.stats = profiler.stats
+        with self._lock:
+            heapq.heappush(self._profiles, (profile.duration, profile.id, profile))
+            self._trim()
+
+    def _trim(self):
+        while len(self._profiles) > self.keep:
+            heapq.heappop(self._profiles)
+
+    def profiles(self):
+        """Return the kept profiles, slowest first"""
+        with self._lock:
+            return [p for _, _, p in sorted(self._profiles, reverse=True)]
+
+    def get(self, profile_id):
+        with self._lock:
+            for _, _, profile in self._profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+    def stream(self, chunks, profile, profiler, status):
+        """Pass a streamed body through, profiling the making of each chunk
+
+        The profile is finished once the body was sent (or the client went
+        away), so it covers the whole response.
+        """
+        profiler.disable()
+        iterator = iter(chunks)
+        try:
+            while True:
+                try:
+                    profiler.enable()
+                except ValueError:
+                    pass
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    profiler.disable()
+                yield chunk
+        finally:
+            self.finish(profile, profiler, status)
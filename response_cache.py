@@ -0,0 +1,90 @@
+"""
+Polygon Mapper - Response Cache
+Bounded LRU cache of serialized response bodies with hit/miss counters
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    LRU cache of response bodies, bounded by their total size in bytes.
+
+    Keys should include the store ETag, so an entry can never be served
+    for a different revision; clear() runs on every mutation to free the
+    memory early.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._bodies = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached body for key, or None"""
+        with self._lock:
+            data = self._bodies.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._bodies.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._bodies.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._bodies[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def collect(self, key, chunks):
+        """Pass text or byte chunks through, caching the body once they all went out
+
+        Bodies that outgrow max_bytes are streamed without being kept.
+        """
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                part = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                size += len(part)
+                if size > self.max_bytes:
+                    parts = None
+                else:
+                    parts.append(part)
+            yield chunk
+        if parts is not None:
+            self.put(key, b''.join(parts))
+
+    def clear(self, bbox=None):
+        """Drop every cached body (bbox is accepted so this can be a store listener)"""
+        with self._lock:
+            self._bodies.clear()
+            self._size = 0
+
+    def stats(self):
+        """Return the cache counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._bodies),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,141 @@
+"""
+Polygon Mapper - Simplification
+Vectorized vertex reduction for densely sampled (freehand) geometries
+"""
+
+import heapq
+
+import numpy as np
+
+METHODS = ('dp', 'vw')
+
+
+def douglas_peucker(points, tolerance):
+    """Return a boolean mask of the points kept by Douglas-Peucker"""
+    count = len(points)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance * tolerance
+
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = points[start + 1:end]
+        a = points[start]
+        d = points[end] - a
+        length_sq = d[0] * d[0] + d[1] * d[1]
+        if length_sq == 0:
+            dist_sq = ((inner - a) ** 2).sum(axis=1)
+        else:
+            cross = d[0] * (inner[:, 1] - a[1]) - d[1] * (inner[:, 0] - a[0])
+            dist_sq = cross * cross / length_sq
+
+        i = int(dist_sq.argmax())
+        if dist_sq[i] > tolerance_sq:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def visvalingam(points, tolerance):
+    """Return a boolean mask of the points kept by Visvalingam-Whyatt
+
+    Points are removed while the triangle they form with their neighbours
+    is smaller than tolerance squared.
+    """
+    count = len(points)
+    keep = np.ones(count, dtype=bool)
+    if count < 3:
+        return keep
+    threshold = tolerance * tolerance
+
+    def area(i, j, k):
+        return abs((xs[j] - xs[i]) * (ys[k] - ys[i]) - (xs[k] - xs[i]) * (ys[j] - ys[i])) / 2
+
+    xs = points[:, 0].tolist()
+    ys = points[:, 1].tolist()
+    a, b, c = points[:-2], points[1:-1], points[2:]
+    initial = np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1])
+                     - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])) / 2
+    areas = [0.0] + initial.tolist() + [0.0]
+    heap = [(areas[i], i) for i in range(1, count - 1)]
+    heapq.heapify(heap)
+    prev = list(range(-1, count - 1))
+    nxt = list(range(1, count + 1))
+
+    while heap:
+        value, i = heapq.heappop(heap)
+        if not keep[i] or value != areas[i]:
+            continue
+        if value >= threshold:
+            break
+        keep[i] = False
+        p, n = prev[i], nxt[i]
+        nxt[p] = n
+        prev[n] = p
+        # Neighbours never drop below the area just removed
+        for j in (p, n):
+            if 0 < j < count - 1:
+                areas[j] = max(area(prev[j], j, nxt[j]), value)
+                heapq.heappush(heap, (areas[j], j))
+    return keep
+
+
+def _simplify_line(line, tolerance, method, closed):
+    """Simplify a list of positions, returning the original if it would collapse"""
+    minimum = 4 if closed else 2
+    if len(line) <= minimum:
+        return line
+    points = np.asarray([p[:2] for p in line], dtype=np.float64)
+    reduce = douglas_peucker if method == 'dp' else visvalingam
+
+    if closed:
+        # Split the ring at the vertex farthest from its start
+        split = int(((points - points[0]) ** 2).sum(axis=1).argmax())
+        if split == 0:
+            return line
+        keep = np.concatenate([reduce(points[:split + 1], tolerance),
+                               reduce(points[split:], tolerance)[1:]])
+    else:
+        keep = reduce(points, tolerance)
+
+    if keep.sum() < minimum:
+        return line
+    return [line[i] for i in np.flatnonzero(keep)]
+
+
+def simplify_geometry(geometry, tolerance, method='dp'):
+    """Return (geometry, vertices_removed) for a simplified copy of geometry"""
+    if method not in METHODS:
+        raise ValueError(f'unknown simplification method {method!r}')
+    if not geometry or tolerance <= 0:
+        return geometry, 0
+
+    kind = geometry.get('type')
+    coordinates = geometry.get('coordinates')
+    if kind == 'LineString':
+        simplified = _simplify_line(coordinates, tolerance, method, closed=False)
+        before, after = len(coordinates), len(simplified)
+    elif kind == 'MultiLineString':
+        simplified = [_simplify_line(line, tolerance, method, closed=False)
+                      for line in coordinates]
+        before = sum(len(line) for line in coordinates)
+        after = sum(len(line) for line in simplified)
+    elif kind == 'Polygon':
+        simplified = [_simplify_line(ring, tolerance, method, closed=True)
+                      for ring in coordinates]
+        before = sum(len(ring) for ring in coordinates)
+        after = sum(len(ring) for ring in simplified)
+    elif kind == 'MultiPolygon':
+        simplified = [[_simplify_line(ring, tolerance, method, closed=True)
+                       for ring in polygon] for polygon in coordinates]
+        before = sum(len(ring) for polygon in coordinates for ring in polygon)
+        after = sum(len(ring) for polygon in simplified for ring in polygon)
+    else:
+        return geometry, 0
+
+    return dict(geometry, coordinates=simplified), before - after
@@ -0,0 +1,223 @@
+"""
+Polygon Mapper - Spatial Index
+R-tree over feature bounding boxes for fast viewport queries
+"""
+
+import math
+
+from geometry import bbox_intersects, union_bbox
+
+
+class _Node:
+    """R-tree node; leaf entries are (bbox, item_id), branch entries are nodes"""
+
+    __slots__ = ('leaf', 'entries', 'bbox', 'parent')
+
+    def __init__(self, leaf, entries=None):
+        self.leaf = leaf
+        self.entries = entries if entries is not None else []
+        self.parent = None
+        self.bbox = None
+        if not leaf:
+            for child in self.entries:
+                child.parent = self
+        self.refresh()
+
+    def refresh(self):
+        """Recompute the node's bounding box from its entries"""
+        if self.leaf:
+            self.bbox = union_bbox(e[0] for e in self.entries)
+        else:
+            self.bbox = union_bbox(c.bbox for c in self.entries)
+
+
+def _entry_bbox(node, entry):
+    return entry[0] if node.leaf else entry.bbox
+
+
+def _extend(b, extra):
+    if b is None:
+        return extra
+    return (min(b[0], extra[0]), min(b[1], extra[1]),
+            max(b[2], extra[2]), max(b[3], extra[3]))
+
+
+def _center_x(b):
+    return b[0] + b[2]
+
+
+def _center_y(b):
+    return b[1] + b[3]
+
+
+class RTree:
+    """
+    Dynamic R-tree keyed by item id.
+
+    Supports incremental insert and delete, and STR bulk loading for
+    building the index from a large set of items at once.
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.min_entries = max(2, max_entries * 2 // 5)
+        self.clear()
+
+    def __len__(self):
+        return len(self._leaf_of)
+
+    def clear(self):
+        """Remove every item from the index"""
+        self._root = _Node(leaf=True)
+        self._leaf_of = {}
+
+    def insert(self, item_id, bbox):
+        """Add an item with the given bounding box"""
+        minx, miny, maxx, maxy = bbox
+        node = self._root
+        node.bbox = _extend(node.bbox, bbox)
+        while not node.leaf:
+            # Descend into the child needing the least enlargement
+            best = None
+            best_growth = best_area = 0.0
+            for child in node.entries:
+                b = child.bbox
+                area = (b[2] - b[0]) * (b[3] - b[1])
+                growth = ((max(b[2], maxx) - min(b[0], minx))
+                          * (max(b[3], maxy) - min(b[1], miny)) - area)
+                if (best is None or growth < best_growth
+                        or (growth == best_growth and area < best_area)):
+                    best, best_growth, best_area = child, growth, area
+            node = best
+            node.bbox = _extend(node.bbox, bbox)
+        node.entries.append((bbox, item_id))
+        self._leaf_of[item_id] = node
+        if len(node.entries) > self.max_entries:
+            self._adjust(node)
+
+    def delete(self, item_id):
+        """Remove an item; returns False if it was not indexed"""
+        leaf = self._leaf_of.pop(item_id, None)
+        if leaf is None:
+            return False
+        leaf.entries = [e for e in leaf.entries if e[1] != item_id]
+
+        # Condense the tree, collecting items from underfull nodes
+        orphans = []
+        node = leaf
+        while node.parent is not None:
+            parent = node.parent
+            if len(node.entries) < self.min_entries:
+                parent.entries.remove(node)
+                self._collect(node, orphans)
+            else:
+                node.refresh()
+            node = parent
+        node.refresh()
+
+        while not self._root.leaf and len(self._root.entries) == 1:
+            self._root = self._root.entries[0]
+            self._root.parent = None
+        if not self._root.entries:
+            self._root = _Node(leaf=True)
+
+        for bbox, orphan_id in orphans:
+            self.insert(orphan_id, bbox)
+        return True
+
+    def search(self, bbox):
+        """Yield the ids of all items whose bounding box intersects bbox"""
+        for _, item_id in self.search_entries(bbox):
+            yield item_id
+
+    def search_entries(self, bbox):
+        """Yield (bbox, item_id) for all items whose bounding box intersects bbox"""
+        root = self._root
+        if root.bbox is None or not bbox_intersects(root.bbox, bbox):
+            return
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                for entry in node.entries:
+                    if bbox_intersects(entry[0], bbox):
+                        yield entry
+            else:
+                for child in node.entries:
+                    if bbox_intersects(child.bbox, bbox):
+                        stack.append(child)
+
+    def bulk_load(self, items):
+        """Replace the index contents with (item_id, bbox) pairs using STR packing"""
+        self.clear()
+        entries = [(bbox, item_id) for item_id, bbox in items]
+        if not entries:
+            return
+
+        nodes = [_Node(leaf=True, entries=chunk)
+                 for chunk in self._str_chunks(entries, lambda e: e[0])]
+        for node in nodes:
+            for _, item_id in node.entries:
+                self._leaf_of[item_id] = node
+        while len(nodes) > 1:
+            nodes = [_Node(leaf=False, entries=chunk)
+                     for chunk in self._str_chunks(nodes, lambda n: n.bbox)]
+        self._root = nodes[0]
+
+    def _str_chunks(self, entries, get_bbox):
+        """Sort-Tile-Recursive grouping of entries into node-sized chunks"""
+        size = self.max_entries
+        leaf_count = math.ceil(len(entries) / size)
+        slice_count = math.ceil(math.sqrt(leaf_count))
+        slice_size = slice_count * size
+
+        entries = sorted(entries, key=lambda e: _center_x(get_bbox(e)))
+        for start in range(0, len(entries), slice_size):
+            vertical = sorted(entries[start:start + slice_size],
+                              key=lambda e: _center_y(get_bbox(e)))
+            for offset in range(0, len(vertical), size):
+                yield vertical[offset:offset + size]
+
+    def _adjust(self, node):
+        """Split overfull nodes up the tree
+
+        Splitting never changes the area covered by a parent, so only the
+        split nodes themselves need their bounding boxes recomputed.
+        """
+        while node is not None and len(node.entries) > self.max_entries:
+            sibling = self._split(node)
+            if node.parent is None:
+                self._root = _Node(leaf=False, entries=[node, sibling])
+                return
+            node.parent.entries.append(sibling)
+            sibling.parent = node.parent
+            node = node.parent
+
+    def _split(self, node):
+        """Split an overfull node in half along its widest axis"""
+        boxes = [_entry_bbox(node, e) for e in node.entries]
+        spread_x = max(b[2] for b in boxes) - min(b[0] for b in boxes)
+        spread_y = max(b[3] for b in boxes) - min(b[1] for b in boxes)
+        center = _center_x if spread_x >= spread_y else _center_y
+
+        entries = sorted(node.entries, key=lambda e: center(_entry_bbox(node, e)))
+        half = len(entries) // 2
+        node.entries = entries[:half]
+        sibling = _Node(leaf=node.leaf, entries=entries[half:])
+        if node.leaf:
+            for _, item_id in sibling.entries:
+                self._leaf_of[item_id] = sibling
+        node.refresh()
+        return sibling
+
+    def _collect(self, node, out):
+        """Append every leaf entry below node to out"""
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.leaf:
+                for entry in current.entries:
+                    self._leaf_of.pop(entry[1], None)
+                    out.append(entry)
+            else:
+                stack.extend(current.entries)
@@ -0,0 +1,157 @@
+"""
+Polygon Mapper - Telemetry
+Counters, histograms and gauges rendered in the Prometheus text format
+"""
+
+import math
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; from a cached GET up to a cold export of a large store
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60)
+# Bytes; from an empty reply up to a few hundred megabytes of export
+SIZE_BUCKETS = tuple(4 ** i * 64 for i in range(12))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter, one value per combination of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        """Add amount to the counter for the given label values"""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            yield f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets, per label values
+
+    observe() is a bisect and three additions under a lock, so it is cheap
+    enough to run on every request. Bucket counts are kept per bucket and
+    only made cumulative when rendered.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        """Record one value for the given label values"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Bucket counts, then the +Inf bucket, sum and count
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        bounds = [_number(b) for b in self.buckets] + ['+Inf']
+        for labels, values in sorted(series):
+            total = 0
+            for bound, count in zip(bounds, values):
+                total += count
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{_labels(self.labels, labels, le)} {total}'
+            yield f'{self.name}_sum{_labels(self.labels, labels)} {_number(values[-2])}'
+            yield f'{self.name}_count{_labels(self.labels, labels)} {values[-1]}'
+
+
+class Gauge:
+    """Value read from a function each time the metrics are rendered
+
+    function returns a number, or [(label values, number)] when the gauge
+    has labels. kind='counter' exposes totals that are counted elsewhere.
+    """
+
+    def __init__(self, name, documentation, function, labels=(), kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def samples(self):
+        values = self.function()
+        if not self.labels:
+            values = [((), values)]
+        for labels, value in values:
+            yield f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+
+
+class Registry:
+    """Set of metrics rendered together for one scrape"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS, labels=()):
+        return self._register(Histogram(name, documentation, buckets, labels))
+
+    def gauge(self, name, documentation, function, labels=(), kind='gauge'):
+        return self._register(Gauge(name, documentation, function, labels, kind))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            documentation = metric.documentation.replace('\\', '\\\\').replace('\n', '\\n')
+            lines.append(f'# HELP {metric.name} {documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
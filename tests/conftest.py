@@ -0,0 +1,33 @@
+"""
+Shared fixtures: the app with an in-memory store, emptied around each test
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The app opens its store on import
+os.environ['POLYGON_MAPPER_STORE'] = ':memory:'
+
+import polygon_mapper  # noqa: E402
+
+
+def square(x=0.0, y=0.0, size=1.0, **properties):
+    """A GeoJSON Polygon feature covering [x, x + size] x [y, y + size]"""
+    ring = [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+    return {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            'properties': properties}
+
+
+@pytest.fixture
+def app():
+    polygon_mapper.store.clear()
+    yield polygon_mapper.app
+    polygon_mapper.store.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,98 @@
+import math
+
+import pytest
+
+from conftest import square
+
+
+def wiggly(x=0.0, name='w'):
+    """A square with extra vertices along one edge for simplification to remove"""
+    ring = [[x + i / 10, 0.0001 * (i % 2)] for i in range(11)] + [[x + 1, 1], [x, 1], [x, 0]]
+    return {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            'properties': {'name': name}}
+
+
+def test_polygon_lifecycle(client):
+    feature_id = client.post('/api/polygons', json=square(name='a')).get_json()['id']
+    assert client.get(f'/api/polygons/{feature_id}').get_json()['properties'] == {'name': 'a'}
+    response = client.patch(f'/api/polygons/{feature_id}', json={'properties': {'kind': 'lake'}})
+    assert response.status_code == 200
+    assert client.get(f'/api/polygons/{feature_id}').get_json()['properties'] == {
+        'name': 'a', 'kind': 'lake'}
+    assert client.delete(f'/api/polygons/{feature_id}').status_code == 200
+    assert client.get(f'/api/polygons/{feature_id}').status_code == 404
+
+
+def test_get_polygons_etag(client):
+    client.post('/api/polygons', json=square())
+    response = client.get('/api/polygons')
+    assert client.get('/api/polygons', headers={'If-None-Match': response.headers['ETag']}
+                      ).status_code == 304
+
+
+def test_paging_from_cursor_zero(client):
+    assert 'next_cursor' not in client.get('/api/polygons?cursor=0&limit=2').get_json()
+    response = client.post('/api/polygons/batch', json={
+        'type': 'FeatureCollection', 'features': [square(i) for i in range(3)]})
+    ids = response.get_json()['ids']
+    body = client.get('/api/polygons?cursor=0&limit=2').get_json()
+    assert [f['id'] for f in body['features']] == ids[:2]
+    body = client.get(f"/api/polygons?cursor={body['next_cursor']}&limit=2").get_json()
+    assert [f['id'] for f in body['features']] == ids[2:] and 'next_cursor' not in body
+    assert client.get('/api/polygons?cursor=-1').status_code == 400
+
+
+@pytest.mark.parametrize('tolerance', ['nan', 'inf', '-inf', '-1', 'x'])
+def test_simplify_rejects_invalid_tolerance(client, tolerance):
+    response = client.post(f'/api/polygons?simplify={tolerance}', json=square())
+    assert response.status_code == 400
+    response = client.post(f'/api/polygons/batch?simplify={tolerance}',
+                           json={'type': 'FeatureCollection', 'features': [square()]})
+    assert response.status_code == 400
+
+
+def test_batch_reports_vertices_removed_per_feature(client):
+    response = client.post('/api/polygons/batch?simplify=0.001', json={
+        'type': 'FeatureCollection', 'features': [wiggly(0), square(5), wiggly(10)]})
+    body = response.get_json()
+    per_feature = body['vertices_removed_per_feature']
+    assert len(per_feature) == len(body['ids']) == 3
+    assert per_feature[0] > 0 and per_feature[1] == 0 and per_feature[2] > 0
+    assert body['vertices_removed'] == sum(per_feature)
+
+
+def test_polygon_stats(client):
+    client.post('/api/polygons', json=square(0, 0, 1))
+    body = client.get('/api/polygons/stats').get_json()
+    assert body['count'] == 1
+    assert body['bbox'] == [0, 0, 1, 1]
+    # A 1 degree square at the equator is about 111 km on each side
+    assert math.isclose(body['area'], 111_000 ** 2, rel_tol=0.05)
+
+
+def test_changes_since(client):
+    revision = client.get('/api/polygons/changes?since=0').get_json()['revision']
+    client.post('/api/polygons', json=square())
+    body = client.get(f'/api/polygons/changes?since={revision}').get_json()
+    assert [change['op'] for change in body['changes']] == ['insert']
+
+
+def test_contains(client):
+    feature_id = client.post('/api/polygons', json=square(0, 0, 1)).get_json()['id']
+    response = client.get('/api/contains?lng=0.5&lat=0.5')
+    assert response.status_code == 200
+    assert [f['id'] for f in response.get_json()['features']] == [feature_id]
+    assert client.get('/api/contains?lng=5&lat=5').get_json()['features'] == []
+
+
+def test_tiles(client):
+    client.post('/api/polygons', json=square(0, 0, 1))
+    response = client.get('/tiles/0/0/0.pbf')
+    assert response.status_code == 200
+    assert response.get_data()
+
+
+def test_cache_and_profiling_endpoints(client):
+    assert set(client.get('/api/cache').get_json()) == {'serialized', 'compressed'}
+    assert client.get('/api/profiling').status_code == 200
+    assert client.patch('/api/profiling', json={'sample_rate': 2}).status_code == 400
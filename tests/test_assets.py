@@ -0,0 +1,46 @@
+import gzip
+
+import pytest
+
+import assets
+from assets import CACHE_CONTROL, CDN, LIBRARIES, Library, asset_url
+
+
+@pytest.fixture
+def vendored(tmp_path, monkeypatch):
+    """A vendored copy of leaflet with a precompressed stylesheet"""
+    root = tmp_path / 'leaflet'
+    files = LIBRARIES['leaflet'][1]
+    for path in files:
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_bytes(f'/* {path} */\n'.encode() * 100)
+    (root / 'leaflet.css.gz').write_bytes(gzip.compress((root / 'leaflet.css').read_bytes()))
+    library = Library('leaflet', str(root), files)
+    monkeypatch.setattr(assets, '_libraries', {'leaflet': library})
+    return library
+
+
+def test_unvendored_assets_come_from_the_cdn(monkeypatch):
+    monkeypatch.setattr(assets, '_libraries', {})
+    assert asset_url('leaflet', 'leaflet.js') == f'{CDN}/{LIBRARIES["leaflet"][0]}/dist/leaflet.js'
+
+
+def test_vendored_asset_is_served_immutable(client, vendored):
+    url = asset_url('leaflet', 'leaflet.js')
+    assert url == f'/assets/leaflet/{vendored.digest}/leaflet.js'
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == CACHE_CONTROL
+    assert response.get_data() == vendored.files['leaflet.js']
+    assert client.get(url, headers={'If-None-Match': f'"{vendored.digest}"'}).status_code == 304
+
+
+def test_precompressed_variant_is_sent(client, vendored):
+    response = client.get(asset_url('leaflet', 'leaflet.css'), headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == vendored.files['leaflet.css']
+
+
+def test_unknown_digest_is_not_found(client, vendored):
+    assert client.get('/assets/leaflet/0000000000000000/leaflet.js').status_code == 404
+    assert client.get(f'/assets/leaflet/{vendored.digest}/missing.js').status_code == 404
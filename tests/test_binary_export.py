@@ -0,0 +1,36 @@
+import io
+import json
+
+import pytest
+
+import geoparquet
+from conftest import square
+from flatgeobuf import MAGIC, encode_flatgeobuf
+
+
+def test_flatgeobuf_export(client):
+    client.post('/api/polygons', json=square(name='a'))
+    response = client.get('/api/export?format=fgb&save=0')
+    assert response.mimetype == 'application/flatgeobuf'
+    assert response.get_data().startswith(MAGIC)
+
+
+def test_flatgeobuf_encodes_every_feature():
+    data = encode_flatgeobuf([square(i, name=str(i)) for i in range(3)])
+    assert data.startswith(MAGIC)
+    assert len(data) > len(MAGIC) + 3 * 5 * 16
+
+
+@pytest.mark.skipif(not geoparquet.available(), reason='needs pyarrow')
+def test_geoparquet_export(client):
+    import pyarrow.parquet as pq
+
+    ids = client.post('/api/polygons/batch', json={'type': 'FeatureCollection', 'features': [
+        square(0, name='a'), square(5, name='b')]}).get_json()['ids']
+    response = client.get('/api/export?format=parquet&save=0')
+    table = pq.read_table(io.BytesIO(response.get_data()))
+    assert table.column('id').to_pylist() == ids
+    assert table.column('name').to_pylist() == ['a', 'b']
+    geo = json.loads(table.schema.metadata[b'geo'])
+    assert geo['columns']['geometry']['encoding'] == 'WKB'
+    assert table.column('bbox').to_pylist()[1] == {'xmin': 5, 'ymin': 0, 'xmax': 6, 'ymax': 1}
@@ -0,0 +1,52 @@
+import numpy as np
+
+from conftest import square
+from point_in_polygon import as_points
+
+
+def test_locate_points_json_and_binary(client):
+    inner = client.post('/api/polygons', json=square(0, 0, 1)).get_json()['id']
+    outer = client.post('/api/polygons', json=square(-1, -1, 3)).get_json()['id']
+    points = [[0.5, 0.5], [1.5, 1.5], [5, 5]]
+
+    body = client.post('/api/contains', json={'points': points}).get_json()
+    assert body['count'] == 3 and body['matched'] == 2
+    assert sorted(map(tuple, body['matches'])) == [(0, inner), (0, outer), (1, outer)]
+
+    binary = np.asarray(points, dtype='<f8').tobytes()
+    response = client.post('/api/contains', data=binary,
+                           content_type='application/octet-stream')
+    assert sorted(map(tuple, response.get_json()['matches'])) == sorted(
+        map(tuple, body['matches']))
+
+
+def test_locate_points_rejects_bad_input(client):
+    assert client.post('/api/contains', data=b'\0' * 10,
+                       content_type='application/octet-stream').status_code == 400
+    assert client.post('/api/contains', json={'nope': []}).status_code == 400
+
+
+def test_point_on_hole_is_outside(client):
+    ring = [[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]]
+    hole = [[1, 1], [3, 1], [3, 3], [1, 3], [1, 1]]
+    client.post('/api/polygons', json={'type': 'Feature', 'properties': {},
+                                       'geometry': {'type': 'Polygon', 'coordinates': [ring, hole]}})
+    body = client.post('/api/contains', json=[[2, 2], [0.5, 0.5]]).get_json()
+    assert [m[0] for m in body['matches']] == [1]
+
+
+def test_as_points_shape():
+    assert as_points([[1, 2], [3, 4]]).shape == (2, 2)
+
+
+def test_polygons_with_altitude_are_located(client):
+    ring = [[0, 0, 10], [2, 0, 10], [2, 2, 12], [0, 2, 12], [0, 0, 10]]
+    hole = [[0.5, 0.5, 11], [1, 0.5, 11], [1, 1, 11], [0.5, 0.5, 11]]
+    polygon = client.post('/api/polygons', json={
+        'type': 'Feature', 'properties': {},
+        'geometry': {'type': 'Polygon', 'coordinates': [ring, hole]}}).get_json()['id']
+    multi = client.post('/api/polygons', json={
+        'type': 'Feature', 'properties': {},
+        'geometry': {'type': 'MultiPolygon', 'coordinates': [[], [ring]]}}).get_json()['id']
+    body = client.post('/api/contains', json=[[1.5, 1.5], [0.8, 0.6], [3, 3]]).get_json()
+    assert sorted(map(tuple, body['matches'])) == [(0, polygon), (0, multi), (1, multi)]
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from conftest import square
+from dissolve import available, dissolve
+
+pytestmark = pytest.mark.skipif(not available(), reason='needs shapely')
+
+
+def polygon_count(feature):
+    return len(feature['geometry']['coordinates'])
+
+
+def test_dissolve_merges_touching_polygons():
+    features = [square(0, kind='a'), square(1, kind='a'), square(5, kind='b'), square(0.5)]
+    merged = dissolve(features)
+    assert len(merged) == 1
+    assert merged[0]['properties'] == {'count': 4}
+    # The first two and the last overlap; the third stands apart
+    assert polygon_count(merged[0]) == 2
+
+
+def test_dissolve_by_property():
+    features = [square(0, kind='a'), square(1, kind='a'), square(5, kind='b')]
+    groups = {f['properties']['kind']: f for f in dissolve(features, 'kind')}
+    assert groups['a']['properties']['count'] == 2 and polygon_count(groups['a']) == 1
+    assert groups['b']['properties']['count'] == 1
+
+
+def test_dissolved_export(client):
+    client.post('/api/polygons/batch', json={'type': 'FeatureCollection', 'features': [
+        square(0, kind='a'), square(0.5, kind='a'), square(5, kind='b')]})
+    body = json.loads(client.get('/api/export?save=0&dissolve_by=kind').get_data())
+    assert sorted(f['properties']['kind'] for f in body['features']) == ['a', 'b']
+    assert client.get('/api/export?save=0&dissolve=1&metrics=1').status_code == 400
+
+
+@pytest.mark.parametrize('geometry', [
+    {'type': 'Polygon', 'coordinates': []},
+    {'type': 'Polygon', 'coordinates': [[]]},
+    {'type': 'MultiPolygon', 'coordinates': [[]]},
+    {'type': 'MultiPolygon', 'coordinates': [[], [[[5, 5], [6, 5], [6, 6], [5, 5]], [[0, 0]]]]},
+    {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 1], [0, 0]]]},
+])
+def test_dissolved_export_skips_empty_rings(client, geometry):
+    client.post('/api/polygons', json=square(kind='a'))
+    response = client.post('/api/polygons',
+                           json={'type': 'Feature', 'geometry': geometry, 'properties': {'kind': 'b'}})
+    assert response.status_code == 200
+    response = client.get('/api/export?save=0&dissolve_by=kind')
+    assert response.status_code == 200
+    for feature in json.loads(response.get_data())['features']:
+        assert feature['geometry']['coordinates']
+        assert all(feature['geometry']['coordinates'])
+
+
+def test_collapsed_rings_are_dropped():
+    collapsed = {'type': 'Feature', 'properties': {'kind': 'b'},
+                 'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0], [1, 1], [2, 2], [0, 0]]]}}
+    merged = dissolve([square(5, kind='a'), collapsed], 'kind')
+    assert [f['properties']['kind'] for f in merged] == ['a']
+    assert dissolve([collapsed]) == []
@@ -0,0 +1,88 @@
+import json
+import random
+
+import pytest
+
+from compression import ENCODINGS, compress_chunks, decompress, iter_compressed
+from conftest import square
+from exporters import EXPORT_FORMATS
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_iter_compressed_round_trip(encoding):
+    rng = random.Random(1)
+    chunks = [json.dumps([rng.random() for _ in range(2000)]) for _ in range(50)]
+    parts = list(iter_compressed(chunks, encoding))
+    assert decompress(b''.join(parts), encoding) == ''.join(chunks).encode()
+    assert decompress(compress_chunks(chunks, encoding), encoding) == ''.join(chunks).encode()
+
+
+def test_iter_compressed_is_lazy():
+    rng = random.Random(1)
+    consumed = []
+
+    def chunks():
+        for i in range(50):
+            consumed.append(i)
+            yield json.dumps([rng.random() for _ in range(2000)])
+
+    next(iter_compressed(chunks(), 'gzip'))
+    assert len(consumed) < 50
+
+
+def test_compressed_export_is_streamed_and_cached(client):
+    client.post('/api/polygons/batch', json={
+        'type': 'FeatureCollection', 'features': [square(i, name=f'p{i}') for i in range(200)]})
+    headers = {'Accept-Encoding': 'gzip'}
+    response = client.get('/api/export?save=0', headers=headers)
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['X-Cache'] == 'MISS'
+    body = response.get_data()
+    assert len(json.loads(decompress(body, 'gzip'))['features']) == 200
+
+    cached = client.get('/api/export?save=0', headers=headers)
+    assert cached.headers['X-Cache'] == 'HIT'
+    assert cached.get_data() == body
+
+
+@pytest.mark.parametrize('fmt', [f for f in EXPORT_FORMATS if f != 'parquet'])
+def test_export_formats(client, fmt):
+    client.post('/api/polygons', json=square())
+    response = client.get(f'/api/export?format={fmt}&save=0')
+    assert response.status_code == 200
+    assert response.get_data()
+
+
+def test_export_empty_store(client):
+    assert client.get('/api/export?save=0').status_code == 400
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    import polygon_mapper
+    monkeypatch.setattr(polygon_mapper, 'get_data_dir', lambda name: str(tmp_path / name))
+    return tmp_path / 'output'
+
+
+@pytest.mark.parametrize('headers', [{}, {'Accept-Encoding': 'gzip'}])
+def test_export_saves_a_copy(client, output_dir, headers):
+    client.post('/api/polygons', json=square(name='saved'))
+    for _ in range(2):
+        # The second export is served from the caches
+        response = client.get('/api/export', headers=headers)
+        body = response.get_data()
+        if headers:
+            body = decompress(body, 'gzip')
+        response.close()
+    saved = sorted(output_dir.iterdir())
+    assert saved and not [p for p in saved if p.suffix == '.part']
+    assert saved[-1].read_bytes() == body
+    assert json.loads(body)['features'][0]['properties'] == {'name': 'saved'}
+
+
+def test_aborted_export_leaves_no_file(client, output_dir):
+    client.post('/api/polygons', json=square())
+    response = client.get('/api/export')
+    response.close()
+    assert not output_dir.exists() or not list(output_dir.iterdir())
@@ -0,0 +1,28 @@
+import pytest
+
+from geometry import geometry_bbox, parse_bbox, union_bbox
+
+
+def test_parse_bbox():
+    assert parse_bbox('-10,-5.5,10,5') == (-10, -5.5, 10, 5)
+
+
+@pytest.mark.parametrize('value', ['1,2,3', '3,0,1,1', 'a,0,1,1', 'nan,0,1,1', '0,0,inf,1',
+                                   '-inf,0,1,1', '0,0,1,NaN'])
+def test_parse_bbox_rejects(value):
+    with pytest.raises(ValueError):
+        parse_bbox(value)
+
+
+def test_geometry_bbox():
+    geometry = {'type': 'GeometryCollection', 'geometries': [
+        {'type': 'Point', 'coordinates': [1, 2]},
+        {'type': 'LineString', 'coordinates': [[-1, 0], [3, 5]]}]}
+    assert geometry_bbox(geometry) == (-1, 0, 3, 5)
+    assert union_bbox([]) is None
+
+
+@pytest.mark.parametrize('bbox', ['nan,0,1,1', '0,0,inf,1'])
+def test_non_finite_bbox_is_a_bad_request(client, bbox):
+    assert client.get(f'/api/polygons?bbox={bbox}').status_code == 400
+    assert client.get(f'/api/polygons/stats?bbox={bbox}').status_code == 400
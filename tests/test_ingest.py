@@ -0,0 +1,132 @@
+import io
+import json
+
+import pytest
+
+from conftest import square
+from ingest import IngestError, read_features, validate_feature
+
+
+def feature(geometry_type, coordinates):
+    return {'type': 'Feature', 'geometry': {'type': geometry_type, 'coordinates': coordinates},
+            'properties': None}
+
+
+@pytest.mark.parametrize('geometry_type,coordinates', [
+    ('Point', [1, 2]),
+    ('Point', [1, 2, 3.5]),
+    ('MultiPoint', [[1, 2], [3, 4]]),
+    ('LineString', [[1, 2], [3, 4]]),
+    ('MultiLineString', [[[1, 2], [3, 4]]]),
+    ('Polygon', [[[0, 0], [1, 0], [1, 1], [0, 0]]]),
+    ('MultiPolygon', [[[[0, 0], [1, 0], [1, 1], [0, 0]]], []]),
+])
+def test_valid_geometries(geometry_type, coordinates):
+    validate_feature(feature(geometry_type, coordinates))
+
+
+@pytest.mark.parametrize('geometry_type,coordinates', [
+    ('Point', [[1, 2]]),
+    ('Point', [1]),
+    ('LineString', [1, 2]),
+    ('Polygon', [[0, 0], [1, 0], [1, 1], [0, 0]]),
+    ('Polygon', [[[0], [1], [0]]]),
+    ('Polygon', [['abc']]),
+    ('Polygon', ['abc']),
+    ('Polygon', [[{'x': 0}, [1, 0], [1, 1]]]),
+    ('Polygon', [[['0', '0'], [1, 0], [1, 1]]]),
+    ('Polygon', [[[True, 0], [1, 0], [1, 1]]]),
+    ('Polygon', [[[float('nan'), 0], [1, 0], [1, 1]]]),
+    ('Polygon', [[[float('inf'), 0], [1, 0], [1, 1]]]),
+    ('Polygon', [[[10 ** 400, 0], [1, 0], [1, 1]]]),
+    ('MultiPolygon', [[[0, 0], [1, 0], [1, 1], [0, 0]]]),
+])
+def test_invalid_coordinates(geometry_type, coordinates):
+    with pytest.raises(IngestError):
+        validate_feature(feature(geometry_type, coordinates))
+
+
+def test_geometry_collection_members_are_validated():
+    collection = {'type': 'GeometryCollection',
+                  'geometries': [{'type': 'Point', 'coordinates': [0, 0]},
+                                 {'type': 'Point', 'coordinates': ['x', 0]}]}
+    with pytest.raises(IngestError):
+        validate_feature({'type': 'Feature', 'geometry': collection, 'properties': {}})
+
+
+def test_read_feature_collection():
+    body = b'{"type": "FeatureCollection", "features": [%s, %s]}' % (
+        b'{"type": "Feature", "geometry": null, "properties": {"a": 1}}',
+        b'{"type": "Feature", "geometry": {"type": "Point", "coordinates": [1, 2]}, "properties": {}}')
+    features = read_features(io.BytesIO(body), 'application/geo+json')
+    assert [f['properties'] for f in features] == [{'a': 1}, {}]
+
+
+def test_read_sequence():
+    body = b'\x1e{"type": "Feature", "geometry": null, "properties": {}}\n' * 3
+    assert len(read_features(io.BytesIO(body), 'application/geo+json-seq')) == 3
+
+
+@pytest.mark.parametrize('coordinates', [
+    [[[0], [1], [0]]],
+    [['abc']],
+    [[{'x': 0, 'y': 0}, [1, 0], [1, 1], [0, 0]]],
+])
+def test_malformed_posts_are_rejected(client, coordinates):
+    client.post('/api/polygons', json=square())
+    response = client.post('/api/polygons', json=feature('Polygon', coordinates))
+    assert response.status_code == 400
+    response = client.post('/api/polygons/batch', json={
+        'type': 'FeatureCollection', 'features': [square(2), feature('Polygon', coordinates)]})
+    assert response.status_code == 400
+    response = client.get('/api/polygons')
+    assert response.status_code == 200
+    assert len(response.get_json()['features']) == 1
+
+
+def test_patch_with_malformed_geometry_is_rejected(client):
+    feature_id = client.post('/api/polygons', json=square()).get_json()['id']
+    response = client.patch(f'/api/polygons/{feature_id}',
+                            json={'geometry': {'type': 'Polygon', 'coordinates': [['abc']]}})
+    assert response.status_code == 400
+    assert client.get(f'/api/polygons/{feature_id}').get_json()['geometry'] == square()['geometry']
+
+
+@pytest.mark.parametrize('trailer', [b'x', b'{}', b'\n{"type": "FeatureCollection", "features": []}'])
+def test_trailing_data_is_rejected(trailer):
+    body = b'{"type": "FeatureCollection", "features": []}' + trailer
+    with pytest.raises(IngestError):
+        read_features(io.BytesIO(body), 'application/geo+json')
+
+
+def test_trailing_whitespace_is_allowed():
+    body = b'{"type": "FeatureCollection", "features": []} \r\n\t\n'
+    assert read_features(io.BytesIO(body), 'application/geo+json') == []
+
+
+def test_large_feature_is_read_in_linear_time():
+    ring = [[i * 1e-5, (i % 7) * 1e-5] for i in range(200000)] + [[0, 0]]
+    body = json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': {}}]})
+
+    class CountingStream(io.BytesIO):
+        reads = 0
+
+        def read(self, size=-1):
+            self.reads += 1
+            return super().read(size)
+
+    stream = CountingStream(body.encode())
+    features = read_features(stream, 'application/geo+json')
+    assert len(features[0]['geometry']['coordinates'][0]) == len(ring)
+    # Each read at least doubles the buffered text
+    assert stream.reads < 20
+
+
+def test_upload_size_is_limited(client, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'MAX_CONTENT_LENGTH', 1024)
+    body = {'type': 'FeatureCollection', 'features': [square(i) for i in range(50)]}
+    response = client.post('/api/polygons/batch', json=body)
+    assert response.status_code == 413
+    assert 'error' in response.get_json()
+    assert client.get('/api/polygons').get_json()['features'] == []
@@ -0,0 +1,34 @@
+import json
+
+import numpy as np
+import pytest
+
+from json_codec import _stdlib_dumps, dumps, dumps_text, loads
+
+
+@pytest.mark.parametrize('encode', [dumps, _stdlib_dumps])
+def test_round_trip(encode):
+    value = {'a': [1, 2.5, None, True], 'text': 'café', 'nested': {'x': []}}
+    assert loads(encode(value)) == value
+    assert json.loads(encode(value, pretty=True)) == value
+
+
+@pytest.mark.parametrize('encode', [dumps, _stdlib_dumps])
+def test_numpy_values(encode):
+    value = {'array': np.arange(3), 'scalar': np.float64(1.5), 'int': np.int64(7)}
+    assert loads(encode(value)) == {'array': [0, 1, 2], 'scalar': 1.5, 'int': 7}
+
+
+def test_big_integers_fall_back_to_the_standard_library():
+    assert loads(dumps_text({'n': 2 ** 70})) == {'n': 2 ** 70}
+
+
+def test_invalid_json_raises_value_error():
+    with pytest.raises(ValueError):
+        loads(b'{"a": ')
+
+
+def test_responses_use_the_codec(client):
+    response = client.get('/api/cache')
+    assert response.mimetype == 'application/json'
+    assert b' ' not in response.get_data()
@@ -0,0 +1,27 @@
+from compression import decompress
+
+
+def test_page_is_served_with_etag(client):
+    response = client.get('/')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_page_is_compressed(client):
+    plain = client.get('/').get_data()
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert decompress(response.get_data(), 'gzip') == plain
+
+
+def test_page_loads_only_the_visible_polygons(client):
+    html = client.get('/').get_data(as_text=True)
+    assert "'/api/polygons?bbox=' + bbox + '&limit=' + PAGE_SIZE" in html
+    assert "fetch('/api/polygons')" not in html
+
+
+def test_freehand_polygons_are_updated_by_id(client):
+    html = client.get('/').get_data(as_text=True)
+    assert 'switch (event.eventType)' in html
+    assert "fetch('/api/polygons/' + polygon.featureId, {\n                    method: 'PATCH'" in html
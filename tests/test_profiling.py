@@ -0,0 +1,35 @@
+import marshal
+
+from conftest import square
+
+
+def test_profile_on_request(client):
+    client.delete('/api/profiling')
+    client.post('/api/polygons', json=square())
+    response = client.get('/api/polygons', headers={'X-Profile': '1'})
+    profile_id = int(response.headers['X-Profile-Id'])
+
+    profiles = client.get('/api/profiling').get_json()['profiles']
+    assert [p['id'] for p in profiles] == [profile_id]
+    assert profiles[0]['endpoint'] == 'get_polygons'
+
+    stats = marshal.loads(client.get(f'/api/profiling/{profile_id}').get_data())
+    assert any(func[2] == 'get_polygons' for func in stats)
+    folded = client.get(f'/api/profiling/{profile_id}?format=folded').get_data(as_text=True)
+    assert 'get_polygons' in folded
+    assert client.get(f'/api/profiling/{profile_id}?format=text&sort=bogus').status_code == 400
+
+
+def test_streamed_response_is_profiled_once_sent(client):
+    client.delete('/api/profiling')
+    client.post('/api/polygons', json=square())
+    response = client.get('/api/export?save=0', headers={'X-Profile': '1'})
+    assert not client.get('/api/profiling').get_json()['profiles']
+    response.get_data()
+    response.close()
+    profiles = client.get('/api/profiling').get_json()['profiles']
+    assert [p['endpoint'] for p in profiles] == ['export_geojson']
+
+
+def test_unknown_profile(client):
+    assert client.get('/api/profiling/999999').status_code == 404
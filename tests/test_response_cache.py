@@ -0,0 +1,29 @@
+from response_cache import ResponseCache
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_bytes=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    assert cache.get('a') == b'12345'
+    cache.put('c', b'12345')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'12345'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_collect_caches_the_whole_body():
+    cache = ResponseCache()
+    assert list(cache.collect('k', ['ab', b'cd'])) == ['ab', b'cd']
+    assert cache.get('k') == b'abcd'
+
+
+def test_collect_drops_bodies_over_the_limit():
+    cache = ResponseCache(max_bytes=4)
+    collected = cache.collect('k', iter([b'abc', 'de', b'fgh']))
+    next(collected)
+    next(collected)
+    # The body outgrew the cache, so nothing more is held for it
+    assert collected.gi_frame.f_locals['parts'] is None
+    assert list(collected) == [b'fgh']
+    assert cache.get('k') is None
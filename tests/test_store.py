@@ -0,0 +1,292 @@
+import os
+import threading
+import time
+
+import pytest
+
+from columnar import FeatureTable
+from conftest import square
+from polygon_store import AppendLogStore, MemoryStore, SqliteStore
+
+MALFORMED_GEOMETRIES = [
+    {'type': 'Polygon', 'coordinates': [[[0], [1], [0]]]},
+    {'type': 'Polygon', 'coordinates': [['abc']]},
+    {'type': 'Polygon', 'coordinates': [[{'x': 0, 'y': 0}, [1, 0], [1, 1], [0, 0]]]},
+]
+
+
+@pytest.mark.parametrize('geometry', MALFORMED_GEOMETRIES)
+def test_table_rejects_malformed_geometry_unchanged(geometry):
+    table = FeatureTable()
+    table.insert_many([(1, square(name='a'))])
+    bad = {'type': 'Feature', 'geometry': geometry, 'properties': {'name': 'bad'}}
+    with pytest.raises(ValueError):
+        table.insert_many([(2, square(5)), (3, bad)])
+    table.insert_many([(4, square(10, name='d'))])
+    assert list(table) == [1, 4]
+    assert table[4]['properties'] == {'name': 'd'}
+    assert table.view().vertex_count() == 10
+
+
+@pytest.mark.parametrize('geometry', MALFORMED_GEOMETRIES)
+def test_failed_add_leaves_store_unchanged(geometry):
+    store = MemoryStore()
+    store.add(square())
+    revision = store.revision
+    with pytest.raises(ValueError):
+        store.add({'type': 'Feature', 'geometry': geometry, 'properties': {}})
+    assert store.revision == revision
+    assert store.changes_since(0)[1][-1][0] == revision
+    feature_id = store.add(square(3, name='c'))
+    assert [f['properties'] for f in store.features()] == [{}, {'name': 'c'}]
+    assert store.get(feature_id)['id'] == feature_id
+
+
+def test_add_update_delete():
+    store = MemoryStore()
+    ids = store.add_many([square(0), square(10)])
+    assert store.update(ids[0], square(20, name='moved'))
+    assert store.get(ids[0])['properties'] == {'name': 'moved'}
+    assert store.delete(ids[1])
+    assert not store.delete(ids[1])
+    assert [i for i, _ in store.items_in_bbox((19, 0, 21, 1))] == [ids[0]]
+    revision, changes = store.changes_since(0)
+    assert [op for _, op, _, _ in changes] == ['insert', 'insert', 'update', 'delete']
+    assert revision == 3
+
+
+def test_bbox_reads_build_features_without_the_lock(monkeypatch):
+    store = MemoryStore()
+    store.add_many([square(i) for i in range(3)])
+    columns = store.snapshot().features.rows()[0]
+    build = columns.feature
+    locked = []
+
+    def try_lock():
+        acquired = store._lock.acquire(False)
+        locked.append(not acquired)
+        if acquired:
+            store._lock.release()
+
+    def feature(*args):
+        # Another thread stands in for a writer
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        return build(*args)
+
+    monkeypatch.setattr(columns, 'feature', feature)
+    assert len(store.items_in_bbox((0, 0, 10, 1))) == 3
+    assert len(store.page(bbox=(0, 0, 10, 1), limit=2)[1]) == 2
+    assert locked and not any(locked)
+
+
+@pytest.mark.parametrize('make_store', [MemoryStore, lambda: SqliteStore(':memory:')])
+def test_mutations_without_area_keep_caches(make_store):
+    store = make_store()
+    store.add(square())
+    revision = store.revision
+    notified = []
+    store.subscribe(notified.append)
+    assert store.add_many([]) == []
+    assert store.revision == revision
+    feature_id = store.add({'type': 'Feature', 'geometry': None, 'properties': {}})
+    store.update(feature_id, {'type': 'Feature', 'geometry': None, 'properties': {'a': 1}})
+    store.delete(feature_id)
+    assert store.revision == revision + 3
+    assert notified == []
+    store.clear()
+    assert notified == [None]
+    store.close()
+
+
+def test_page_cursor():
+    store = MemoryStore()
+    ids = store.add_many([square(i) for i in range(5)])
+    _, items, cursor = store.page(limit=2)
+    assert [i for i, _ in items] == ids[:2]
+    _, items, cursor = store.page(cursor=cursor, limit=2)
+    assert [i for i, _ in items] == ids[2:4]
+    _, items, cursor = store.page(cursor=cursor, limit=2)
+    assert [i for i, _ in items] == ids[4:] and cursor is None
+
+
+def test_append_log_replay(tmp_path):
+    path = str(tmp_path / 'polygons.jsonl')
+    store = AppendLogStore(path)
+    ids = store.add_many([square(0), square(10)])
+    store.update(ids[0], square(5, name='u'))
+    store.delete(ids[1])
+    store.close()
+
+    reopened = AppendLogStore(path)
+    try:
+        assert [f['id'] for f in reopened.features()] == [ids[0]]
+        assert reopened.get(ids[0])['properties'] == {'name': 'u'}
+        assert reopened.etag == store.etag
+        assert reopened.add(square()) == ids[1] + 1
+    finally:
+        reopened.close()
+
+
+def test_sqlite_update_from_other_process_keeps_order(tmp_path):
+    path = str(tmp_path / 'polygons.db')
+    reader = SqliteStore(path)
+    writer = SqliteStore(path)
+    try:
+        ids = writer.add_many([square(i * 2) for i in range(5)])
+        assert reader.snapshot().ids == tuple(ids)
+        writer.update(ids[1], square(1, name='moved'))
+        writer.delete(ids[3])
+
+        assert reader.snapshot().ids == (ids[0], ids[1], ids[2], ids[4])
+        assert reader.etag == writer.etag
+        assert list(reader.features()) == list(writer.features())
+        paged = []
+        cursor = 0
+        while cursor is not None:
+            _, items, cursor = reader.page(cursor=cursor, limit=2)
+            paged.extend(i for i, _ in items)
+        assert paged == [ids[0], ids[1], ids[2], ids[4]]
+        assert reader.get(ids[1])['properties'] == {'name': 'moved'}
+        assert [i for i, _ in reader.items_in_bbox((1.2, 0.2, 1.8, 0.8))] == [ids[1]]
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_sqlite_reads_do_not_wait_for_writer_lock(tmp_path):
+    store = SqliteStore(str(tmp_path / 'polygons.db'))
+    feature_id = store.add(square())
+    store.page()
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold_lock():
+        with store._lock:
+            held.set()
+            release.wait(10)
+
+    writer = threading.Thread(target=hold_lock)
+    writer.start()
+    try:
+        held.wait(10)
+        start = time.monotonic()
+        assert store.get(feature_id)['id'] == feature_id
+        assert len(store) == 1
+        assert store.page()[1][0][0] == feature_id
+        assert time.monotonic() - start < 5
+    finally:
+        release.set()
+        writer.join()
+        store.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_sqlite_store_reconnects_after_fork(tmp_path):
+    store = SqliteStore(str(tmp_path / 'polygons.db'))
+    try:
+        store.add(square())
+        pid = os.fork()
+        if pid == 0:
+            try:
+                store.add(square(5))
+                os._exit(0 if len(store) == 2 else 1)
+            except BaseException:
+                os._exit(1)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        assert len(store) == 2
+    finally:
+        store.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_append_log_flusher_runs_after_fork(tmp_path):
+    path = str(tmp_path / 'polygons.jsonl')
+    store = AppendLogStore(path)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            store.add(square())
+            alive = store._flusher.is_alive()
+            store.close()
+            os._exit(0 if alive else 1)
+        except BaseException:
+            os._exit(1)
+    _, status = os.waitpid(pid, 0)
+    store.close()
+    assert os.waitstatus_to_exitcode(status) == 0
+    reopened = AppendLogStore(path)
+    try:
+        assert len(reopened) == 1
+    finally:
+        reopened.close()
+
+
+def test_snapshot_is_unaffected_by_later_writes():
+    store = MemoryStore()
+    ids = store.add_many([square(0, name='a'), square(2, name='b')])
+    snapshot = store.snapshot()
+    store.update(ids[0], square(0, name='changed'))
+    store.delete(ids[1])
+    store.add(square(4))
+    assert snapshot.ids == tuple(ids)
+    assert [f['properties']['name'] for f in snapshot.features] == ['a', 'b']
+    assert store.snapshot() is not snapshot
+    assert store.snapshot() is store.snapshot()
+
+
+def test_concurrent_writers_and_readers():
+    store = MemoryStore()
+    errors = []
+
+    def write(offset):
+        try:
+            for i in range(50):
+                feature_id = store.add(square(offset + i))
+                if i % 3 == 0:
+                    store.delete(feature_id)
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            for _ in range(200):
+                snapshot = store.snapshot()
+                assert list(snapshot.ids) == sorted(snapshot.ids)
+                assert len(list(snapshot.features)) == len(snapshot)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i * 100,)) for i in range(4)]
+    threads += [threading.Thread(target=read) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(store) == 4 * 33
+
+
+def test_default_store_file(tmp_path, monkeypatch, capsys):
+    import polygon_mapper
+    monkeypatch.delenv('POLYGON_MAPPER_STORE')
+    monkeypatch.setattr(polygon_mapper, 'get_data_dir', lambda name: str(tmp_path))
+
+    # Desktop mode opens the database left by --serve when there is no log
+    shared = polygon_mapper.create_store(shared=True)
+    shared.add(square())
+    shared.close()
+    store = polygon_mapper.create_store()
+    assert isinstance(store, SqliteStore) and len(store) == 1
+    store.close()
+    assert 'Warning' not in capsys.readouterr().err
+
+    (tmp_path / 'polygons.log').write_text('')
+    store = polygon_mapper.create_store()
+    assert isinstance(store, AppendLogStore)
+    store.close()
+    assert 'polygons.db' in capsys.readouterr().err
+    polygon_mapper.create_store(shared=True).close()
+    assert 'polygons.log' in capsys.readouterr().err
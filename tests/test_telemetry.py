@@ -0,0 +1,50 @@
+from conftest import square
+from telemetry import Registry
+
+
+def test_metrics_with_stored_polygons(client):
+    for i in range(3):
+        assert client.post('/api/polygons', json=square(i * 2)).status_code == 200
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert 'polygon_mapper_store_features 3\n' in text
+    assert 'polygon_mapper_store_vertices 15\n' in text
+    assert 'polygon_mapper_requests_total{endpoint="add_polygon",method="POST",status="200"}' in text
+
+
+def test_metrics_after_buffers_grow(client):
+    # Enough rows to leave unfilled space at the end of the grown buffers
+    features = [square(i % 100, i // 100) for i in range(37)]
+    response = client.post('/api/polygons/batch',
+                           json={'type': 'FeatureCollection', 'features': features})
+    client.delete(f"/api/polygons/{response.get_json()['ids'][0]}")
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'polygon_mapper_store_features 36\n' in text
+    assert 'polygon_mapper_store_vertices 180\n' in text
+
+
+def export_count(client):
+    name = 'polygon_mapper_export_duration_seconds_count{format="geojson",cache="MISS"} '
+    for line in client.get('/metrics').get_data(as_text=True).splitlines():
+        if line.startswith(name):
+            return float(line[len(name):])
+    return 0
+
+
+def test_streamed_export_is_timed(client):
+    before = export_count(client)
+    client.post('/api/polygons', json=square())
+    client.get('/api/export?save=0').get_data()
+    assert export_count(client) == before + 1
+
+
+def test_histogram_rendering():
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', 'Latency', (0.1, 1), ('route',))
+    histogram.observe(0.05, 'a')
+    histogram.observe(5, 'a')
+    text = registry.render()
+    assert 'latency_seconds_bucket{route="a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="a",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{route="a"} 2' in text
@@ -0,0 +1,51 @@
+import json
+
+from conftest import square
+from topojson import encode_topojson
+
+
+def decode_ring(topology, arc_indices):
+    """Rebuild a ring's absolute positions from its arcs"""
+    transform = topology.get('transform')
+    ring = []
+    for index in arc_indices:
+        arc = topology['arcs'][index if index >= 0 else ~index]
+        if transform:
+            x = y = 0
+            points = []
+            for dx, dy in arc:
+                x += dx
+                y += dy
+                points.append([x * transform['scale'][0] + transform['translate'][0],
+                               y * transform['scale'][1] + transform['translate'][1]])
+            arc = points
+        if index < 0:
+            arc = arc[::-1]
+        ring.extend(arc if not ring else arc[1:])
+    return ring
+
+
+def test_shared_edges_become_one_arc():
+    topology = encode_topojson([square(0, name='a'), square(1)], 0)
+    first, second = topology['objects']['polygons']['geometries']
+    assert first['properties'] == {'name': 'a'}
+    shared = set(first['arcs'][0]) & {~i for i in second['arcs'][0]}
+    assert len(shared) == 1
+    assert len(topology['arcs']) == 3
+
+
+def test_rings_are_rebuilt_from_quantized_arcs():
+    topology = encode_topojson([square(0), square(1)], 1000)
+    for geometry, x in zip(topology['objects']['polygons']['geometries'], (0, 1)):
+        ring = decode_ring(topology, geometry['arcs'][0])
+        xs = sorted({round(p[0], 2) for p in ring})
+        ys = sorted({round(p[1], 2) for p in ring})
+        assert xs == [x, x + 1] and ys == [0, 1]
+        assert ring[0] == ring[-1]
+
+
+def test_topojson_export(client):
+    client.post('/api/polygons', json=square())
+    body = json.loads(client.get('/api/export?format=topojson&quantization=0&save=0').get_data())
+    assert body['type'] == 'Topology'
+    assert client.get('/api/export?format=topojson&quantization=-1&save=0').status_code == 400
@@ -0,0 +1,272 @@
+"""
+Polygon Mapper - Vector Tiles
+Clip, quantize and encode stored polygons as Mapbox Vector Tiles
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from geometry import bbox_intersects
+from json_codec import dumps_text
+
+EXTENT = 4096
+BUFFER = 64
+LAYER_NAME = 'polygons'
+MAX_ZOOM = 24
+MAX_LATITUDE = 85.0511287798
+
+# MVT geometry commands
+MOVE_TO = 1
+LINE_TO = 2
+CLOSE_PATH = 7
+POLYGON = 3
+
+
+def tile_bbox(z, x, y, buffer=BUFFER, extent=EXTENT):
+    """Return the lon/lat bounding box of a tile, widened by buffer tile units"""
+    n = 2 ** z
+    pad = buffer / extent
+
+    def lon(tx):
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty):
+        ty = min(max(ty, 0), n)
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return (lon(x - pad), lat(y + 1 + pad), lon(x + 1 + pad), lat(y - pad))
+
+
+def _project(positions, z, x, y, extent):
+    """Project lon/lat positions to tile coordinates"""
+    points = np.asarray([p[:2] for p in positions], dtype=np.float64)
+    n = 2 ** z
+    lat = np.radians(np.clip(points[:, 1], -MAX_LATITUDE, MAX_LATITUDE))
+    world_x = (points[:, 0] + 180.0) / 360.0
+    world_y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2
+    return np.column_stack(((world_x * n - x) * extent, (world_y * n - y) * extent))
+
+
+def _clip_edge(points, axis, limit, keep_below):
+    """One Sutherland-Hodgman pass against an axis-aligned edge"""
+    values = points[:, axis]
+    inside = values <= limit if keep_below else values >= limit
+    if inside.all():
+        return points
+    if not inside.any():
+        return points[:0]
+
+    previous = np.roll(points, 1, axis=0)
+    prev_values = previous[:, axis]
+    crossing = inside != np.roll(inside, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (limit - prev_values) / (values - prev_values)
+        intersections = previous + (points - previous) * t[:, None]
+    intersections[:, axis] = limit
+
+    # Each input vertex contributes [intersection?, vertex?] in order
+    candidates = np.stack((intersections, points), axis=1).reshape(-1, 2)
+    mask = np.stack((crossing, inside), axis=1).reshape(-1)
+    return candidates[mask]
+
+
+def _clip_ring(points, low, high):
+    for axis in (0, 1):
+        points = _clip_edge(points, axis, low, keep_below=False)
+        if len(points):
+            points = _clip_edge(points, axis, high, keep_below=True)
+        if not len(points):
+            break
+    return points
+
+
+def _signed_area(ring):
+    x = ring[:, 0]
+    y = ring[:, 1]
+    return float((x * np.roll(y, -1) - np.roll(x, -1) * y).sum()) / 2
+
+
+def _tile_ring(positions, z, x, y, extent, buffer, exterior):
+    """Return an integer tile-space ring with MVT winding, or None if it vanishes"""
+    if len(positions) > 1 and positions[0] == positions[-1]:
+        positions = positions[:-1]
+    if len(positions) < 3:
+        return None
+
+    points = _clip_ring(_project(positions, z, x, y, extent), -buffer, extent + buffer)
+    if len(points) < 3:
+        return None
+    ring = np.rint(points).astype(np.int64)
+
+    # Quantization collapses nearby vertices; drop the repeats
+    changed = (ring != np.roll(ring, 1, axis=0)).any(axis=1)
+    ring = ring[changed]
+    if len(ring) < 3:
+        return None
+
+    area = _signed_area(ring)
+    if area == 0:
+        return None
+    if (area > 0) != exterior:
+        ring = ring[::-1]
+    return ring
+
+
+def _zigzag(values):
+    return (values << 1) ^ (values >> 63)
+
+
+def _encode_rings(rings):
+    """Encode tile-space rings as an MVT command stream"""
+    commands = []
+    cursor = np.zeros(2, dtype=np.int64)
+    for ring in rings:
+        deltas = np.diff(np.vstack((cursor, ring)), axis=0)
+        params = _zigzag(deltas).reshape(-1).tolist()
+        commands.append(MOVE_TO | (1 << 3))
+        commands.extend(params[:2])
+        commands.append(LINE_TO | ((len(ring) - 1) << 3))
+        commands.extend(params[2:])
+        commands.append(CLOSE_PATH | (1 << 3))
+        cursor = ring[-1]
+    return commands
+
+
+def _polygon_rings(geometry, z, x, y, extent, buffer):
+    kind = geometry.get('type') if geometry else None
+    if kind == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif kind == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        return []
+
+    rings = []
+    for polygon in polygons:
+        if not polygon:
+            continue
+        outer = _tile_ring(polygon[0], z, x, y, extent, buffer, exterior=True)
+        if outer is None:
+            continue
+        rings.append(outer)
+        for hole in polygon[1:]:
+            inner = _tile_ring(hole, z, x, y, extent, buffer, exterior=False)
+            if inner is not None:
+                rings.append(inner)
+    return rings
+
+
+# Protocol buffer wire encoding
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, data):
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b''.join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    """Encode a property as an MVT Value message, or None if it has no value"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+        return _key(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + np.float64(value).tobytes()
+    if not isinstance(value, str):
+        value = dumps_text(value)
+    return _bytes_field(1, value.encode('utf-8'))
+
+
+def encode_tile(items, z, x, y, extent=EXTENT, buffer=BUFFER, layer_name=LAYER_NAME):
+    """Encode (feature_id, feature) pairs into a single-layer vector tile"""
+    keys = {}
+    values = {}
+    features = []
+    for feature_id, feature in items:
+        rings = _polygon_rings(feature.get('geometry'), z, x, y, extent, buffer)
+        if not rings:
+            continue
+
+        tags = []
+        for key, value in (feature.get('properties') or {}).items():
+            encoded = _encode_value(value)
+            if encoded is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(encoded, len(values)))
+
+        message = _key(1, 0) + _varint(feature_id)
+        if tags:
+            message += _packed_field(2, tags)
+        message += _key(3, 0) + _varint(POLYGON)
+        message += _packed_field(4, _encode_rings(rings))
+        features.append(_bytes_field(2, message))
+
+    if not features:
+        return b''
+
+    layer = _key(15, 0) + _varint(2) + _bytes_field(1, layer_name.encode('utf-8'))
+    layer += b''.join(features)
+    layer += b''.join(_bytes_field(3, key.encode('utf-8')) for key in keys)
+    layer += b''.join(_bytes_field(4, value) for value in values)
+    layer += _key(5, 0) + _varint(extent)
+    return _bytes_field(3, layer)
+
+
+class TileCache:
+    """Bounded LRU cache of encoded tiles, invalidated by the area a mutation touched"""
+
+    def __init__(self, max_tiles=1024):
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._tiles.get(key)
+            if entry is None:
+                return None
+            self._tiles.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, bbox, data, generation):
+        """Cache a tile unless the store changed since generation was read"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._tiles[key] = (bbox, data)
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+
+    def invalidate(self, bbox=None):
+        """Drop cached tiles overlapping bbox, or every tile if bbox is None"""
+        with self._lock:
+            self.generation += 1
+            if bbox is None:
+                self._tiles.clear()
+                return
+            stale = [k for k, (b, _) in self._tiles.items() if bbox_intersects(b, bbox)]
+            for key in stale:
+                del self._tiles[key]
@@ -0,0 +1,206 @@
+"""
+Polygon Mapper - TopoJSON Export
+Build a TopoJSON topology: shared boundaries are stored once as arcs,
+with quantized and delta-encoded coordinates
+"""
+
+import numpy as np
+
+DEFAULT_QUANTIZATION = 1000000
+OBJECT_NAME = 'polygons'
+
+
+class _Topology:
+    """Collects the rings, lines and points of a set of geometries
+
+    Geometry objects are built straight away; their arc index lists and
+    point coordinates are filled in by build() once the arcs are known.
+    """
+
+    def __init__(self):
+        self.parts = []     # (positions, closed, arc index list to fill)
+        self.points = []    # (position, coordinate list to fill)
+
+    def _part(self, positions, closed):
+        arcs = []
+        self.parts.append((positions, closed, arcs))
+        return arcs
+
+    def _point(self, position):
+        coordinates = []
+        self.points.append((position, coordinates))
+        return coordinates
+
+    def geometry(self, geometry):
+        """Return the TopoJSON geometry object for a GeoJSON geometry"""
+        if not geometry:
+            return {'type': None}
+        kind = geometry.get('type')
+        coordinates = geometry.get('coordinates')
+        if kind == 'Polygon':
+            return {'type': kind, 'arcs': [self._part(ring, True) for ring in coordinates]}
+        if kind == 'MultiPolygon':
+            return {'type': kind, 'arcs': [[self._part(ring, True) for ring in polygon]
+                                           for polygon in coordinates]}
+        if kind == 'LineString':
+            return {'type': kind, 'arcs': self._part(coordinates, False)}
+        if kind == 'MultiLineString':
+            return {'type': kind, 'arcs': [self._part(line, False) for line in coordinates]}
+        if kind == 'Point':
+            return {'type': kind, 'coordinates': self._point(coordinates)}
+        if kind == 'MultiPoint':
+            return {'type': kind, 'coordinates': [self._point(p) for p in coordinates]}
+        if kind == 'GeometryCollection':
+            return {'type': kind,
+                    'geometries': [self.geometry(g) for g in geometry.get('geometries') or []]}
+        return {'type': None}
+
+    def build(self, quantization):
+        """Cut the collected parts into shared arcs and return (transform, bbox, arcs)"""
+        arrays = [np.asarray([p[:2] for p in positions], dtype=np.float64).reshape(-1, 2)
+                  for positions, _, _ in self.parts]
+        point_array = np.asarray([p[:2] for p, _ in self.points],
+                                 dtype=np.float64).reshape(-1, 2)
+        everything = np.concatenate(arrays + [point_array])
+        if not len(everything):
+            return None, None, []
+        low = everything.min(axis=0)
+        high = everything.max(axis=0)
+        bbox = low.tolist() + high.tolist()
+
+        transform = None
+        if quantization:
+            scale = (high - low) / (quantization - 1)
+            scale[scale == 0] = 1
+            transform = {'scale': scale.tolist(), 'translate': low.tolist()}
+
+            def quantize(values):
+                return np.rint((values - low) / scale).astype(np.int64)
+
+            arrays = [quantize(a) for a in arrays]
+            for (_, coordinates), value in zip(self.points, quantize(point_array).tolist()):
+                coordinates.extend(value)
+        else:
+            for (_, coordinates), value in zip(self.points, point_array.tolist()):
+                coordinates.extend(value)
+
+        # Drop repeated positions (quantization creates many) and closing points
+        cleaned = []
+        for array, (_, closed, _) in zip(arrays, self.parts):
+            if len(array) > 1:
+                keep = np.ones(len(array), dtype=bool)
+                keep[1:] = (array[1:] != array[:-1]).any(axis=1)
+                array = array[keep]
+                if closed and len(array) > 1 and (array[0] == array[-1]).all():
+                    array = array[:-1]
+            cleaned.append(array)
+
+        # Number the distinct positions
+        lengths = [len(a) for a in cleaned]
+        if not sum(lengths):
+            return transform, bbox, []
+        positions, ids = np.unique(np.concatenate(cleaned), axis=0, return_inverse=True)
+        ids = ids.reshape(-1)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+        junctions = self._junctions(ids, starts, lengths, len(positions))
+        arcs = []
+        arc_index = {}
+        for (_, closed, targets), start, length in zip(self.parts, starts, lengths):
+            if not length:
+                continue
+            part = ids[start:start + length]
+            for arc in self._cut(part, closed, junctions):
+                key = arc.tobytes()
+                index = arc_index.get(key)
+                if index is None:
+                    reverse = arc_index.get(arc[::-1].tobytes())
+                    if reverse is not None:
+                        index = ~reverse
+                    else:
+                        index = arc_index[key] = len(arcs)
+                        arcs.append(arc)
+                targets.append(index)
+
+        encoded = []
+        for arc in arcs:
+            points = positions[arc]
+            if quantization:
+                points = np.concatenate((points[:1], np.diff(points, axis=0)))
+            encoded.append(points.tolist())
+        return transform, bbox, encoded
+
+    def _junctions(self, ids, starts, lengths, count):
+        """Flag the positions where parts meet with different neighbours
+
+        A position is a junction when it is the end of a line or when it
+        occurs with more than one pair of neighbours, i.e. where shared
+        boundaries diverge.
+        """
+        lengths = np.asarray(lengths)
+        closed = np.array([c for _, c, _ in self.parts], dtype=bool)
+        first = np.repeat(starts, lengths)
+        last = first + np.repeat(lengths, lengths) - 1
+        index = np.arange(len(ids))
+        previous = ids[np.where(index == first, last, index - 1)]
+        following = ids[np.where(index == last, first, index + 1)]
+        low = np.minimum(previous, following)
+        high = np.maximum(previous, following)
+
+        order = np.lexsort((high, low, ids))
+        sorted_ids, low, high = ids[order], low[order], high[order]
+        differ = (sorted_ids[1:] == sorted_ids[:-1]) & (
+            (low[1:] != low[:-1]) | (high[1:] != high[:-1]))
+        junction = np.zeros(count, dtype=bool)
+        junction[sorted_ids[1:][differ]] = True
+
+        lines = ~closed & (lengths > 0)
+        junction[ids[starts[lines]]] = True
+        junction[ids[starts[lines] + lengths[lines] - 1]] = True
+        return junction
+
+    @staticmethod
+    def _cut(part, closed, junctions):
+        """Split a part's position ids at junctions into arcs"""
+        cuts = np.flatnonzero(junctions[part])
+        if not closed:
+            if len(part) == 1:
+                return [np.concatenate((part, part))]
+            return [part[a:b + 1] for a, b in zip(cuts[:-1], cuts[1:])]
+        if not len(cuts):
+            # A ring sharing nothing: start it at its lowest id so
+            # duplicate rings are recognised
+            start = int(part.argmin())
+            ring = np.roll(part, -start)
+            return [np.concatenate((ring, ring[:1]))]
+        ring = np.roll(part, -int(cuts[0]))
+        ring = np.concatenate((ring, ring[:1]))
+        cuts = np.append(cuts - cuts[0], len(part))
+        return [ring[a:b + 1] for a, b in zip(cuts[:-1], cuts[1:])]
+
+
+def encode_topojson(features, quantization=DEFAULT_QUANTIZATION):
+    """Return a TopoJSON Topology holding the features as one GeometryCollection
+
+    quantization is the number of grid steps across the data's extent in
+    each direction; 0 keeps the original coordinates.
+    """
+    topology = _Topology()
+    geometries = []
+    for feature in features:
+        geometry = topology.geometry(feature.get('geometry'))
+        if feature.get('id') is not None:
+            geometry['id'] = feature['id']
+        if feature.get('properties'):
+            geometry['properties'] = feature['properties']
+        geometries.append(geometry)
+
+    transform, bbox, arcs = topology.build(quantization)
+    result = {'type': 'Topology'}
+    if transform:
+        result['transform'] = transform
+    if bbox:
+        result['bbox'] = bbox
+    result['objects'] = {OBJECT_NAME: {'type': 'GeometryCollection', 'geometries': geometries}}
+    result['arcs'] = arcs
+    return result
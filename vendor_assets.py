@@ -0,0 +1,91 @@
+"""
+Polygon Mapper - Vendor Front-End Assets
+Fetch the pinned Leaflet libraries into static/vendor and write
+precompressed variants, so the page loads without reaching a CDN
+
+Run: python vendor_assets.py              (download from the CDN)
+     python vendor_assets.py --source node_modules
+                                          (copy from an npm install, for air-gapped hosts)
+"""
+
+import argparse
+import os
+import sys
+import urllib.request
+import zlib
+
+from assets import CDN, COMPRESSIBLE, LIBRARIES, VARIANT_SUFFIXES, vendor_dir
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def compress_best(data, encoding):
+    """Compress a static file once at the strongest setting"""
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    raise ValueError(f'unsupported content coding {encoding!r}')
+
+
+def fetch(package, path, source):
+    """Return the bytes of a library file from node_modules or the CDN"""
+    if source:
+        name = package.rsplit('@', 1)[0]
+        with open(os.path.join(source, name, 'dist', path), 'rb') as f:
+            return f.read()
+    with urllib.request.urlopen(f'{CDN}/{package}/dist/{path}', timeout=30) as response:
+        return response.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--source', help='node_modules folder to copy the libraries from')
+    parser.add_argument('--output', default=vendor_dir(), help='folder to write the libraries to')
+    args = parser.parse_args()
+
+    encodings = ['gzip']
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None:
+        encodings.append('zstd')
+
+    total = 0
+    for name, (package, files) in LIBRARIES.items():
+        for path in files:
+            try:
+                data = fetch(package, path, args.source)
+            except OSError as e:
+                sys.exit(f'Error: could not fetch {package}/dist/{path}: {e}')
+            target = os.path.join(args.output, name, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            total += len(data)
+            # Remove stale variants, then precompress text files
+            for suffix in VARIANT_SUFFIXES.values():
+                if os.path.exists(target + suffix):
+                    os.remove(target + suffix)
+            if path.endswith(COMPRESSIBLE):
+                for encoding in encodings:
+                    with open(target + VARIANT_SUFFIXES[encoding], 'wb') as f:
+                        f.write(compress_best(data, encoding))
+        print(f'✓ {package}: {len(files)} files')
+
+    print(f'\n{total / 1024:.0f} KB of assets in {args.output} '
+          f'(precompressed: {", ".join(encodings)})')
+
+
+if __name__ == '__main__':
+    main()